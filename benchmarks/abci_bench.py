@@ -0,0 +1,207 @@
+"""
+Throughput and latency of the ABCI hot paths: check_tx, deliver_tx,
+commit and query.
+
+Runs the app with mock_run() against on-disk state filled with synthetic
+accounts, so no Tendermint node (or network) is needed. Results are
+written as JSON so runs can be compared between versions:
+
+    python benchmarks/abci_bench.py -a 10000 -a 100000 -o bench.json
+
+State is filled with genesis.load_genesis() (sorted, bottom up trie
+build), so even 10M accounts load in one pass without holding them in
+memory. The state files are kept in --workdir and reused by later runs
+with the same number of accounts.
+"""
+import os
+import json
+import time
+import logging
+import platform
+import tempfile
+
+import click
+
+from abci.messages import (
+    to_request_check_tx,
+    to_request_deliver_tx,
+    to_request_commit,
+    to_request_query
+)
+
+from tendermint import TendermintApp, Transaction
+from tendermint.keys import Key
+from tendermint.genesis import load_genesis
+from tendermint.utils import keccak, int_to_big_endian, to_hex
+
+def percentile(ordered, p):
+    """ Nearest-rank percentile of an already sorted list """
+    if not ordered:
+        return 0.0
+    rank = max(int(round(p / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+def summarize(op, num_accounts, latencies, units=1):
+    """ latencies are seconds per call. 'units' is the number of txs each
+    call covers, so commit reports txs/sec for the whole block
+    """
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    return {
+        'op': op,
+        'accounts': num_accounts,
+        'calls': len(ordered),
+        'txs_per_sec': (len(ordered) * units / total) if total else 0.0,
+        'mean_ms': (total / len(ordered) * 1000) if ordered else 0.0,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p90_ms': percentile(ordered, 90) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': (ordered[-1] * 1000) if ordered else 0.0
+    }
+
+def sender_keys(count):
+    return [Key.generate(seed=keccak('bench-sender-{}'.format(i)))
+            for i in range(count)]
+
+def filler_pubkey(i):
+    # Doesn't need to be a real key, no one signs with it
+    return keccak('bench-filler-{}'.format(i))
+
+def write_genesis(path, num_accounts, senders):
+    """ A JSONL genesis file of the senders, then filler accounts """
+    with open(path, 'w') as f:
+        for k in senders:
+            f.write(json.dumps({'pubkey': k.publickey(tohex=True)}) + '\n')
+        for i in range(num_accounts - len(senders)):
+            f.write(json.dumps({'pubkey': to_hex(filler_pubkey(i))}) + '\n')
+
+def create_app(num_accounts, senders, dbfile, async_commit=False):
+    app = TendermintApp("")
+    app.async_commit = async_commit
+    app.log.setLevel(logging.WARNING)
+
+    @app.on_initialize()
+    def create_accounts(db):
+        path = dbfile + '.genesis.jsonl'
+        write_genesis(path, num_accounts, senders)
+        try:
+            load_genesis(db.backend, path, tmpdir=os.path.dirname(dbfile))
+        finally:
+            os.remove(path)
+
+    @app.on_transaction('bench')
+    def bench_tx(tx, db):
+        db.increment_nonce(tx.sender)
+        # Not under the sender's address: that's its account
+        db.put_data(b'bench-' + tx.sender, int_to_big_endian(tx.nonce))
+        return True
+
+    app.mock_run(dbfile)
+    return app
+
+def signed_block(senders, nonces, block_size):
+    """ block_size txs spread over the senders in turn """
+    txs = []
+    for i in range(block_size):
+        k = senders[i % len(senders)]
+        t = Transaction()
+        t.nonce = nonces[k.address()]
+        t.call = 'bench'
+        txs.append(t.sign(k).encode())
+        nonces[k.address()] += 1
+    return txs
+
+def timed(fn, req):
+    start = time.perf_counter()
+    resp = fn(req)
+    elapsed = time.perf_counter() - start
+    if resp.code != 0:
+        raise RuntimeError("{} failed: {}".format(fn.__name__, resp.log))
+    return elapsed
+
+def run_size(num_accounts, num_senders, blocks, block_size, queries, workdir,
+             async_commit=False):
+    num_senders = min(num_senders, num_accounts)
+    senders = sender_keys(num_senders)
+    dbfile = os.path.join(workdir, 'bench-{}.vdb'.format(num_accounts))
+
+    start = time.perf_counter()
+    app = create_app(num_accounts, senders, dbfile, async_commit)
+    setup_secs = time.perf_counter() - start
+
+    # Pick up where the last run on this state left off
+    nonces = {}
+    for k in senders:
+        nonces[k.address()] = app._storage.unconfirmed.get_account(k.address()).nonce
+
+    check, deliver, commit, query = [], [], [], []
+    for _ in range(blocks):
+        txs = signed_block(senders, nonces, block_size)
+        for raw in txs:
+            check.append(timed(app.check_tx, to_request_check_tx(raw)))
+        for raw in txs:
+            deliver.append(timed(app.deliver_tx, to_request_deliver_tx(raw)))
+        commit.append(timed(app.commit, to_request_commit()))
+
+    for i in range(queries):
+        k = senders[i % len(senders)]
+        req = to_request_query(path='/tx_nonce', data=k.address())
+        query.append(timed(app.query, req))
+
+    app._storage.state.close()
+
+    results = [
+        summarize('check_tx', num_accounts, check),
+        summarize('deliver_tx', num_accounts, deliver),
+        summarize('commit', num_accounts, commit, units=block_size),
+        summarize('query', num_accounts, query)
+    ]
+    for r in results:
+        r['setup_secs'] = setup_secs
+    return results
+
+@click.command()
+@click.option('--accounts', '-a', multiple=True, type=int, default=[10000],
+              help='Number of accounts in state. Repeat for several sizes')
+@click.option('--senders', default=100, help='Accounts that sign txs')
+@click.option('--blocks', default=10, help='Blocks to run per state size')
+@click.option('--block-size', default=100, help='Txs per block')
+@click.option('--queries', default=1000, help='Queries per state size')
+@click.option('--workdir', default=None, help='Where to keep the state files')
+@click.option('--output', '-o', default=None, help='JSON results file (default stdout)')
+@click.option('--async-commit', is_flag=True, help='Write state in the background (journal.py)')
+def main(accounts, senders, blocks, block_size, queries, workdir, output, async_commit):
+    """ Benchmark the ABCI hot paths """
+    workdir = workdir or os.path.join(tempfile.gettempdir(), 'pytendermint-bench')
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    for num_accounts in accounts:
+        click.echo("running with {} accounts".format(num_accounts), err=True)
+        results.extend(
+            run_size(num_accounts, senders, blocks, block_size, queries, workdir,
+                     async_commit))
+
+    report = json.dumps({
+        'version': TendermintApp.version,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': int(time.time()),
+        'params': {
+            'senders': senders,
+            'blocks': blocks,
+            'async_commit': async_commit,
+            'block_size': block_size,
+            'queries': queries
+        },
+        'results': results
+    }, indent=2)
+
+    if output:
+        with open(output, 'w') as f:
+            f.write(report)
+    else:
+        click.echo(report)
+
+if __name__ == '__main__':
+    main()
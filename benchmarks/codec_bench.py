@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of the Transaction and Account codecs: pyrlp's generic
+Serializable path against the specialised one in tendermint.codec.
+
+    python benchmarks/codec_bench.py -o codec.json
+"""
+import json
+import time
+import timeit
+import platform
+
+import click
+import rlp
+
+from tendermint.transactions import Transaction, SCHEMA
+from tendermint.keys import Key
+from tendermint.accounts import Account
+
+def per_op_us(fn, number):
+    best = min(timeit.repeat(fn, number=number, repeat=5))
+    return best / number * 1e6
+
+def cases():
+    bob = Key.generate()
+    t = Transaction()
+    t.to = Key.generate().address()
+    t.nonce = 12
+    t.value = 1000
+    t.call = 'transfer'
+    raw_tx = t.sign(bob).encode()
+    acct = Account.create_account(bob.publickey(), nonce=12, balance=10**18)
+    raw_acct = rlp.encode(acct, sedes=Account)
+
+    return [
+        ('tx_encode',
+         lambda: rlp.encode(t, sedes=Transaction),
+         # not t.encode(), that's memoised
+         lambda: t._encode_as(SCHEMA)),
+        ('tx_decode',
+         lambda: rlp.decode(raw_tx, sedes=Transaction),
+         lambda: Transaction.decode(raw_tx)),
+        ('account_encode',
+         lambda: rlp.encode(acct, sedes=Account),
+         lambda: acct.encode()),
+        ('account_decode',
+         lambda: rlp.decode(raw_acct, sedes=Account),
+         lambda: Account.decode(raw_acct)),
+    ]
+
+@click.command()
+@click.option('--number', default=20000, help='Calls per timing run')
+@click.option('--output', '-o', default=None, help='JSON results file (default stdout)')
+def main(number, output):
+    """ Benchmark pyrlp against the specialised codec """
+    results = []
+    for name, generic, fast in cases():
+        generic_us = per_op_us(generic, number)
+        fast_us = per_op_us(fast, number)
+        results.append({
+            'op': name,
+            'pyrlp_us': generic_us,
+            'fast_us': fast_us,
+            'speedup': generic_us / fast_us
+        })
+
+    report = json.dumps({
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': int(time.time()),
+        'results': results
+    }, indent=2)
+
+    if output:
+        with open(output, 'w') as f:
+            f.write(report)
+    else:
+        click.echo(report)
+
+if __name__ == '__main__':
+    main()
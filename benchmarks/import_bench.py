@@ -0,0 +1,70 @@
+"""
+Import time of the package's entry points. Each import runs in a fresh
+interpreter, a few times, and the median is reported along with which
+heavy dependencies it loaded:
+
+    python benchmarks/import_bench.py -o imports.json
+"""
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+
+import click
+
+ENTRY_POINTS = [
+    'tendermint',
+    'tendermint.client',
+    'tendermint.transactions',
+    'tendermint.keys',
+    'tendermint.server',
+]
+
+HEAVY = ['abci', 'google.protobuf', 'gevent', 'colorlog', 'trie', 'rlp', 'nacl', 'requests']
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [m for m in {heavy!r} if m in sys.modules]]))
+"""
+
+def time_import(module, runs):
+    timings = []
+    loaded = []
+    for _ in range(runs):
+        out = subprocess.check_output(
+            [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)])
+        elapsed, loaded = json.loads(out.decode('utf-8'))
+        timings.append(elapsed)
+    return {
+        'module': module,
+        'runs': runs,
+        'median_ms': statistics.median(timings) * 1000,
+        'min_ms': min(timings) * 1000,
+        'loaded': loaded
+    }
+
+@click.command()
+@click.option('--runs', default=5, help='Fresh interpreters per entry point')
+@click.option('--output', '-o', default=None, help='JSON results file (default stdout)')
+def main(runs, output):
+    """ Benchmark import time """
+    report = json.dumps({
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': int(time.time()),
+        'results': [time_import(m, runs) for m in ENTRY_POINTS]
+    }, indent=2)
+
+    if output:
+        with open(output, 'w') as f:
+            f.write(report)
+    else:
+        click.echo(report)
+
+if __name__ == '__main__':
+    main()
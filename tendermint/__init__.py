@@ -1,4 +1,42 @@
 #
+# The server side (TendermintApp) pulls in abci, protobuf, gevent, trie and
+# more. Importing the package, or a client-only module like
+# tendermint.client, shouldn't pay for that, so the top level names are
+# loaded the first time they're used.
+#
+# Explicit entry points:
+#   tendermint.server - TendermintApp
+#   tendermint.client - RpcClient
+#
+import sys
+import importlib
+
+_LAZY = {
+    'TendermintApp': 'tendermint.app',
+    'Transaction': 'tendermint.transactions',
+}
+
+__all__ = sorted(_LAZY)
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+if sys.version_info < (3, 7):
+    # No module level __getattr__ (PEP 562) before 3.7
+    import types
+
+    class _LazyModule(types.ModuleType):
+        def __getattr__(self, name):
+            return __getattr__(name)
+
+        def __dir__(self):
+            return __dir__()
 
-from .app import TendermintApp
-from .transactions import Transaction
+    sys.modules[__name__].__class__ = _LazyModule
@@ -3,6 +3,7 @@ from rlp.sedes import big_endian_int, binary, raw
 
 from .utils import from_hex, is_hex
 from .keys import create_address
+from .codec import Schema
 
 class Account(rlp.Serializable):
     fields = [
@@ -20,8 +21,19 @@ class Account(rlp.Serializable):
             pubkey = from_hex(pubkey)
         return cls(nonce, balance, pubkey)
 
+    def encode(self):
+        """ Same as rlp.encode(acct, sedes=Account), just faster """
+        return SCHEMA.encode((self.nonce, self.balance, self.pubkey))
+
+    @classmethod
+    def decode(cls, bits):
+        """ Same as rlp.decode(bits, sedes=Account), just faster """
+        return SCHEMA.instantiate(cls, SCHEMA.decode(bits))
+
     def address(self):
         return create_address(self.pubkey)
 
     def allow_changes(self):
         self._mutable = True
+
+SCHEMA = Schema(Account.fields)
@@ -0,0 +1,83 @@
+"""
+Admission control for check_tx, so one sender can't flood the mempool.
+
+    app.admission = AdmissionControl(max_pending=16, max_accounts=10000,
+                                     rate=5, burst=20)
+
+A new tx is turned away, before its signature is verified, if:
+
+  * its sender already has 'max_pending' txs waiting to go into a block
+  * its sender isn't in the unconfirmed cache and that already holds
+    'max_accounts' accounts
+  * its sender has used up its token bucket: 'burst' txs at once, refilled
+    at 'rate' txs a second
+
+Rechecks of txs already accepted aren't limited. The sender of a tx isn't
+known to be genuine until the signature is checked, so forged txs count
+against the sender they claim: the limits bound the work done per sender,
+not who gets to use it.
+"""
+import time
+from collections import Counter
+
+TOO_MANY_PENDING = "Too many pending txs from sender"
+MEMPOOL_FULL = "Mempool full"
+RATE_LIMITED = "Sender rate limit exceeded"
+
+class AdmissionControl(object):
+    """ Limits on new txs per sender. Any left as None aren't checked """
+
+    def __init__(self, max_pending=None, max_accounts=None, rate=None, burst=None,
+                 clock=time.monotonic):
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        self.max_pending = max_pending
+        self.max_accounts = max_accounts
+        self.rate = rate
+        self.burst = burst or max(1, rate or 0)
+        self.clock = clock
+        # sender -> (tokens, when last updated)
+        self._buckets = {}
+        # reason -> txs turned away for it
+        self.rejected = Counter()
+
+    def check(self, sender, pending, cache):
+        """ None if a new tx from 'sender' can be checked further, otherwise
+        why not. 'pending' is the number of txs waiting from the sender and
+        'cache' the unconfirmed StateCache
+        """
+        reason = None
+        if self.max_pending is not None and pending >= self.max_pending:
+            reason = TOO_MANY_PENDING
+        elif (self.max_accounts is not None and sender not in cache.account_cache
+              and len(cache.account_cache) >= self.max_accounts):
+            reason = MEMPOOL_FULL
+        elif self.rate is not None and not self._take_token(sender):
+            reason = RATE_LIMITED
+        if reason:
+            self.rejected[reason] += 1
+        return reason
+
+    def _tokens(self, sender, now):
+        tokens, last = self._buckets.get(sender, (self.burst, now))
+        return min(self.burst, tokens + (now - last) * self.rate)
+
+    def _take_token(self, sender):
+        now = self.clock()
+        tokens = self._tokens(sender, now)
+        if tokens < 1:
+            self._buckets[sender] = (tokens, now)
+            return False
+        self._buckets[sender] = (tokens - 1, now)
+        return True
+
+    def prune(self):
+        """ Forget the senders whose buckets have filled up again. Called on
+        commit so the buckets don't grow without bound
+        """
+        if self.rate is None:
+            return
+        now = self.clock()
+        for sender in list(self._buckets):
+            if self._tokens(sender, now) >= self.burst:
+                del self._buckets[sender]
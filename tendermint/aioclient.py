@@ -0,0 +1,288 @@
+"""
+asyncio counterpart of RpcClient, for sending from one process as fast as
+the node will take it.
+
+    async def main():
+        async with AsyncRpcClient(pool_size=50) as rpc:
+            print(await rpc.status())
+            results = await rpc.broadcast_many(raw_txs)
+            failed = [r for r in results if not r.ok]
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+Requests go over a small pool of keep-alive HTTP/1.1 connections, one
+request per connection at a time, so the pool size is also the most
+requests that can be in flight.
+"""
+import json
+import asyncio
+import itertools
+
+from .client import AGENT, _request, _result, _tx_param, _query_params
+
+BROADCAST_MODES = ('async', 'sync', 'commit')
+
+class _Connection(object):
+    """ A keep-alive HTTP/1.1 connection """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def post(self, host, path, body):
+        """ Returns (status, response body, keep alive) """
+        self.writer.write((
+            "POST {} HTTP/1.1\r\n"
+            "Host: {}\r\n"
+            "User-Agent: {}\r\n"
+            "Content-Type: application/json\r\n"
+            "Content-Length: {}\r\n"
+            "\r\n").format(path, host, AGENT, len(body)).encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by {}".format(host))
+        version, status = status_line.decode('latin-1').split(None, 2)[:2]
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            keep_alive = connection == 'keep-alive'
+        else:
+            keep_alive = connection != 'close'
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = await self._read_chunked()
+        elif 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            data = await self.reader.read()
+            keep_alive = False
+        return int(status), data, keep_alive
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # Skip any trailers
+                while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+    def close(self):
+        self.writer.close()
+
+class ConnectionPool(object):
+    """ Up to 'size' keep-alive connections to one HTTP endpoint """
+
+    def __init__(self, host, port, size=10, timeout=3):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._slots = None
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return _Connection(reader, writer)
+
+    async def _post(self, conn, path, body):
+        try:
+            return await asyncio.wait_for(
+                conn.post("{}:{}".format(self.host, self.port), path, body), self.timeout)
+        except asyncio.TimeoutError:
+            # Same as everything else going wrong on the wire: an IOError
+            raise TimeoutError("No response from {}:{} in {}s".format(
+                self.host, self.port, self.timeout))
+
+    async def post(self, path, body):
+        """ POST 'body' (bytes) and return (status, response body) """
+        if self._slots is None:
+            # Made here so it belongs to the running loop
+            self._slots = asyncio.Semaphore(self.size)
+
+        async with self._slots:
+            reused = bool(self._idle)
+            conn = self._idle.pop() if reused else await self._open()
+            try:
+                try:
+                    status, data, keep_alive = await self._post(conn, path, body)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if not reused:
+                        raise
+                    # The server dropped an idle keep-alive connection.
+                    # Try once more on a new one
+                    conn.close()
+                    conn = await self._open()
+                    status, data, keep_alive = await self._post(conn, path, body)
+            except BaseException:
+                conn.close()
+                raise
+
+            if keep_alive:
+                self._idle.append(conn)
+            else:
+                conn.close()
+            return status, data
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+class TxResult(object):
+    """ What happened to one tx sent by broadcast_many(). 'result' is the
+    node's response, or None if the request failed with 'error'
+    """
+
+    def __init__(self, index, tx, result=None, error=None):
+        self.index = index
+        self.tx = tx
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self):
+        """ True if the request went through and the app didn't reject the
+        tx (check_tx, and deliver_tx for 'commit')
+        """
+        if self.error is not None or self.result is None:
+            return False
+        if 'check_tx' in self.result:
+            parts = [self.result.get('check_tx'), self.result.get('deliver_tx')]
+        else:
+            parts = [self.result]
+        return all((part or {}).get('code', 0) == 0 for part in parts)
+
+    def __repr__(self):
+        return "TxResult({}, ok={})".format(self.index, self.ok)
+
+class AsyncRpcClient(object):
+    """ Tendermint RPC client for asyncio. Same methods as RpcClient, as
+    coroutines. Call close() (or use 'async with') when done
+    """
+
+    def __init__(self, host="127.0.0.1", port=46657, pool_size=10, timeout=3):
+        self.pool = ConnectionPool(host, port, pool_size, timeout)
+
+        # Request counter for json-rpc
+        self.request_counter = itertools.count()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+
+    async def call(self, method, params):
+        value = str(next(self.request_counter))
+        encoded = json.dumps(_request(method, params, value)).encode('utf-8')
+        status, data = await self.pool.post('/', encoded)
+        try:
+            response = json.loads(data.decode('utf-8'))
+        except ValueError:
+            raise IOError("HTTP {} from {}: {!r}".format(status, method, data[:200]))
+        return _result(response)
+
+    async def is_connected(self):
+        try:
+            response = await self.status()
+        except IOError:
+            return False
+        return bool(response['node_info'])
+
+    async def status(self):
+        return await self.call('status', [])
+
+    async def info(self):
+        return await self.call('abci_info', [])
+
+    async def genesis(self):
+        return await self.call('genesis', [])
+
+    async def unconfirmed_txs(self):
+        return await self.call('unconfirmed_txs', [])
+
+    async def validators(self):
+        return await self.call('validators', [])
+
+    async def _height(self, height):
+        if height == 'latest' or not height:
+            return (await self.status())['latest_block_height']
+        if height <= 0:
+            raise ValueError("Height must be greater then 0")
+        return height
+
+    async def get_block(self, height='latest'):
+        return await self.call('block', [await self._height(height)])
+
+    async def get_block_range(self, min=0, max=0):
+        """ By default returns 20 blocks """
+        return await self.call('blockchain', [min, max])
+
+    async def get_commit(self, height=1):
+        """ Get commit information for a given height """
+        return await self.call('commit', [await self._height(height)])
+
+    async def query(self, path, data, proof=False):
+        return await self.call('abci_query', _query_params(path, data, proof))
+
+    async def _send_transaction(self, name, tx):
+        return await self.call(name, [_tx_param(tx)])
+
+    async def send_tx_commit(self, tx):
+        return await self._send_transaction('broadcast_tx_commit', tx)
+
+    async def send_tx_sync(self, tx):
+        return await self._send_transaction('broadcast_tx_sync', tx)
+
+    async def send_tx_async(self, tx):
+        return await self._send_transaction('broadcast_tx_async', tx)
+
+    async def broadcast_many(self, txs, window=None, mode='sync', on_result=None):
+        """ Send every tx in 'txs' (any iterable, read as it goes) keeping
+        up to 'window' requests in flight (default: the pool size). 'mode'
+        is 'async', 'sync' or 'commit', as in send_tx_*. A failed request
+        doesn't stop the rest.
+
+        Returns a TxResult per tx, in the order given. 'on_result' is an
+        optional callable(TxResult), called as each one comes back
+        """
+        if mode not in BROADCAST_MODES:
+            raise ValueError("mode must be one of {}".format(BROADCAST_MODES))
+        name = 'broadcast_tx_' + mode
+        window = window or self.pool.size
+
+        results = []
+        pending = enumerate(txs)
+
+        async def sender():
+            # All the senders share one iterator, so each tx is sent once
+            for index, tx in pending:
+                try:
+                    result = TxResult(index, tx, result=await self._send_transaction(name, tx))
+                except asyncio.CancelledError:
+                    raise
+                except (IOError, ValueError) as err:
+                    result = TxResult(index, tx, error=err)
+                results.append(result)
+                if on_result:
+                    on_result(result)
+
+        await asyncio.gather(*[sender() for _ in range(window)])
+        results.sort(key=lambda r: r.index)
+        return results
@@ -14,9 +14,14 @@ from abci import (
 )
 from abci.types_pb2 import OK, InternalError
 
-from .keys import Key
 from .transactions import Transaction
+from .db import VanillaDB
 from .state import State, StateCache, Storage
+from .mempool import Mempool
+from .metering import BudgetExceeded
+from .prefetch import Prefetcher
+from .snapshot import SnapshotStore
+from .recorder import Recorder, replay
 from .utils import str_to_bytes, int_to_big_endian, is_hex, from_hex
 
 def create_logger(app):
@@ -47,7 +52,7 @@ def create_logger(app):
 
     return logger
 
-def setup_app_state(root_dir):
+def setup_app_state(root_dir, async_commit=False):
     if not os.path.exists(root_dir):
         msg = "Cannot find tendermint directory {}".format(root_dir)
         raise FileNotFoundError(msg)
@@ -64,7 +69,7 @@ def setup_app_state(root_dir):
 
     dbname = os.path.join(root_dir, "{}.vdb".format(genesis_chain_id))
 
-    state, is_new  = State.load_state(dbname)
+    state, is_new  = State.load_state(dbname, journal=async_commit)
 
     state.chain_id = str_to_bytes(state.chain_id)
     genesis_chain_id = str_to_bytes(genesis_chain_id)
@@ -96,6 +101,41 @@ class TendermintApp(BaseApplication):
     # Debug loglevel
     debug = True
 
+    # Return from commit as soon as the app hash is known and write state to
+    # disk in the background, through a write-ahead journal. See journal.py
+    async_commit = False
+
+    # Number of keys to size a Bloom filter of the state keys for, so
+    # lookups of keys that don't exist skip the trie. None to go without.
+    # See bloom.py
+    bloom_capacity = None
+    bloom_error_rate = 0.001
+
+    # Approximate memory ceiling, in bytes, for each state cache. Unchanged
+    # entries are dropped to stay under it. None for no limit. See
+    # memory_usage()
+    max_cache_bytes = None
+
+    # Load the state pending txs will need in the background, so
+    # deliver_tx finds it in memory. See prefetch.py
+    prefetch = False
+
+    # How values are stored in the trie, a StateCodecs. Part of the app
+    # hash, so the same on every node from genesis on (the default is RLP
+    # accounts and values as they are). See encoding.py
+    state_codecs = None
+
+    # Compression of the trie nodes in the state db, a Compression. Below
+    # the app hash, so it can differ between nodes and change at any time
+    state_compression = None
+
+    # Directory to write read-only snapshots of state to, every
+    # 'snapshot_interval' blocks. on_query handlers then read the newest
+    # one. None to go without. See snapshot.py
+    snapshot_dir = None
+    snapshot_interval = 100
+    snapshot_keep = 2
+
     def __init__(self, homedir, port=46658):
         # This should match the basedir used by tendermint
         # Directory for storing application state db.
@@ -121,12 +161,36 @@ class TendermintApp(BaseApplication):
         # state. The maps a call string to a given function.
         self._tx_handlers = {}
 
+        # Optional functions giving the state keys a tx will use, by call.
+        # See on_transaction()
+        self._key_hints = {}
+
         # Query handlers to process custom queries
         self._query_handlers = {}
 
         # State and caches
         self._storage = None
 
+        # Txs accepted by check_tx. Lets rechecks after a commit skip
+        # decoding and signature verification
+        self._mempool = Mempool()
+
+        # Optional recorder for incoming ABCI requests. See record()
+        self._recorder = None
+
+        # Optional feed of state changes. See changefeed()
+        self._changefeed = None
+
+        # Optional limits on the txs check_tx accepts from each sender, an
+        # AdmissionControl. See admission.py
+        self.admission = None
+
+        # Optional budgets for tx handlers, a Metering. See metering.py
+        self.metering = None
+
+        # Snapshots queries are answered from. See snapshot_dir
+        self._snapshots = None
+
         # Logger
         self.log = create_logger(self)
 
@@ -154,18 +218,22 @@ class TendermintApp(BaseApplication):
             return f
         return decorator
 
-    def on_transaction(self, tx_call_name):
+    def on_transaction(self, tx_call_name, keys=None):
         """ A decorator for functions that implement core business logic and
         can alter application state.  The provided function MUST accept 2
         params 'tx' and 'db', and return True or False depending on the success
         or failure of the logic.
         The 'tx_call_name' must match the value set in Tx.call
+        'keys' is an optional function of the tx returning the state keys
+        the handler will read, for prefetching. See prefetch.py
         """
         if not tx_call_name:
             raise TypeError("Missing call name for the Tx handler")
         def decorator(f):
             self.__check_for_param(f,2)
             self._tx_handlers[str_to_bytes(tx_call_name)] = f
+            if keys:
+                self._key_hints[str_to_bytes(tx_call_name)] = keys
             return f
         return decorator
 
@@ -179,6 +247,59 @@ class TendermintApp(BaseApplication):
         return decorator
 
 
+    ## RECORD / REPLAY ##
+    def record(self, path):
+        """ Append every incoming ABCI request to the file at 'path' so the
+        run can be replayed later without Tendermint. See replay()
+        """
+        if self._recorder:
+            self._recorder.close()
+        self._recorder = Recorder(path)
+        self.log.info("recording ABCI requests to {}".format(path))
+
+    def replay(self, path, dbfile=None, verify=True):
+        """ Run a recording made with record() against fresh mock state
+        (in-memory unless given a 'dbfile'). Checks the app hash after each
+        block matches the recording. Returns a dict of stats
+        """
+        self.mock_run(dbfile)
+        return replay(self, path, verify=verify)
+
+    def __record(self, req):
+        if self._recorder:
+            self._recorder.record(req)
+
+    ## CHANGEFEED ##
+    def changefeed(self, feed):
+        """ Publish the state changes of every block to 'feed', a
+        changefeed.ChangeFeed
+        """
+        self._changefeed = feed
+        if self._storage:
+            self._storage.state.changefeed = feed
+
+    def __load_storage(self, state):
+        state.changefeed = self._changefeed
+        if self.state_codecs is not None:
+            state.use_codecs(self.state_codecs)
+        if self.state_compression is not None and isinstance(state.db, VanillaDB):
+            state.db.use_compression(self.state_compression)
+        if self.bloom_capacity:
+            state.use_bloom(self.bloom_capacity, self.bloom_error_rate)
+        if self.prefetch:
+            state.prefetcher = Prefetcher(state)
+        if self.snapshot_dir and self._snapshots is None:
+            self._snapshots = SnapshotStore(self.snapshot_dir, self.snapshot_keep)
+        self._storage = Storage(state, self.max_cache_bytes)
+
+    def memory_usage(self):
+        """ Approximate memory used by the state caches, e.g.
+        {'confirmed': {'bytes': ..., 'evictions': ...}, 'unconfirmed': ...}
+        """
+        if not self._storage:
+            return {}
+        return self._storage.memory()
+
     #           * ABCI specific callbacks below. *
     # This is the required ABCI interface for interacting with a
     # Tendermint node
@@ -193,10 +314,11 @@ class TendermintApp(BaseApplication):
         return "not implemented in pytendermint - YAGNI"
 
     def init_chain(self, validators):
+        self.__record(validators)
         self.log.debug("init_chain validators: {}".format(validators))
         # First run create state
-        state, is_new = setup_app_state(self.rootdir)
-        self._storage = Storage(state)
+        state, is_new = setup_app_state(self.rootdir, self.async_commit)
+        self.__load_storage(state)
         if is_new and self._on_init:
             self._on_init(self._storage.confirmed)
             # Commit the data so it's available
@@ -205,8 +327,8 @@ class TendermintApp(BaseApplication):
     def info(self, req):
         # Load state
         if not self._storage:
-            state, _ = setup_app_state(self.rootdir)
-            self._storage = Storage(state)
+            state, _ = setup_app_state(self.rootdir, self.async_commit)
+            self.__load_storage(state)
 
         result = ResponseInfo()
         result.last_block_height = self._storage.state.last_block_height
@@ -216,14 +338,29 @@ class TendermintApp(BaseApplication):
         return result
 
     def check_tx(self, req):
-        # Decode Tx
-        decoded_tx = self.__decode_incoming_tx(req.check_tx.tx)
+        self.__record(req)
+        rawtx = req.check_tx.tx
+
+        # Decode Tx. If Tendermint is rechecking a tx we already accepted
+        # reuse the decoded tx, it's already been verified
+        decoded_tx = self._mempool.recheck(rawtx)
+        is_recheck = decoded_tx is not None
+        if not is_recheck:
+            decoded_tx = self.__decode_incoming_tx(rawtx)
 
         # Get the account for the sender
         # We use unconfirmed cache to allow multiple Tx per block
         if not decoded_tx.sender:
             return Result.error(code=InternalError, log="No Sender - is the Tx signed?")
 
+        # Turn away senders over their limits before doing any real work
+        if self.admission and not is_recheck:
+            sender = decoded_tx.sender
+            reason = self.admission.check(
+                sender, self._mempool.pending_from(sender), self._storage.unconfirmed)
+            if reason:
+                return Result.error(code=InternalError, log=reason)
+
         acct = self._storage.unconfirmed.get_account(decoded_tx.sender)
         if not acct:
             return Result.error(code=InternalError, log="Account not found")
@@ -236,7 +373,7 @@ class TendermintApp(BaseApplication):
         self._storage.unconfirmed.increment_nonce(decoded_tx.sender)
 
         # verify the signature
-        if not Key.verify(acct.pubkey, decoded_tx.signature):
+        if not is_recheck and not decoded_tx.verify(acct.pubkey):
             return Result.error(code=InternalError, log="Invalid Signature")
 
         # Check if this is a value transfer, if so make sure sender has an
@@ -244,19 +381,51 @@ class TendermintApp(BaseApplication):
         if decoded_tx.value > 0 and acct.balance < decoded_tx.value:
             return Result.error(code=InternalError, log="Insufficient balance for transfer")
 
+        self._mempool.add(rawtx, decoded_tx)
+        self.__prefetch(decoded_tx)
         return Result.ok()
 
+    def __prefetch(self, tx):
+        prefetcher = self._storage.state.prefetcher
+        if not prefetcher:
+            return
+        accounts = [tx.sender]
+        if len(tx.to) == 20:
+            accounts.append(tx.to)
+        keys = []
+        declare = self._key_hints.get(tx.call)
+        if declare:
+            try:
+                keys = declare(tx)
+            except Exception as err:
+                # Only a hint. The tx is fine without it
+                self.log.debug("Key hint for {} failed: {}".format(tx.call, err))
+        prefetcher.hint(keys, accounts)
+
     def deliver_tx(self, req):
-        tx = self.__decode_incoming_tx(req.deliver_tx.tx)
+        self.__record(req)
+        rawtx = req.deliver_tx.tx
+        tx = self._mempool.take(rawtx)
+        if tx is None:
+            tx = self.__decode_incoming_tx(rawtx)
         if not tx.call in self._tx_handlers:
             return Result.error(code=InternalError, log="No matching Tx handler")
 
-        if not self._tx_handlers[tx.call](tx, self._storage.confirmed):
+        handler = self._tx_handlers[tx.call]
+        if self.metering:
+            try:
+                ok = self.metering.run(handler, tx, self._storage.confirmed)
+            except BudgetExceeded as err:
+                return Result.error(code=InternalError, log=str(err))
+        else:
+            ok = handler(tx, self._storage.confirmed)
+        if not ok:
             return Result.error(code=InternalError,log="Tx Handler returned false or None")
 
         return Result.ok()
 
     def query(self, req):
+        self.__record(req)
         path = str_to_bytes(req.query.path)
         key = req.query.data
 
@@ -280,31 +449,50 @@ class TendermintApp(BaseApplication):
             acct = self._storage.unconfirmed.get_account(key)
             return ResponseQuery(code=OK, value=format_if_needed(acct.nonce))
 
-        # Try the handler(s)
+        # Try the handler(s). From the newest snapshot if there is one
         if path in self._query_handlers:
-            bits = self._query_handlers[path](key, self._storage.confirmed)
+            db = self._snapshots.latest(self._storage.state) if self._snapshots else None
+            if db is None:
+                db = self._storage.confirmed
+            bits = self._query_handlers[path](key, db)
             return ResponseQuery(code=OK, value=format_if_needed(bits))
 
         errmsg = "No handler found for {}".format(path)
         return ResponseQuery(code=InternalError, value=str_to_bytes(errmsg))
 
     def commit(self, req):
-        apphash = self._storage.commit()
-        return Result.ok(data=h)
+        self.__record(req)
+        self._mempool.commit()
+        if self.admission:
+            self.admission.prune()
+        # Only carry over the accounts that still have txs to recheck.
+        # Everyone else is loaded again when they next send a tx
+        apphash = self._storage.commit(self._mempool.senders())
+        if self._snapshots:
+            state = self._storage.state
+            if state.last_block_height % self.snapshot_interval == 0:
+                self._snapshots.export(state)
+        if self._recorder:
+            self._recorder.record_apphash(apphash)
+        return Result.ok(data=apphash)
 
     def begin_block(self, req):
+        self.__record(req)
         self._storage.state.last_block_height = req.begin_block.header.height
+        if self.metering:
+            self.metering.new_block()
 
     def no_match(self, req):
         return to_response_exception("Unknown ABCI request!")
 
-    def mock_run(self):
-        """ For testing without the server
+    def mock_run(self, dbfile=None):
+        """ For testing without the server. State is in-memory unless
+        given a 'dbfile'. on_initialize only runs if the dbfile is new
         """
         self.log.info("running in test mode")
-        state, _  = State.load_state()
-        self._storage = Storage(state)
-        if self._on_init:
+        state, is_new  = State.load_state(dbfile, journal=self.async_commit and bool(dbfile))
+        self.__load_storage(state)
+        if is_new and self._on_init:
             self._on_init(self._storage.confirmed)
             self._storage.commit()
 
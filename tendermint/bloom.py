@@ -0,0 +1,194 @@
+"""
+Bloom filter over the keys in state, so looking up a key that doesn't exist
+(spam from unknown senders, handlers probing for missing keys) usually
+doesn't walk the trie down to SQLite.
+
+    state.use_bloom(capacity=1000000, error_rate=0.001)
+
+State.get_storage() checks the filter first. If it says no, the key isn't
+in state and b'' is returned straight away. If it says maybe, the trie is
+walked as before, which for a missing key happens 'error_rate' of the time.
+
+Keys are added as they're written to the trie, and, since state never
+deletes keys, the filter only grows. It's saved to a file next to the
+state db on every State.save(): only the pages changed since the last save
+are written, then a header with the state root it matches and a checksum
+of the bits. On open, a filter file that's missing, damaged, sized
+differently or for another root is rebuilt by walking the trie.
+"""
+import os
+import math
+import zlib
+import struct
+
+from trie import Trie
+from trie.utils.nodes import (
+    get_node_type,
+    extract_key,
+    NODE_TYPE_LEAF,
+    NODE_TYPE_EXTENSION,
+    NODE_TYPE_BRANCH,
+)
+from trie.utils.nibbles import nibbles_to_bytes
+
+MAGIC = b'VBF1'
+# magic, number of bits, number of hashes, keys added, crc32 of bits, state root
+HEADER = struct.Struct('>4sQBQI32s')
+# Bytes written back at a time when saving
+PAGE_SIZE = 4096
+
+def optimal_size(capacity, error_rate):
+    """ (number of bits, number of hashes) that hold 'capacity' keys at a
+    false positive rate of 'error_rate'
+    """
+    if capacity < 1:
+        raise ValueError("Bloom filter capacity must be at least 1")
+    if not 0 < error_rate < 1:
+        raise ValueError("Bloom filter error rate must be between 0 and 1")
+    num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+    num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+    return num_bits, num_hashes
+
+def _root_field(root_hash):
+    return root_hash.ljust(32, b'\0')
+
+class BloomFilter(object):
+    """ Bloom filter of 'num_bits' bits and 'num_hashes' hashes. Keys must
+    already be hashes (at least 16 well mixed bytes), like trie keys, so
+    the bit positions are taken from the key itself
+    """
+
+    def __init__(self, num_bits, num_hashes):
+        if num_bits < 8 or num_hashes < 1:
+            raise ValueError("Bloom filter needs at least 8 bits and 1 hash")
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((num_bits + 7) // 8)
+        self.count = 0
+        # Pages changed since the last save
+        self._dirty = set()
+        self._saved_size = None
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.001):
+        return cls(*optimal_size(capacity, error_rate))
+
+    def _positions(self, key):
+        # Double hashing: h1 + i * h2 for each hash
+        h1 = int.from_bytes(key[:8], 'big')
+        h2 = int.from_bytes(key[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for bit in self._positions(key):
+            byte = bit >> 3
+            mask = 1 << (bit & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                self._dirty.add(byte // PAGE_SIZE)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        for bit in self._positions(key):
+            if not bits[bit >> 3] & (1 << (bit & 7)):
+                return False
+        return True
+
+    @property
+    def error_rate(self):
+        """ Expected false positive rate for the keys added so far """
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def save(self, path, root_hash):
+        """ Write the pages changed since the last save, then the header
+        marking the file as matching state 'root_hash'
+        """
+        header = HEADER.pack(MAGIC, self.num_bits, self.num_hashes, self.count,
+                             zlib.crc32(self.bits), _root_field(root_hash))
+        size = HEADER.size + len(self.bits)
+        if self._saved_size != size or not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(header)
+                f.write(self.bits)
+        else:
+            with open(path, 'r+b') as f:
+                for page in sorted(self._dirty):
+                    start = page * PAGE_SIZE
+                    f.seek(HEADER.size + start)
+                    f.write(self.bits[start:start + PAGE_SIZE])
+                f.seek(0)
+                f.write(header)
+        self._dirty.clear()
+        self._saved_size = size
+
+    @classmethod
+    def load(cls, path, root_hash, num_bits, num_hashes):
+        """ The filter saved at 'path', or None if there isn't one that's
+        intact, this size and for state 'root_hash'
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            return None
+        magic, bits, hashes, count, crc, root = HEADER.unpack_from(data)
+        if magic != MAGIC or (bits, hashes) != (num_bits, num_hashes):
+            return None
+        if root != _root_field(root_hash):
+            return None
+        bloom = cls(num_bits, num_hashes)
+        body = data[HEADER.size:]
+        if len(body) != len(bloom.bits) or zlib.crc32(body) != crc:
+            return None
+        bloom.bits[:] = body
+        bloom.count = count
+        bloom._saved_size = len(data)
+        return bloom
+
+def trie_items(db, root_hash):
+    """ Yields (key, value) for everything in the trie at 'root_hash', in
+    key order. Keys must all be the same length (as hashed keys are)
+    """
+    trie = Trie(db, root_hash)
+    stack = [(root_hash, ())]
+    while stack:
+        ref, prefix = stack.pop()
+        node = trie._get_node(ref)
+        kind = get_node_type(node)
+        if kind == NODE_TYPE_LEAF:
+            yield nibbles_to_bytes(prefix + tuple(extract_key(node))), node[1]
+        elif kind == NODE_TYPE_EXTENSION:
+            stack.append((node[1], prefix + tuple(extract_key(node))))
+        elif kind == NODE_TYPE_BRANCH:
+            # Pushed last to first so they come off the stack in order
+            for nibble in reversed(range(16)):
+                if node[nibble]:
+                    stack.append((node[nibble], prefix + (nibble,)))
+
+def trie_keys(db, root_hash):
+    """ Yields every key in the trie at 'root_hash' """
+    for key, _ in trie_items(db, root_hash):
+        yield key
+
+def open_bloom(db, root_hash, path=None, capacity=1000000, error_rate=0.001, num_bits=None):
+    """ Load the filter for state 'root_hash' from 'path', or build it from
+    the trie in 'db'. Size it for 'capacity' keys at 'error_rate', or give
+    the memory to use directly as 'num_bits' (hashes are then picked for
+    'capacity')
+    """
+    if num_bits:
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+    else:
+        num_bits, num_hashes = optimal_size(capacity, error_rate)
+
+    bloom = BloomFilter.load(path, root_hash, num_bits, num_hashes) if path else None
+    if bloom is None:
+        bloom = BloomFilter(num_bits, num_hashes)
+        for key in trie_keys(db, root_hash):
+            bloom.add(key)
+        if path:
+            bloom.save(path, root_hash)
+    return bloom
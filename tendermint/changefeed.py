@@ -0,0 +1,308 @@
+"""
+Per-block feed of state changes, so downstream services can follow state
+without polling queries.
+
+    feed = ChangeFeed('/var/lib/app/feed')
+    app.changefeed(feed)
+    FeedServer(feed, '/var/run/app-feed.sock')    # optional
+
+At each commit the keys and accounts the block changed are written as one
+record: the height, then (kind, key, old value, new value) for each
+change. Accounts are their encoded bytes. A value that didn't exist is
+b''. Records go to append-only segment files in 'directory', a new one
+each 'segment_bytes', named by the first height in them. Followers read
+them with read_changes(directory, start_height), or connect to a
+FeedServer with subscribe(path, start_height) to have them pushed. Either
+way they can start (or resume) at any height still on disk.
+"""
+import os
+import zlib
+import queue
+import socket
+import struct
+import threading
+from collections import namedtuple
+
+DATA = 0
+ACCOUNT = 1
+
+Change = namedtuple('Change', 'kind key old new')
+
+# payload length, crc32 of payload, height
+RECORD_HEADER = struct.Struct('>IIQ')
+# kind, key length, old value length, new value length
+CHANGE_HEADER = struct.Struct('>BIII')
+# what a subscriber sends first: the height to start from
+START = struct.Struct('>Q')
+
+SEGMENT_SUFFIX = '.feed'
+
+def encode_record(height, changes):
+    parts = []
+    for kind, key, old, new in changes:
+        parts.append(CHANGE_HEADER.pack(kind, len(key), len(old), len(new)))
+        parts.append(key)
+        parts.append(old)
+        parts.append(new)
+    payload = b''.join(parts)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload), height) + payload
+
+def decode_changes(payload):
+    changes = []
+    pos = 0
+    while pos < len(payload):
+        kind, klen, olen, nlen = CHANGE_HEADER.unpack_from(payload, pos)
+        pos += CHANGE_HEADER.size
+        key = payload[pos:pos + klen]
+        pos += klen
+        old = payload[pos:pos + olen]
+        pos += olen
+        new = payload[pos:pos + nlen]
+        pos += nlen
+        changes.append(Change(kind, key, old, new))
+    return changes
+
+def _read_record(read):
+    """ (height, changes) using read(n), or None at the end/a torn record """
+    header = read(RECORD_HEADER.size)
+    if len(header) < RECORD_HEADER.size:
+        return None
+    size, crc, height = RECORD_HEADER.unpack(header)
+    payload = read(size)
+    if len(payload) < size or zlib.crc32(payload) != crc:
+        return None
+    return height, decode_changes(payload)
+
+def segments(directory):
+    """ [(first height, path)] of the feed's segment files, oldest first """
+    found = []
+    for name in os.listdir(directory):
+        if name.endswith(SEGMENT_SUFFIX):
+            found.append((int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(directory, name)))
+    return sorted(found)
+
+def read_changes(directory, start_height=0, end=None):
+    """ Yields (height, [Change, ...]) for every block from 'start_height'
+    on, as far as has been written, or up to 'end' (a ChangeFeed.position())
+    """
+    files = segments(directory)
+    # Skip the segments that end before start_height
+    first = 0
+    for i, (height, _) in enumerate(files):
+        if height <= start_height:
+            first = i
+    for height, path in files[first:]:
+        if end and height > end[0]:
+            return
+        with open(path, 'rb') as f:
+            while True:
+                if end and height == end[0] and f.tell() >= end[1]:
+                    return
+                record = _read_record(f.read)
+                if record is None:
+                    break
+                if record[0] >= start_height:
+                    yield record
+
+class ChangeFeed(object):
+    """ Writes change records to segment files in 'directory'. Keeps the
+    newest 'keep_segments' segments, or all of them if None
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, keep_segments=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.keep_segments = keep_segments
+        self.last_height = None
+        self.lock = threading.Lock()
+        self._listeners = []
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self, height):
+        if self._file:
+            self._file.close()
+        path = os.path.join(self.directory, "{:020d}{}".format(height, SEGMENT_SUFFIX))
+        self._file = open(path, 'ab')
+        if self.keep_segments:
+            for _, old in segments(self.directory)[:-self.keep_segments]:
+                os.remove(old)
+
+    def publish(self, height, changes):
+        """ Write the changes made by block 'height' """
+        frame = encode_record(height, changes)
+        with self.lock:
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._open_segment(height)
+            self._file.write(frame)
+            self._file.flush()
+            self.last_height = height
+            for listener in list(self._listeners):
+                listener(height, frame)
+
+    def position(self):
+        """ (segment, offset) of the end of what's been written. Call with
+        self.lock held
+        """
+        if self._file is None:
+            files = segments(self.directory)
+            if not files:
+                return None
+            return files[-1][0], os.path.getsize(files[-1][1])
+        return int(os.path.basename(self._file.name)[:-len(SEGMENT_SUFFIX)]), self._file.tell()
+
+    def listen(self, listener):
+        """ Call listener(height, frame) for every record published from now
+        on. Call with self.lock held to line it up with what's on disk
+        """
+        self._listeners.append(listener)
+
+    def unlisten(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+class _Subscriber(object):
+    def __init__(self, conn, size):
+        self.conn = conn
+        self.frames = queue.Queue(size)
+        self.closed = False
+
+class FeedServer(object):
+    """ Pushes a ChangeFeed's records to subscribers over a Unix socket.
+    Each subscriber has a queue of 'queue_size' records. If one fills up
+    the subscriber is dropped, and can reconnect from the last height it
+    saw. With 'block', the commit first waits up to 'block_timeout'
+    seconds for it to catch up. Records are queued from inside commit, so
+    a subscriber that stops reading must never hold up the node for longer
+    """
+
+    def __init__(self, feed, path, queue_size=1024, block=False, block_timeout=1.0):
+        self.feed = feed
+        self.path = path
+        self.queue_size = queue_size
+        self.block = block
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._subscribers = []
+        # Guards the two above: changed by the accept, commit and
+        # subscriber threads
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            os.remove(path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(path)
+        self._sock.listen(16)
+        self._closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        sub = _Subscriber(conn, self.queue_size)
+        try:
+            start = START.unpack(_recv_exactly(conn, START.size))[0]
+
+            def listener(height, frame):
+                if sub.closed:
+                    return
+                try:
+                    if self.block:
+                        sub.frames.put(frame, timeout=self.block_timeout)
+                    else:
+                        sub.frames.put_nowait(frame)
+                except queue.Full:
+                    with self._lock:
+                        self.dropped += 1
+                    self._drop(sub)
+
+            # Everything before this is on disk, everything after will be queued
+            with self.feed.lock:
+                with self._lock:
+                    self._subscribers.append((sub, listener))
+                self.feed.listen(listener)
+                end = self.feed.position()
+
+            if end is not None:
+                for height, changes in read_changes(self.feed.directory, start, end):
+                    conn.sendall(encode_record(height, changes))
+
+            while not sub.closed:
+                frame = sub.frames.get()
+                if frame is None:
+                    break
+                if RECORD_HEADER.unpack_from(frame)[2] >= start:
+                    conn.sendall(frame)
+        except OSError:
+            pass
+        finally:
+            self._drop(sub)
+
+    def _drop(self, sub):
+        with self._lock:
+            if sub.closed:
+                return
+            sub.closed = True
+            entries = [entry for entry in self._subscribers if entry[0] is sub]
+            for entry in entries:
+                self._subscribers.remove(entry)
+        for _, listener in entries:
+            self.feed.unlisten(listener)
+        # Empty the queue, so a commit blocked on it carries on, then wake
+        # the sender thread if it's waiting
+        while True:
+            try:
+                sub.frames.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            sub.frames.put_nowait(None)
+        except queue.Full:
+            pass
+        sub.conn.close()
+
+    def close(self):
+        self._closed = True
+        self._sock.close()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub, _ in subscribers:
+            self._drop(sub)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def _recv_exactly(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionResetError("Feed connection closed")
+        data += chunk
+    return data
+
+def subscribe(path, start_height=0):
+    """ Yields (height, [Change, ...]) from a FeedServer, starting at
+    'start_height', until the connection closes
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(path)
+    try:
+        conn.sendall(START.pack(start_height))
+        reader = conn.makefile('rb')
+        while True:
+            record = _read_record(reader.read)
+            if record is None:
+                return
+            yield record
+    finally:
+        conn.close()
@@ -1,18 +1,131 @@
 import json
+import sqlite3
 import requests
 import itertools
+import threading
 import base64
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-from .utils import str_to_bytes, obj_to_str, bytes_to_str, is_string, to_hex, is_bytes
+from .utils import str_to_bytes, obj_to_str, bytes_to_str, is_string, to_hex, from_hex, is_bytes, is_integer
 
 AGENT='py-tendermint/0.2'
 
+# Shared with the asyncio client (aioclient.py)
+
+def _request(method, params, request_id):
+    return {
+        "jsonrpc": "2.0",
+        "method": method,
+        "params": params or [],
+        "id": request_id,
+    }
+
+def _result(response):
+    if is_string(response):
+        response = json.loads(bytes_to_str(response))
+
+    if response.get("error"):
+        raise ValueError(response["error"])
+    return response['result']
+
+def _tx_param(tx):
+    if is_bytes(tx):
+        tx = bytes_to_str(base64.b64encode(tx))
+    return tx
+
+def _query_params(path, data, proof):
+    d = to_hex(data)
+    return [path, d[2:], proof]
+
+# Calls whose result never changes once it exists, as long as a height is given
+PINNED_METHODS = ('block', 'commit', 'validators')
+
+def _cache_key(method, params):
+    """ The ResultCache key for a call, or None if its result can change """
+    if method == 'genesis':
+        return method
+    if method in PINNED_METHODS and params and is_integer(params[0]) and params[0] > 0:
+        return "{}/{}".format(method, params[0])
+    return None
+
+def _is_final(method, result):
+    # The commit for the latest block isn't final until the next block
+    if method == 'commit':
+        return result.get('canonical', True)
+    return True
+
+class ResultCache(object):
+    """ Cache for RPC results that can't change: blocks, commits and
+    validators at a given height, and genesis. Keeps the most recently used
+    'max_entries' in memory. With a 'path', every result is also kept in a
+    SQLite file, so the cache survives restarts. Safe to share between
+    threads and clients.
+
+    Results are stored as JSON, so each hit is a fresh copy
+    """
+
+    def __init__(self, max_entries=1024, path=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS results(k TEXT PRIMARY KEY, v TEXT)")
+            self._db.commit()
+
+    def _remember(self, key, text):
+        self._lru[key] = text
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, key):
+        """ The cached result for 'key', or None """
+        with self._lock:
+            text = self._lru.get(key)
+            if text is not None:
+                self._lru.move_to_end(key)
+            elif self._db:
+                row = self._db.execute("SELECT v FROM results WHERE k=?", (key,)).fetchone()
+                if row:
+                    text = row[0]
+                    self._remember(key, text)
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(text)
+
+    def put(self, key, result):
+        text = json.dumps(result)
+        with self._lock:
+            self._remember(key, text)
+            if self._db:
+                self._db.execute("INSERT OR REPLACE INTO results (k,v) VALUES (?,?)", (key, text))
+                self._db.commit()
+
+    def __len__(self):
+        return len(self._lru)
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
+
 class RpcClient(object):
     """Tendermint RPC client: json-rpc requests over HTTP
     """
-    def __init__(self, host="127.0.0.1", port=46657):
+    def __init__(self, host="127.0.0.1", port=46657, cache=None, timeout=3):
         # Tendermint endpoint
         self.uri = "http://{}:{}".format(host, port)
+        self.timeout = timeout
+
+        # Optional ResultCache for results that can't change
+        self.cache = cache
 
         # Keep a session
         self.session = requests.Session()
@@ -26,20 +139,31 @@ class RpcClient(object):
             'Content-Type': 'application/json'
         }
 
+    def _cached(self, method, params):
+        """ Returns (cache key, cached result) """
+        key = _cache_key(method, params) if self.cache is not None else None
+        return key, (self.cache.get(key) if key else None)
+
+    def _keep(self, key, method, result):
+        if key and _is_final(method, result):
+            self.cache.put(key, result)
+        return result
+
     def call(self, method, params):
+        key, result = self._cached(method, params)
+        if result is not None:
+            return result
+        return self._keep(key, method, self._call(method, params))
+
+    def _call(self, method, params):
         value = str(next(self.request_counter))
-        encoded = json.dumps({
-            "jsonrpc": "2.0",
-            "method": method,
-            "params": params or [],
-            "id": value,
-        })
+        encoded = json.dumps(_request(method, params, value))
 
         r = self.session.post(
             self.uri,
             data=encoded,
             headers=self.headers,
-            timeout=3
+            timeout=self.timeout
         )
 
         #try:
@@ -47,15 +171,50 @@ class RpcClient(object):
         #except Exception as er:
         #    print(er)
 
-        response = r.content
+        return _result(r.content)
 
+    def call_batch(self, calls):
+        """ Send a list of (method, params) in one HTTP POST, as a json-rpc
+        batch. Returns their results in the same order. Raises ValueError
+        if any of them failed. Calls already in the cache aren't sent
+        """
+        results = [None] * len(calls)
+        keys = [None] * len(calls)
+        todo = []
+        for i, (method, params) in enumerate(calls):
+            keys[i], results[i] = self._cached(method, params)
+            if results[i] is None:
+                todo.append(i)
+        if todo:
+            fetched = self._call_batch([calls[i] for i in todo])
+            for i, result in zip(todo, fetched):
+                results[i] = self._keep(keys[i], calls[i][0], result)
+        return results
 
-        if is_string(response):
-            response = json.loads(bytes_to_str(response))
+    def _call_batch(self, calls):
+        ids = [str(next(self.request_counter)) for _ in calls]
+        encoded = json.dumps([
+            _request(method, params, value) for value, (method, params) in zip(ids, calls)
+        ])
 
-        if response["error"]:
-            raise ValueError(response["error"])
-        return response['result']
+        r = self.session.post(
+            self.uri,
+            data=encoded,
+            headers=self.headers,
+            timeout=self.timeout
+        )
+
+        response = json.loads(bytes_to_str(r.content))
+        if not isinstance(response, list):
+            # The whole batch was rejected
+            _result(response)
+            raise ValueError("Batch request rejected: {}".format(response))
+        # Responses can come back in any order
+        by_id = dict((item.get('id'), item) for item in response)
+        missing = [value for value in ids if value not in by_id]
+        if missing:
+            raise ValueError("No response for batch request(s) {}".format(missing))
+        return [_result(by_id[value]) for value in ids]
 
     @property
     def is_connected(self):
@@ -80,8 +239,9 @@ class RpcClient(object):
     def unconfirmed_txs(self):
         return self.call('unconfirmed_txs', [])
 
-    def validators(self):
-        return self.call('validators', [])
+    def validators(self, height=None):
+        """ The validator set at 'height', default the latest """
+        return self.call('validators', [height] if height else [])
 
     def get_block(self, height='latest'):
         if height == 'latest' or not height:
@@ -95,6 +255,39 @@ class RpcClient(object):
         """ By default returns 20 blocks """
         return self.call('blockchain', [min, max])
 
+    def iter_blocks(self, start=1, end=None, batch_size=20, prefetch=2):
+        """ Yields the blocks from height 'start' to 'end' (inclusive,
+        default the latest), in order. Blocks are fetched 'batch_size' at a
+        time with call_batch(), with up to 'prefetch' batches requested
+        ahead of the one being yielded
+        """
+        if start <= 0:
+            raise ValueError("Height must be greater then 0")
+        if end is None:
+            end = int(self.status()['latest_block_height'])
+
+        batches = (
+            [('block', [height]) for height in range(low, min(low + batch_size, end + 1))]
+            for low in range(start, end + 1, batch_size)
+        )
+
+        pool = ThreadPoolExecutor(max(prefetch, 1))
+        pending = deque()
+        try:
+            for batch in batches:
+                pending.append(pool.submit(self.call_batch, batch))
+                if len(pending) > prefetch:
+                    for block in pending.popleft().result():
+                        yield block
+            while pending:
+                for block in pending.popleft().result():
+                    yield block
+        finally:
+            # Stopped early: don't wait on batches no one will read
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=False)
+
     def get_commit(self, height=1):
         """ Get commit information for a given height """
         if height == 'latest' or not height:
@@ -105,13 +298,10 @@ class RpcClient(object):
         return self.call('commit', [height])
 
     def query(self, path, data, proof=False):
-        d = to_hex(data)
-        return self.call('abci_query', [path, d[2:], proof])
+        return self.call('abci_query', _query_params(path, data, proof))
 
     def _send_transaction(self, name, tx):
-        if is_bytes(tx):
-            tx = bytes_to_str(base64.b64encode(tx))
-        return self.call(name, [tx])
+        return self.call(name, [_tx_param(tx)])
 
     def send_tx_commit(self, tx):
         return self._send_transaction('broadcast_tx_commit', tx)
@@ -123,7 +313,11 @@ class RpcClient(object):
         return self._send_transaction('broadcast_tx_async', tx)
 
     def get_tx(self, h, proof=False):
-        #txhash = base64.b64encode(str_to_bytes('0x'+h))
-        #return self.call('tx', [txhash,proof])
-        # this is a mess - trying to make this work!
-        pass
+        """ Look up a tx by the hash Tendermint gave it (bytes, or hex
+        with a '0x' prefix). To find txs by app hash, sender, recipient or
+        call, see indexer.TxIndex
+        """
+        if is_string(h) and not is_bytes(h):
+            h = from_hex(h)
+        txhash = bytes_to_str(base64.b64encode(h))
+        return self.call('tx', [txhash, proof])
@@ -0,0 +1,152 @@
+"""
+RLP codec specialised for the flat field lists used by Transaction and
+Account: a list of byte strings and big endian ints, nothing nested.
+
+pyrlp's generic path decodes into nested python lists first, then runs
+each value through its sedes, then builds the object through
+Serializable.__init__ and a checked __setattr__ per field. For these fixed
+schemas all of that can be done in one pass over a memoryview of the
+input. Only the final field values are copied out.
+
+Encoding gives the same bytes as rlp.encode, and decoding accepts exactly
+the inputs rlp.decode accepts, with the equivalent sedes (see
+tests/test_codec.py). Errors are raised as rlp exceptions.
+"""
+from rlp import DecodingError, DeserializationError, SerializationError
+from rlp.sedes import big_endian_int, binary
+
+BYTES = 0
+INT = 1
+
+def _length_prefix(length, offset):
+    if length < 56:
+        return bytes((offset + length,))
+    length_bytes = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes((offset + 55 + len(length_bytes),)) + length_bytes
+
+def _read_prefix(mv, pos, end, bits):
+    """ Returns (is_list, payload start, payload length) for the item at pos """
+    b0 = mv[pos]
+    if b0 < 0x80:
+        return False, pos, 1
+    if b0 < 0xb8:
+        length = b0 - 0x80
+        if length == 1 and (pos + 1 >= end or mv[pos + 1] < 0x80):
+            raise DecodingError('Encoded as short string although single byte was possible', bits)
+        return False, pos + 1, length
+    if b0 < 0xc0:
+        is_list = False
+        ll = b0 - 0xb7
+    elif b0 < 0xf8:
+        return True, pos + 1, b0 - 0xc0
+    else:
+        is_list = True
+        ll = b0 - 0xf7
+
+    start = pos + 1 + ll
+    if start > end:
+        raise DecodingError('RLP string to short', bits)
+    if mv[pos + 1] == 0:
+        raise DecodingError('Length starts with zero bytes', bits)
+    length = int.from_bytes(mv[pos + 1:start], 'big')
+    if length < 56:
+        raise DecodingError('Long prefix used for short item', bits)
+    return is_list, start, length
+
+class Schema(object):
+    """ Fast encode/decode for an rlp.Serializable 'fields' list made up of
+    only big_endian_int and binary fields
+    """
+
+    def __init__(self, fields):
+        self.names = tuple(name for name, _ in fields)
+        kinds = []
+        for name, sedes in fields:
+            if sedes is big_endian_int:
+                kinds.append(INT)
+            elif sedes is binary:
+                kinds.append(BYTES)
+            else:
+                raise TypeError("Field '{}' isn't big_endian_int or binary".format(name))
+        self.kinds = tuple(kinds)
+
+    def encode(self, values):
+        """ Same bytes as rlp.encode(values, sedes=List(field sedes)) """
+        parts = [None]
+        total = 0
+        for kind, value in zip(self.kinds, values):
+            if kind == INT:
+                if not isinstance(value, int):
+                    raise SerializationError('Can only serialize integers', value)
+                if value < 0:
+                    raise SerializationError('Cannot serialize negative integers', value)
+                value = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+            elif isinstance(value, str):
+                value = value.encode('utf-8')
+            elif not isinstance(value, bytes):
+                raise SerializationError('Object is not a serializable ({})'.format(type(value)), value)
+
+            size = len(value)
+            if size == 1 and value[0] < 0x80:
+                parts.append(value)
+                total += 1
+            else:
+                prefix = _length_prefix(size, 0x80)
+                parts.append(prefix)
+                parts.append(value)
+                total += len(prefix) + size
+
+        parts[0] = _length_prefix(total, 0xc0)
+        return b''.join(parts)
+
+    def decode(self, bits):
+        """ Returns the list of field values in 'bits' (bytes, bytearray or
+        memoryview). Rejects anything rlp.decode(bits, sedes=...) would
+        """
+        mv = memoryview(bits)
+        size = len(mv)
+        if size == 0:
+            raise DecodingError('RLP string to short', bits)
+
+        is_list, pos, length = _read_prefix(mv, 0, size, bits)
+        end = pos + length
+        if end != size:
+            raise DecodingError('RLP string ends with {} superfluous bytes'.format(size - end), bits)
+        if not is_list:
+            raise DeserializationError('Can only deserialize sequences', bits)
+
+        values = []
+        for kind in self.kinds:
+            if pos >= end:
+                raise DeserializationError('List has too few elements', bits)
+            is_list, start, length = _read_prefix(mv, pos, end, bits)
+            pos = start + length
+            if pos > end:
+                raise DecodingError('List length prefix announced a too small length', bits)
+            if is_list:
+                # pyrlp's big_endian_int turns an empty list into 0. Accept
+                # the same inputs it does
+                if kind == INT and length == 0:
+                    values.append(0)
+                    continue
+                raise DeserializationError('Objects of type list cannot be deserialized', bits)
+
+            if kind == INT:
+                if length and mv[start] == 0:
+                    raise DeserializationError('Invalid serialization (not minimal length)', bits)
+                values.append(int.from_bytes(mv[start:pos], 'big'))
+            else:
+                values.append(mv[start:pos].tobytes())
+
+        if pos != end:
+            raise DeserializationError('List has too many elements', bits)
+        return values
+
+    def instantiate(self, cls, values):
+        """ Create a 'cls' instance holding 'values' the way rlp.decode
+        would (immutable), without the per field __setattr__ checks
+        """
+        obj = cls.__new__(cls)
+        obj.__dict__.update(zip(self.names, values))
+        obj.__dict__['_mutable'] = False
+        return obj
@@ -6,8 +6,11 @@
 """
 import sqlite3
 import os.path
+from contextlib import contextmanager
 from trie.db.base import BaseDB
 
+from .encoding import BlobCodec, DICTIONARY_KEY, dictionary_id
+
 KVTABLE = "CREATE TABLE blobkey(k BLOB PRIMARY KEY, v BLOB)"
 
 class VanillaDB(BaseDB):
@@ -17,26 +20,43 @@ class VanillaDB(BaseDB):
         self.is_new = not os.path.exists(self.dbfile)
         self.db = None
         self.db = sqlite3.connect(self.dbfile)
+        # While batching, writes are committed every 'batch_size' writes
+        # instead of one at a time. See batch()
+        self.batch_size = 0
+        self._uncommitted = 0
+        # Compression of the trie nodes stored. See use_compression()
+        self.blobs = BlobCodec(self._get_stored)
         if self.is_new:
             cursor = self.db.cursor()
             cursor.execute(KVTABLE)
             self.db.commit()
 
-    def get(self, key):
+    def use_compression(self, compression):
+        """ Store trie nodes written from now on compressed with
+        'compression' (an encoding.Compression, or None for as they are).
+        Doesn't change the app hash. See encoding.py
+        """
+        if compression is not None and compression.dictionary:
+            key = DICTIONARY_KEY + dictionary_id(compression.dictionary)
+            if not self._get_stored(key):
+                self.set(key, compression.dictionary)
+        self.blobs.compression = compression
+
+    def _get_stored(self, key):
         cursor = self.db.cursor()
         cursor.execute("SELECT v FROM blobkey WHERE k=?", (key,))
         row = cursor.fetchone()
         return row[0] if row is not None else None
 
+    def get(self, key):
+        stored = self._get_stored(key)
+        return self.blobs.decode(key, stored) if stored is not None else None
+
     def set(self, key, value):
         cursor = self.db.cursor()
-        if self.exists(key):
-            # Do update
-            cursor.execute("UPDATE blobkey SET v=? WHERE k=?", (value, key))
-        else:
-            # Do insert
-            cursor.execute("INSERT INTO blobkey (k,v) VALUES (?,?)",(key,value))
-        self.db.commit()
+        cursor.execute("INSERT OR REPLACE INTO blobkey (k,v) VALUES (?,?)",
+                       (key, self.blobs.encode(key, value)))
+        self._written()
 
     def exists(self, key):
         if self.get(key):
@@ -46,7 +66,28 @@ class VanillaDB(BaseDB):
     def delete(self, key):
         cursor = self.db.cursor()
         cursor.execute("DELETE FROM blobkey WHERE k = ?", (key,))
-        self.db.commit()
+        self._written()
+
+    def _written(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.batch_size:
+            self.db.commit()
+            self._uncommitted = 0
+
+    @contextmanager
+    def batch(self, size=10000):
+        """ Group writes made inside the 'with' block into sqlite transactions
+        of 'size' writes. Much faster for bulk loads than committing every
+        write. Reads still see the uncommitted writes
+        """
+        previous = self.batch_size
+        self.batch_size = size
+        try:
+            yield self
+        finally:
+            self.batch_size = previous
+            self.db.commit()
+            self._uncommitted = 0
 
     def close(self):
         if self.db:
@@ -0,0 +1,263 @@
+"""
+How state is stored: a compact account layout in the trie, and compressed
+trie nodes in the db.
+
+    app.state_codecs = StateCodecs(account='fixed')
+    app.state_compression = Compression('zstd', 3, dictionary=...)
+
+StateCodecs decide what goes in the trie, so they're part of the app hash.
+They're a plain function of the app's values (no compressor is involved),
+but every node of a chain has to use the same ones, from genesis on. By
+default (no codecs) accounts are stored as RLP and app values as given.
+With codecs, every value starts with a header byte: the format version and
+the codec it was written with, so it can be read back without its key.
+Accounts ('fixed') are the lengths of the nonce and balance in two bytes,
+then the nonce, balance and pubkey as they are: about the size of RLP, but
+decoded with a few slices.
+
+Compression happens below the app hash: a VanillaDB compresses the trie
+nodes it stores (keyed by the hash of the uncompressed node) with zlib or
+zstd (zstd needs the 'zstandard' package), optionally with a preset
+dictionary, e.g. trained with train_dictionary(). A node is only stored
+compressed if that makes it smaller. Compressed nodes say how they were
+compressed, and dictionaries are kept in the db, so any node can read any
+db, and turn compression on, off or change it at any time. Different
+compressor builds giving different bytes doesn't matter: they never reach
+the hash.
+"""
+import json
+import zlib
+import struct
+import binascii
+import threading
+from collections import Counter
+
+from .accounts import Account
+
+FORMAT_VERSION = 1
+
+# Codec ids, in the low 4 bits of the header byte
+RAW = 0
+ACCOUNT = 1
+ZLIB = 2
+ZSTD = 3
+
+# Where the codec settings and dictionaries are kept in the db
+CODECS_KEY = b'vanilla_codecs'
+DICTIONARY_KEY = b'vanilla_codec_dict:'
+
+# Compressed node: header byte, dictionary id
+BLOB_HEADER = struct.Struct('>B4s')
+BLOB_CODECS = ((FORMAT_VERSION << 4) | ZLIB, (FORMAT_VERSION << 4) | ZSTD)
+NO_DICTIONARY = b'\0\0\0\0'
+
+# nonce length, balance length
+ACCOUNT_HEADER = struct.Struct('>BB')
+
+def _header(codec):
+    return bytes(((FORMAT_VERSION << 4) | codec,))
+
+def _to_hex(value):
+    return binascii.hexlify(value).decode('ascii')
+
+def _int_bytes(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, 'big')
+
+def encode_account(acct):
+    """ Fixed layout encoding of an Account, without the header """
+    nonce = _int_bytes(acct.nonce)
+    balance = _int_bytes(acct.balance)
+    return ACCOUNT_HEADER.pack(len(nonce), len(balance)) + nonce + balance + acct.pubkey
+
+def decode_account(data, offset=0):
+    nonce_len, balance_len = ACCOUNT_HEADER.unpack_from(data, offset)
+    pos = offset + ACCOUNT_HEADER.size
+    nonce = int.from_bytes(data[pos:pos + nonce_len], 'big')
+    pos += nonce_len
+    balance = int.from_bytes(data[pos:pos + balance_len], 'big')
+    return Account(nonce, balance, bytes(data[pos + balance_len:]))
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression needs the 'zstandard' package")
+    return zstandard
+
+class Compression(object):
+    """ A compression method and level, with an optional dictionary """
+
+    def __init__(self, method='zlib', level=6, dictionary=None):
+        if method not in ('zlib', 'zstd'):
+            raise ValueError("Unknown compression '{}'".format(method))
+        self.method = method
+        self.level = level
+        self.dictionary = dictionary
+        self.codec = ZLIB if method == 'zlib' else ZSTD
+        self._compressor = None
+        self._decompressor = None
+        # zstd (de)compressors can't be used by two threads at once, and a
+        # JournaledDB writes from its flusher thread
+        self._lock = threading.Lock()
+        if method == 'zstd':
+            zstandard = _zstd()
+            zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            self._compressor = zstandard.ZstdCompressor(
+                level=level, dict_data=zdict, write_checksum=False, write_dict_id=False)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=zdict)
+
+    def compress(self, data):
+        if self.codec == ZSTD:
+            with self._lock:
+                return self._compressor.compress(data)
+        # Raw deflate: no zlib header or checksum, nodes are stored by hash anyway
+        if self.dictionary:
+            c = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=self.dictionary)
+        else:
+            c = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        return c.compress(data) + c.flush()
+
+    def decompress(self, data):
+        if self.codec == ZSTD:
+            with self._lock:
+                return self._decompressor.decompress(data)
+        if self.dictionary:
+            d = zlib.decompressobj(-15, zdict=self.dictionary)
+        else:
+            d = zlib.decompressobj(-15)
+        return d.decompress(data) + d.flush()
+
+class StateCodecs(object):
+    """ How values are stored in the trie. 'account' is 'fixed' or 'rlp' """
+
+    def __init__(self, account='fixed'):
+        if account not in ('fixed', 'rlp'):
+            raise ValueError("Unknown account codec '{}'".format(account))
+        self.account = account
+
+    def encode(self, key, value):
+        """ The stored form of app value 'value' under 'key' """
+        if not value:
+            # Stays b'', which the trie treats as no value
+            return value
+        return _header(RAW) + value
+
+    def encode_account(self, acct):
+        if self.account == 'fixed':
+            return _header(ACCOUNT) + encode_account(acct)
+        return _header(RAW) + acct.encode()
+
+    def _split(self, stored):
+        version, codec = stored[0] >> 4, stored[0] & 0x0f
+        if version != FORMAT_VERSION:
+            raise ValueError("Unknown state value format {}".format(version))
+        return codec
+
+    def decode(self, stored):
+        """ The app value (or RLP account) back from its stored form """
+        if not stored:
+            return stored
+        codec = self._split(stored)
+        if codec == RAW:
+            return stored[1:]
+        if codec == ACCOUNT:
+            return decode_account(stored, 1).encode()
+        raise ValueError("Unknown state value codec {}".format(codec))
+
+    def decode_account(self, stored):
+        if self._split(stored) == ACCOUNT:
+            acct = decode_account(stored, 1)
+        else:
+            acct = Account.decode(self.decode(stored))
+            acct.allow_changes()
+        return acct
+
+    def config(self):
+        return {'version': FORMAT_VERSION, 'account': self.account}
+
+    def save(self, db):
+        db.set(CODECS_KEY, json.dumps(self.config(), sort_keys=True).encode('utf-8'))
+
+    @classmethod
+    def load(cls, db):
+        """ The codecs saved in 'db', or None if it has none """
+        serial = db.get(CODECS_KEY)
+        if not serial:
+            return None
+        config = json.loads(serial.decode('utf-8'))
+        if config['version'] != FORMAT_VERSION:
+            raise ValueError("Unknown state value format {}".format(config['version']))
+        return cls(config['account'])
+
+    def __eq__(self, other):
+        return isinstance(other, StateCodecs) and self.config() == other.config()
+
+    def __ne__(self, other):
+        return not self == other
+
+def dictionary_id(dictionary):
+    """ 4 byte id of a compression dictionary, b'\\0\\0\\0\\0' for none """
+    if not dictionary:
+        return NO_DICTIONARY
+    return struct.pack('>I', zlib.crc32(dictionary) or 1)
+
+class BlobCodec(object):
+    """ Compression of the trie nodes a db stores. Writes with
+    'compression' (a Compression, or None to store nodes as they are).
+    Reads whatever it finds, loading dictionaries with 'load(key)'
+    """
+
+    def __init__(self, load, compression=None):
+        self.load = load
+        self.compression = compression
+        # (codec, dictionary id) -> Compression, for reading
+        self._readers = {}
+
+    @staticmethod
+    def is_node(key):
+        # Trie nodes are stored by their 32 byte hash. Nothing else is
+        return len(key) == 32
+
+    def encode(self, key, value):
+        compression = self.compression
+        if compression is None or not value or not self.is_node(key):
+            return value
+        packed = compression.compress(value)
+        if len(packed) + BLOB_HEADER.size >= len(value):
+            return value
+        return BLOB_HEADER.pack(_header(compression.codec)[0],
+                                dictionary_id(compression.dictionary)) + packed
+
+    def decode(self, key, stored):
+        # Nodes stored as they are are RLP lists, starting 0xc0 or above
+        if not stored or not self.is_node(key) or stored[0] not in BLOB_CODECS:
+            return stored
+        header, dict_id = BLOB_HEADER.unpack_from(stored)
+        reader = self._readers.get((header, dict_id))
+        if reader is None:
+            dictionary = None
+            if dict_id != NO_DICTIONARY:
+                dictionary = self.load(DICTIONARY_KEY + dict_id)
+                if not dictionary:
+                    raise IOError("Compression dictionary {} is missing".format(_to_hex(dict_id)))
+            method = 'zlib' if header & 0x0f == ZLIB else 'zstd'
+            reader = self._readers[(header, dict_id)] = Compression(method, dictionary=dictionary)
+        return reader.decompress(bytes(stored[BLOB_HEADER.size:]))
+
+def train_dictionary(samples, size=16384, method='zlib'):
+    """ A compression dictionary from sample values. For zstd, its own
+    trainer. For zlib, the most common samples, most common last (zlib
+    finds matches near the end of the dictionary cheapest)
+    """
+    samples = [s for s in samples if s]
+    if method == 'zstd':
+        return _zstd().train_dictionary(size, samples).as_bytes()
+    counts = Counter(samples)
+    picked = []
+    total = 0
+    for sample, _ in counts.most_common():
+        if total + len(sample) > size:
+            continue
+        picked.append(sample)
+        total += len(sample)
+    return b''.join(reversed(picked))
@@ -0,0 +1,277 @@
+"""
+Subscribe to Tendermint events over its /websocket endpoint instead of
+polling.
+
+    async def follow():
+        events = EventClient()
+        await events.subscribe("tm.event='NewBlock'")
+        await events.subscribe("tm.event='Tx' AND tx.height>100")
+        async for event in events:
+            print(event.type, event.height)
+
+If the connection drops, the client reconnects (with backoff) and
+subscribes again. Anything that happened while it was away is fetched
+first: missed blocks with 'block' (in batches, delivered as they arrive)
+and missed txs with 'tx_search'. Then live events carry on where they left
+off. Each event is delivered once, in order, per subscription. If the node
+can't answer the backfill (blocks pruned, tx index turned off) it's
+skipped, logged, and the live events carry on.
+"""
+import re
+import json
+import asyncio
+import logging
+import itertools
+from collections import deque
+
+from . import websocket
+
+EVENT_TYPE = re.compile(r"tm\.event\s*=\s*'(\w+)'")
+
+log = logging.getLogger('pytendermint.events')
+
+def _int(value):
+    return int(value) if value not in (None, '') else 0
+
+class Event(object):
+    """ An event for subscription 'query'. 'data' is the event's value,
+    e.g. {'block': ...} for NewBlock or {'TxResult': ...} for Tx
+    """
+
+    def __init__(self, query, type, data, height=0, index=0):
+        self.query = query
+        self.type = type
+        self.data = data
+        self.height = height
+        self.index = index
+
+    @property
+    def position(self):
+        return (self.height, self.index)
+
+    @classmethod
+    def from_result(cls, result):
+        data = result.get('data') or {}
+        value = data.get('value', data)
+        # 'tendermint/event/NewBlock' -> 'NewBlock'
+        type = (data.get('type') or '').rpartition('/')[2]
+        height, index = 0, 0
+        if 'block' in value:
+            height = _int(value['block']['header']['height'])
+        elif 'TxResult' in value:
+            height = _int(value['TxResult'].get('height'))
+            index = _int(value['TxResult'].get('index'))
+        return cls(result.get('query'), type, value, height, index)
+
+    def __repr__(self):
+        return "Event({}, height={}, index={})".format(self.type, self.height, self.index)
+
+class EventClient(object):
+    """ Event subscriptions on one node. Iterate over it ('async for') to
+    get the events for every subscription, or pass a callback to run()
+    """
+
+    def __init__(self, host="127.0.0.1", port=46657, path='/websocket',
+                 reconnect_delay=0.1, max_reconnect_delay=5, backfill=True, timeout=3):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.backfill = backfill
+        self.timeout = timeout
+        self.reconnects = 0
+
+        self.queries = []
+        # query -> position (height, index) of the last event delivered
+        self._positions = {}
+        self._ws = None
+        self._closed = False
+        self._pending = {}
+        self._queue = None
+        self._reader = None
+        self._counter = itertools.count()
+
+    async def subscribe(self, query):
+        """ Add a subscription. Can be called before or while iterating """
+        if query in self.queries:
+            return
+        self.queries.append(query)
+        if self._ws:
+            await self.call('subscribe', [query])
+
+    async def call(self, method, params):
+        """ A json-rpc call over the websocket """
+        if not self._ws:
+            raise ConnectionError("Not connected")
+        value = str(next(self._counter))
+        future = asyncio.get_event_loop().create_future()
+        self._pending[value] = future
+        try:
+            await self._ws.send(json.dumps(
+                {"jsonrpc": "2.0", "method": method, "params": params, "id": value}))
+            response = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("No answer to {} in {}s".format(method, self.timeout))
+        finally:
+            self._pending.pop(value, None)
+        if response.get('error'):
+            raise ValueError(response['error'])
+        return response.get('result')
+
+    async def _read(self, ws, queue):
+        try:
+            while True:
+                message = json.loads(await ws.recv())
+                future = self._pending.get(message.get('id'))
+                if future and not future.done():
+                    future.set_result(message)
+                elif (message.get('result') or {}).get('data'):
+                    queue.put_nowait(Event.from_result(message['result']))
+        except (IOError, asyncio.IncompleteReadError, ValueError) as err:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionResetError(str(err)))
+        finally:
+            # Tells the iterator the connection is gone
+            queue.put_nowait(None)
+
+    async def _connect(self):
+        self._ws = await websocket.connect(self.host, self.port, self.path, self.timeout)
+        self._queue = asyncio.Queue()
+        self._reader = asyncio.ensure_future(self._read(self._ws, self._queue))
+        for query in self.queries:
+            await self.call('subscribe', [query])
+
+    def _disconnect(self):
+        if self._ws:
+            self._ws.close()
+            self._ws = None
+        if self._reader:
+            self._reader.cancel()
+            self._reader = None
+
+    def _deliver(self, event):
+        """ True if 'event' is new for its subscription """
+        if not event.height:
+            # Nothing to tell it apart by
+            return True
+        last = self._positions.get(event.query)
+        if last is not None and event.position <= last:
+            return False
+        self._positions[event.query] = event.position
+        return True
+
+    async def iter_blocks(self, start, end, batch_size=20, prefetch=2):
+        """ Yields the 'block' results from height 'start' to 'end'
+        (inclusive), in order. Blocks are requested 'batch_size' at a time,
+        with up to 'prefetch' batches in flight ahead of the one being
+        yielded
+        """
+        def request(low):
+            heights = range(low, min(low + batch_size, end + 1))
+            return asyncio.ensure_future(
+                asyncio.gather(*[self.call('block', [h]) for h in heights]))
+
+        pending = deque()
+        try:
+            for low in range(start, end + 1, batch_size):
+                pending.append(request(low))
+                if len(pending) > prefetch:
+                    for block in await pending.popleft():
+                        yield block
+            while pending:
+                for block in await pending.popleft():
+                    yield block
+        finally:
+            # Stopped early: don't leave batches no one will read
+            for future in pending:
+                if future.done() and not future.cancelled():
+                    future.exception()
+                else:
+                    future.cancel()
+
+    async def _missed(self):
+        """ Yields the events that happened while disconnected, oldest
+        first. A query the node won't backfill (ValueError) is skipped:
+        what it missed stays missed, the other queries still catch up
+        """
+        try:
+            status = await self.call('status', [])
+        except ValueError as err:
+            log.warning("Skipping event backfill: {}".format(err))
+            return
+        latest = _int((status.get('sync_info') or status).get('latest_block_height'))
+        for query, (height, _) in list(self._positions.items()):
+            match = EVENT_TYPE.search(query)
+            kind = match.group(1) if match else None
+            try:
+                if kind == 'NewBlock':
+                    h = height
+                    async for block in self.iter_blocks(height + 1, latest):
+                        h += 1
+                        yield Event(query, kind, {'block': block['block']}, h)
+                elif kind == 'Tx':
+                    for event in await self._missed_txs(query, height, latest):
+                        yield event
+            except ValueError as err:
+                log.warning("Skipping event backfill of '{}': {}".format(query, err))
+
+    async def _missed_txs(self, query, height, latest, per_page=100):
+        # The tx index doesn't know tm.event. Search on the rest
+        conditions = [c for c in re.split(r'\s+AND\s+', query) if not EVENT_TYPE.search(c)]
+        conditions += ["tx.height>={}".format(height), "tx.height<={}".format(latest)]
+        search = ' AND '.join(conditions)
+
+        events = []
+        for page in itertools.count(1):
+            found = await self.call('tx_search', [search, False, page, per_page])
+            for tx in found.get('txs') or []:
+                result = dict(tx, result=tx.get('tx_result'))
+                events.append(Event(query, 'Tx', {'TxResult': result},
+                                    _int(tx.get('height')), _int(tx.get('index'))))
+            if page * per_page >= _int(found.get('total_count')):
+                break
+        events.sort(key=lambda e: e.position)
+        return events
+
+    def __aiter__(self):
+        return self._events()
+
+    async def _events(self):
+        delay = self.reconnect_delay
+        while not self._closed:
+            try:
+                await self._connect()
+                delay = self.reconnect_delay
+                if self.backfill and self._positions:
+                    async for event in self._missed():
+                        if self._deliver(event):
+                            yield event
+                while True:
+                    event = await self._queue.get()
+                    if event is None:
+                        break
+                    if self._deliver(event):
+                        yield event
+            except (IOError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                self._disconnect()
+
+            if self._closed:
+                return
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def run(self, callback):
+        """ Call callback(event) for each event until close() """
+        async for event in self:
+            callback(event)
+
+    def close(self):
+        self._closed = True
+        if self._queue:
+            self._queue.put_nowait(None)
+        self._disconnect()
@@ -0,0 +1,274 @@
+"""
+Streaming import of large genesis state.
+
+Adding millions of genesis accounts through a StateCache keeps them all in
+memory until commit, then inserts them into the trie one at a time, writing
+every intermediate node. load_genesis() instead reads records from a JSONL
+or CSV file, sorts them by their hashed trie key (on disk, in chunks), and
+builds the trie bottom up from the sorted stream. Each trie node is written
+once, in batches, and memory use doesn't grow with the size of the input.
+
+Records are either accounts:
+
+    {"pubkey": "0x...", "balance": 1000, "nonce": 0}
+
+or raw key/values (hex with a '0x' prefix, or plain text):
+
+    {"key": "name", "value": "0x..."}
+
+CSV files use the same names as column headers.
+"""
+import os
+import csv
+import json
+import heapq
+import struct
+import tempfile
+import itertools
+from contextlib import contextmanager
+
+import rlp
+from trie.constants import BLANK_NODE, BLANK_NODE_HASH
+from trie.utils.nodes import compute_leaf_key, compute_extension_key
+
+from .db import VanillaDB
+from .accounts import Account
+from .state import BLANK_ROOT_HASH
+from .utils import keccak, str_to_bytes, is_hex, from_hex
+
+# trie key (32 bytes), sequence number, value length
+RECORD_HEADER = struct.Struct('>32sQI')
+
+def _to_bytes(value):
+    if is_hex(value):
+        return from_hex(value)
+    return str_to_bytes(value)
+
+def _to_int(value):
+    if value in (None, ''):
+        return 0
+    return int(value)
+
+def parse_record(record, codecs=None):
+    """ Turn a dict from the input file into a (state key, value) pair.
+    The value is as stored with 'codecs' (a StateCodecs), if given
+    """
+    if record.get('pubkey'):
+        acct = Account.create_account(
+            record['pubkey'],
+            nonce=_to_int(record.get('nonce')),
+            balance=_to_int(record.get('balance')))
+        if codecs is not None:
+            return acct.address(), codecs.encode_account(acct)
+        return acct.address(), acct.encode()
+
+    key = _to_bytes(record.get('key') or '')
+    value = _to_bytes(record.get('value') or '')
+    if not key:
+        raise ValueError("Genesis record has no pubkey or key: {}".format(record))
+    if not value:
+        raise ValueError("Genesis record for {} has no value".format(key))
+    if codecs is not None:
+        value = codecs.encode(key, value)
+    return key, value
+
+def read_records(path, fmt=None, codecs=None):
+    """ Yields (state key, value) for each record in a .jsonl or .csv file.
+    'fmt' ('jsonl' or 'csv') overrides the file extension
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, newline='') as f:
+        if fmt in ('jsonl', 'json'):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield parse_record(json.loads(line), codecs)
+        elif fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield parse_record(row, codecs)
+        else:
+            raise ValueError("Unknown genesis format '{}'".format(fmt))
+
+def _write_chunk(chunk, tmpdir):
+    chunk.sort()
+    f = tempfile.TemporaryFile(dir=tmpdir)
+    for key, seq, value in chunk:
+        f.write(RECORD_HEADER.pack(key, seq, len(value)))
+        f.write(value)
+    f.seek(0)
+    return f
+
+def _read_chunk(f):
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if not header:
+            return
+        key, seq, size = RECORD_HEADER.unpack(header)
+        yield key, seq, f.read(size)
+
+def sorted_by_trie_key(records, chunk_size=100000, tmpdir=None, progress=None):
+    """ External sort of (state key, value) records by hashed trie key.
+    Holds at most 'chunk_size' records in memory. If a key shows up more
+    than once, the last value wins. Yields (trie key, value)
+    """
+    chunks = []
+    chunk = []
+    count = 0
+    try:
+        for seq, (key, value) in enumerate(records):
+            chunk.append((keccak(key), seq, value))
+            count += 1
+            if len(chunk) >= chunk_size:
+                chunks.append(_write_chunk(chunk, tmpdir))
+                chunk = []
+                if progress:
+                    progress('sorted', count)
+        if chunk:
+            chunks.append(_write_chunk(chunk, tmpdir))
+        if progress:
+            progress('sorted', count)
+
+        previous = None
+        for item in heapq.merge(*[_read_chunk(f) for f in chunks]):
+            if previous and previous[0] != item[0]:
+                yield previous[0], previous[2]
+            previous = item
+        if previous:
+            yield previous[0], previous[2]
+    finally:
+        for f in chunks:
+            f.close()
+
+def _nibble(key, depth):
+    b = key[depth >> 1]
+    return b & 0x0f if depth & 1 else b >> 4
+
+def _nibbles(key, depth):
+    return tuple(_nibble(key, d) for d in range(depth, len(key) * 2))
+
+class TrieBuilder(object):
+    """ Builds a trie from items sorted by key, bottom up. Nodes are only
+    written once it's known where they end up, so nothing is written that
+    isn't part of the final trie. Produces the same root hash as inserting
+    the items into an empty Trie one by one
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.nodes_written = 0
+
+    def _persist(self, node):
+        # Same rules as Trie._persist_node: small nodes are embedded
+        encoded = rlp.encode(node)
+        if len(encoded) < 32:
+            return node
+        nodehash = keccak(encoded)
+        self.db[nodehash] = encoded
+        self.nodes_written += 1
+        return nodehash
+
+    def _materialize(self, built):
+        kind, path, payload = built
+        if kind == 'leaf':
+            return [compute_leaf_key(path), payload]
+        if kind == 'extension':
+            return [compute_extension_key(path), payload]
+        return payload
+
+    def _build(self, items, depth):
+        """ 'items' all share the first 'depth' nibbles. Returns the subtrie
+        as (kind, path, payload) without writing it, so the caller can still
+        fold it into an extension or leaf
+        """
+        first = next(items)
+        try:
+            second = next(items)
+        except StopIteration:
+            return ('leaf', _nibbles(first[0], depth), first[1])
+
+        items = itertools.chain([first, second], items)
+        children = []
+        for nibble, group in itertools.groupby(items, key=lambda kv: _nibble(kv[0], depth)):
+            children.append((nibble, self._build(group, depth + 1)))
+
+        if len(children) == 1:
+            # Everything shares the next nibble too. Push it onto the child
+            nibble, (kind, path, payload) = children[0]
+            if kind == 'branch':
+                return ('extension', (nibble,), self._persist(payload))
+            return (kind, (nibble,) + path, payload)
+
+        branch = [BLANK_NODE] * 17
+        for nibble, child in children:
+            branch[nibble] = self._persist(self._materialize(child))
+        return ('branch', (), branch)
+
+    def build(self, items):
+        """ Returns the root hash of the trie holding 'items', an iterator
+        of (key, value) sorted by key. Keys must all be the same length
+        """
+        items = iter(items)
+        try:
+            first = next(items)
+        except StopIteration:
+            return BLANK_ROOT_HASH
+
+        size = len(first[0])
+        def checked():
+            yield first
+            for key, value in items:
+                if len(key) != size:
+                    raise ValueError("Keys must all be the same length")
+                yield key, value
+
+        root = self._materialize(self._build(checked(), 0))
+        encoded = rlp.encode(root)
+        root_hash = keccak(encoded)
+        self.db[root_hash] = encoded
+        self.nodes_written += 1
+        return root_hash
+
+@contextmanager
+def _batched(db, size):
+    if isinstance(db, VanillaDB):
+        with db.batch(size):
+            yield
+    else:
+        yield
+
+def load_genesis(state, path, fmt=None, chunk_size=100000, batch_size=10000,
+                 tmpdir=None, progress=None):
+    """ Bulk load accounts and key/values from a .jsonl or .csv file into an
+    empty 'state'. Meant to be called from an on_initialize handler:
+
+        @app.on_initialize()
+        def airdrop(db):
+            load_genesis(db.backend, 'airdrop.jsonl')
+
+    'progress' is an optional callable(stage, count) called as records are
+    sorted ('sorted') and written to the trie ('loaded'). Returns the new
+    state root hash
+    """
+    if state.storage.root_hash not in (BLANK_ROOT_HASH, BLANK_NODE_HASH):
+        raise TypeError("Genesis can only be bulk loaded into empty state")
+
+    counter = itertools.count(1)
+    def counted(items):
+        for item in items:
+            n = next(counter)
+            if progress and n % batch_size == 0:
+                progress('loaded', n)
+            if state.bloom is not None:
+                state.bloom.add(item[0])
+            yield item
+
+    records = read_records(path, fmt, state.codecs)
+    ordered = sorted_by_trie_key(records, chunk_size, tmpdir, progress)
+
+    with _batched(state.db, batch_size):
+        root_hash = TrieBuilder(state.db).build(counted(ordered))
+
+    state.storage.trie.root_hash = root_hash
+    if progress:
+        progress('loaded', next(counter) - 1)
+    return root_hash
@@ -0,0 +1,204 @@
+"""
+Local index of the txs on a chain, so looking one up doesn't mean scanning
+blocks over RPC.
+
+    index = TxIndex('txs.db')
+    Indexer(RpcClient(), index).sync()
+
+    index.get(tx.hash)
+    page = index.history(bob.address())
+    older = index.history(bob.address(), before=page[-1].position)
+
+sync() carries on from the last block indexed, so it can be run again
+(or on a timer) to keep up. Each batch of blocks is written in one SQLite
+transaction together with the height it got to, so an interrupted sync
+resumes where the last batch ended.
+"""
+import base64
+import hashlib
+import sqlite3
+
+from .transactions import Transaction
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS txs ("
+    " hash BLOB PRIMARY KEY, tm_hash BLOB, height INTEGER, idx INTEGER,"
+    " sender BLOB, recipient BLOB, call TEXT, nonce INTEGER, value INTEGER, raw BLOB)",
+    "CREATE INDEX IF NOT EXISTS txs_tm_hash ON txs (tm_hash)",
+    "CREATE INDEX IF NOT EXISTS txs_sender ON txs (sender, height, idx)",
+    "CREATE INDEX IF NOT EXISTS txs_recipient ON txs (recipient, height, idx)",
+    "CREATE INDEX IF NOT EXISTS txs_call ON txs (call, height, idx)",
+    "CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v INTEGER)",
+]
+
+COLUMNS = "hash, tm_hash, height, idx, sender, recipient, call, nonce, value, raw"
+
+def go_wire_bytes(raw):
+    """ 'raw' encoded as a go-wire byte slice: its length as a go-wire
+    varint (one byte giving the size of the length, then the length, big
+    endian), then the bytes
+    """
+    n = len(raw)
+    size = (n.bit_length() + 7) // 8
+    return bytes((size,)) + n.to_bytes(size, 'big') + raw
+
+def tendermint_hash(raw):
+    """ The hash Tendermint uses for a tx (RpcClient.get_tx): RIPEMD160 of
+    the go-wire encoded tx, as types.Tx.Hash() does in the Tendermint
+    versions of this ABCI (0.3.0)
+    """
+    h = hashlib.new('ripemd160')
+    h.update(go_wire_bytes(raw))
+    return h.digest()
+
+class IndexedTx(object):
+    """ A tx as stored in the index. The Transaction is decoded from 'raw'
+    when first asked for
+    """
+
+    def __init__(self, hash, tm_hash, height, index, sender, to, call, nonce, value, raw):
+        self.hash = hash
+        self.tm_hash = tm_hash
+        self.height = height
+        self.index = index
+        self.sender = sender
+        self.to = to
+        self.call = call
+        self.nonce = nonce
+        self.value = value
+        self.raw = raw
+        self._tx = None
+
+    @property
+    def position(self):
+        """ (height, index in block). Pass as 'before' to get the next page """
+        return (self.height, self.index)
+
+    @property
+    def tx(self):
+        if self._tx is None:
+            self._tx = Transaction.decode(self.raw)
+        return self._tx
+
+class TxIndex(object):
+    """ SQLite file of txs by hash, sender, recipient and call """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+
+    @property
+    def last_height(self):
+        """ The last block indexed, 0 for none """
+        row = self.db.execute("SELECT v FROM meta WHERE k='last_height'").fetchone()
+        return row[0] if row else 0
+
+    def add_blocks(self, blocks, tx_hash=tendermint_hash):
+        """ Index [(height, [raw tx, ...]), ...] in one transaction. Txs
+        that aren't Transactions are skipped. Returns the number indexed
+        """
+        rows = []
+        last = None
+        for height, txs in blocks:
+            last = height
+            for index, raw in enumerate(txs):
+                try:
+                    tx = Transaction.decode(raw)
+                except Exception:
+                    continue
+                call = tx.call.decode('utf-8', 'replace')
+                rows.append((tx.hash, tx_hash(raw), height, index, tx.sender, tx.to,
+                             call, tx.nonce, str(tx.value), raw))
+        if last is None:
+            return 0
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO txs ({}) VALUES (?,?,?,?,?,?,?,?,?,?)".format(COLUMNS), rows)
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta (k, v) VALUES ('last_height', ?)", (last,))
+        return len(rows)
+
+    def _make(self, row):
+        row = list(row)
+        # Stored as text, sqlite ints are only 64 bit
+        row[8] = int(row[8])
+        return IndexedTx(*row)
+
+    def get(self, txhash):
+        """ The IndexedTx with this app hash (Transaction.hash) or
+        Tendermint hash, or None
+        """
+        row = self.db.execute(
+            "SELECT {} FROM txs WHERE hash=? OR tm_hash=?".format(COLUMNS),
+            (txhash, txhash)).fetchone()
+        return self._make(row) if row else None
+
+    def _page(self, where, args, limit, before):
+        if before:
+            where += " AND (height < ? OR (height = ? AND idx < ?))"
+            args += (before[0], before[0], before[1])
+        rows = self.db.execute(
+            "SELECT {} FROM txs WHERE {} ORDER BY height DESC, idx DESC LIMIT ?".format(COLUMNS, where),
+            args + (limit,))
+        return [self._make(row) for row in rows]
+
+    def history(self, address, limit=50, before=None):
+        """ Txs sent from or to 'address', newest first. 'before' is the
+        position of the last tx on the previous page
+        """
+        # Two indexed lookups are much cheaper than one OR over both columns
+        sent = self._page("sender = ?", (address,), limit, before)
+        received = self._page("recipient = ? AND sender != ?", (address, address), limit, before)
+        merged = sorted(sent + received, key=lambda t: t.position, reverse=True)
+        return merged[:limit]
+
+    def by_call(self, call, limit=50, before=None):
+        """ Txs calling 'call', newest first """
+        return self._page("call = ?", (call,), limit, before)
+
+    def close(self):
+        self.db.close()
+
+def block_txs(block):
+    """ (height, [raw tx, ...]) from a 'block' RPC result """
+    header = block['block']['header']
+    txs = (block['block'].get('data') or {}).get('txs') or []
+    return int(header['height']), [base64.b64decode(tx) for tx in txs]
+
+class Indexer(object):
+    """ Feeds blocks from 'rpc' (an RpcClient) into a TxIndex """
+
+    def __init__(self, rpc, index, batch_blocks=100, tx_hash=tendermint_hash):
+        self.rpc = rpc
+        self.index = index
+        self.batch_blocks = batch_blocks
+        self.tx_hash = tx_hash
+
+    def sync(self, end=None, progress=None):
+        """ Index every block after the last one indexed up to 'end'
+        (default the latest). 'progress' is an optional callable(height,
+        txs indexed so far). Returns the number of txs indexed
+        """
+        start = self.index.last_height + 1
+        if end is None:
+            end = int(self.rpc.status()['latest_block_height'])
+        if end < start:
+            return 0
+
+        count = 0
+        batch = []
+        for block in self.rpc.iter_blocks(start, end, batch_size=self.batch_blocks):
+            batch.append(block_txs(block))
+            if len(batch) >= self.batch_blocks:
+                count += self.index.add_blocks(batch, self.tx_hash)
+                if progress:
+                    progress(batch[-1][0], count)
+                batch = []
+        if batch:
+            count += self.index.add_blocks(batch, self.tx_hash)
+            if progress:
+                progress(batch[-1][0], count)
+        return count
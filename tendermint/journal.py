@@ -0,0 +1,300 @@
+"""
+Write-ahead block journal, so commit doesn't wait on the disk.
+
+With a JournaledDB, the trie nodes and metadata written during a block are
+kept in memory and, when the block is saved, appended to a journal file as
+one record. commit returns right away. A background thread fsyncs the
+journal (once for however many blocks are waiting) and then writes those
+blocks into SQLite in a single transaction. Once SQLite has caught up the
+journal is emptied. If it's still behind, the flushed records are cut off
+the front of the journal (by rewriting the rest to a new file) once they
+outweigh the rest, so a journal that never quite catches up doesn't grow
+without end.
+
+Each record holds everything one block wrote, including the chain
+metadata, and is checksummed. On open, complete records are replayed into
+SQLite and a torn last record (the process died mid write) is cut off. So
+the height info() reports always matches the state on disk. Blocks lost
+from the end of the journal are replayed by Tendermint.
+"""
+import os
+import queue
+import struct
+import zlib
+import threading
+from contextlib import contextmanager
+
+from .db import VanillaDB
+
+# payload length, crc32 of height + payload, height
+RECORD_HEADER = struct.Struct('>IIQ')
+# key length, value length (-1 for a delete)
+ENTRY_HEADER = struct.Struct('>Ii')
+
+def encode_record(height, writes):
+    parts = []
+    for key, value in writes:
+        if value is None:
+            parts.append(ENTRY_HEADER.pack(len(key), -1) + key)
+        else:
+            parts.append(ENTRY_HEADER.pack(len(key), len(value)) + key + value)
+    payload = b''.join(parts)
+    crc = zlib.crc32(payload, zlib.crc32(struct.pack('>Q', height)))
+    return RECORD_HEADER.pack(len(payload), crc, height) + payload
+
+def decode_entries(payload):
+    pos = 0
+    entries = []
+    while pos < len(payload):
+        klen, vlen = ENTRY_HEADER.unpack_from(payload, pos)
+        pos += ENTRY_HEADER.size
+        key = payload[pos:pos + klen]
+        pos += klen
+        if vlen < 0:
+            value = None
+        else:
+            value = payload[pos:pos + vlen]
+            pos += vlen
+        entries.append((key, value))
+    return entries
+
+class BlockJournal(object):
+    """ Append only file of (height, [(key, value), ...]) records.
+    Positions are counted from the first record ever appended, so they stay
+    valid when records are dropped from the front
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        # Position of the first byte in the file
+        self.start = 0
+
+    @property
+    def end(self):
+        return self.start + self.file.tell()
+
+    def append(self, height, writes):
+        """ Returns the position after the record """
+        self.file.write(encode_record(height, writes))
+        return self.end
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def reset(self):
+        self.start = self.end
+        self.file.truncate(0)
+        self.file.seek(0)
+
+    def discard(self, upto):
+        """ Drop the records before position 'upto' (one append() returned).
+        The rest is written to a new file, which then replaces the journal
+        """
+        self.file.flush()
+        with open(self.path, 'rb') as f:
+            f.seek(upto - self.start)
+            rest = f.read()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(rest)
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(tmp, self.path)
+        self.file = open(self.path, 'ab')
+        self.start = upto
+
+    def close(self):
+        self.file.close()
+
+    @staticmethod
+    def read(path):
+        """ Returns ([(height, writes), ...], length of the valid part) """
+        records = []
+        valid = 0
+        if not os.path.exists(path):
+            return records, valid
+        with open(path, 'rb') as f:
+            data = f.read()
+        while valid + RECORD_HEADER.size <= len(data):
+            size, crc, height = RECORD_HEADER.unpack_from(data, valid)
+            start = valid + RECORD_HEADER.size
+            payload = data[start:start + size]
+            if len(payload) < size or zlib.crc32(payload, zlib.crc32(struct.pack('>Q', height))) != crc:
+                break
+            records.append((height, decode_entries(payload)))
+            valid = start + size
+        return records, valid
+
+class JournaledDB(VanillaDB):
+    """ VanillaDB that defers writes to a background thread through a
+    BlockJournal. Writes are only visible to SQLite (and other processes)
+    once flushed, but reads through this object always see them.
+
+    Up to 'max_pending' saved blocks can be waiting to be flushed. After
+    that, commit_block() waits for the flusher
+    """
+
+    def __init__(self, dbname, journal=None, max_pending=64):
+        super().__init__(dbname)
+        self.journal_path = journal or dbname + '.blocks'
+        self.replayed = self._recover()
+
+        self.journal = BlockJournal(self.journal_path)
+        # Blocks journaled and flushed so far. The same height can be saved
+        # more than once (e.g. genesis), so they're counted
+        self.journaled = 0
+        self.flushed = 0
+        self.flushed_height = None
+
+        # Writes for the block being built
+        self._pending = {}
+        # Writing straight to SQLite. See batch()
+        self._direct = False
+        # key -> (block count, value) for writes journaled but not yet in SQLite
+        self._unflushed = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(max_pending)
+        self._error = None
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def _apply(self, db, writes):
+        cursor = db.cursor()
+        for key, value in writes:
+            if value is None:
+                cursor.execute("DELETE FROM blobkey WHERE k = ?", (key,))
+            else:
+                cursor.execute("INSERT OR REPLACE INTO blobkey (k,v) VALUES (?,?)",
+                               (key, self.blobs.encode(key, value)))
+
+    def _recover(self):
+        """ Replay what the last run journaled but didn't flush """
+        records, valid = BlockJournal.read(self.journal_path)
+        for _, writes in records:
+            self._apply(self.db, writes)
+        self.db.commit()
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                # Nothing in it is needed now
+                f.truncate(0)
+        return len(records)
+
+    def get(self, key):
+        if key in self._pending:
+            return self._pending[key]
+        entry = self._unflushed.get(key)
+        if entry is not None:
+            return entry[1]
+        return super().get(key)
+
+    def set(self, key, value):
+        if self._direct:
+            return super().set(key, value)
+        self._pending[key] = value
+
+    def delete(self, key):
+        if self._direct:
+            return super().delete(key)
+        self._pending[key] = None
+
+    def commit_block(self, height):
+        """ Journal everything written since the last call as block 'height'
+        and queue it for flushing
+        """
+        if self._error:
+            raise self._error
+        writes, self._pending = self._pending, {}
+        with self._lock:
+            end = self.journal.append(height, writes.items())
+            self.journaled += 1
+            for key, value in writes.items():
+                self._unflushed[key] = (self.journaled, value)
+            block = (self.journaled, height, writes, end)
+        self._queue.put(block)
+
+    def _flush_loop(self):
+        # Its own connection: sqlite connections can't be shared between threads
+        db = VanillaDB(self.dbfile)
+        try:
+            while True:
+                blocks = [self._queue.get()]
+                while not self._queue.empty():
+                    blocks.append(self._queue.get())
+
+                done = [b for b in blocks if b is not None]
+                try:
+                    if done:
+                        self._flush(db, done)
+                finally:
+                    for _ in blocks:
+                        self._queue.task_done()
+                if len(done) < len(blocks):
+                    return
+        except Exception as err:
+            self._error = err
+            # Unblock anyone waiting
+            while True:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                except queue.Empty:
+                    break
+        finally:
+            db.close()
+
+    def _flush(self, db, blocks):
+        with self._lock:
+            self.journal.file.flush()
+        # One fsync covers every block waiting
+        os.fsync(self.journal.file.fileno())
+
+        for _, _, writes, _ in blocks:
+            self._apply(db.db, writes.items())
+        db.db.commit()
+
+        with self._lock:
+            for number, _, writes, _ in blocks:
+                for key in writes:
+                    entry = self._unflushed.get(key)
+                    # Unless a later block wrote it again
+                    if entry is not None and entry[0] == number:
+                        del self._unflushed[key]
+            self.flushed, self.flushed_height, _, end = blocks[-1]
+            if self.flushed == self.journaled:
+                self.journal.reset()
+            elif end - self.journal.start > self.journal.end - end:
+                # Still behind: only what's flushed goes
+                self.journal.discard(end)
+
+    def wait(self):
+        """ Block until everything saved so far is in SQLite """
+        self._queue.join()
+        if self._error:
+            raise self._error
+
+    @contextmanager
+    def batch(self, size=10000):
+        """ Bulk loads (e.g. genesis) go straight to SQLite, batched, instead
+        of through the journal
+        """
+        self.wait()
+        pending, self._pending = self._pending, {}
+        self._direct = True
+        try:
+            with super().batch(size):
+                for key, value in pending.items():
+                    self.set(key, value) if value is not None else self.delete(key)
+                yield self
+        finally:
+            self._direct = False
+
+    def close(self):
+        if self._flusher:
+            self._queue.put(None)
+            self._flusher.join()
+            self._flusher = None
+            self.journal.close()
+        super().close()
@@ -1,4 +1,5 @@
 import hashlib, json
+import ctypes
 
 import nacl.bindings
 from nacl import encoding
@@ -6,6 +7,29 @@ from nacl.utils import random
 
 from .utils import to_hex, from_hex, is_hex, str_to_bytes
 
+SIGNATURE_SIZE = nacl.bindings.crypto_sign_BYTES
+
+def _load_sodium(name, argtypes):
+    """ PyNaCl doesn't bind the detached signature functions, but the
+    libsodium it ships with exports them. Returns None if 'name' can't be
+    found, and the callers fall back to crypto_sign/crypto_sign_open
+    """
+    try:
+        import nacl._sodium
+        fn = getattr(ctypes.CDLL(nacl._sodium.__file__), name)
+    except (ImportError, OSError, AttributeError):
+        return None
+    fn.argtypes = argtypes
+    fn.restype = ctypes.c_int
+    return fn
+
+# (sig, m, mlen, pk)
+_verify_detached = _load_sodium('crypto_sign_verify_detached', [
+    ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulonglong, ctypes.c_char_p])
+# (sig out, siglen out or NULL, m, mlen, sk)
+_sign_detached = _load_sodium('crypto_sign_detached', [
+    ctypes.c_char_p, ctypes.c_void_p, ctypes.c_char_p, ctypes.c_ulonglong, ctypes.c_char_p])
+
 def create_address(pubkey):
     if is_hex(pubkey):
         pubkey = from_hex(pubkey)
@@ -62,11 +86,39 @@ class Key(object):
             # Bad or forged signature
             return False
 
+    @classmethod
+    def verify_detached(cls, pubkey, signature, message):
+        """ Verify a signature made with sign_detached() over 'message'.
+        Returns True or False
+        """
+        if is_hex(pubkey):
+            pubkey = from_hex(pubkey)
+        message = str_to_bytes(message)
+        if len(signature) != SIGNATURE_SIZE or len(pubkey) != nacl.bindings.crypto_sign_PUBLICKEYBYTES:
+            return False
+
+        if _verify_detached:
+            return _verify_detached(signature, message, len(message), pubkey) == 0
+        try:
+            return nacl.bindings.crypto_sign_open(signature + message, pubkey) == message
+        except:
+            # Bad or forged signature
+            return False
+
     def sign(self, msg):
         message = str_to_bytes(msg)
         raw_signed = nacl.bindings.crypto_sign(message, self._privkey)
         return encoding.RawEncoder.encode(raw_signed)
 
+    def sign_detached(self, msg):
+        """ Just the 64 byte signature, without the message appended """
+        message = str_to_bytes(msg)
+        if _sign_detached:
+            signature = ctypes.create_string_buffer(SIGNATURE_SIZE)
+            if _sign_detached(signature, None, message, len(message), self._privkey) == 0:
+                return signature.raw
+        return nacl.bindings.crypto_sign(message, self._privkey)[:SIGNATURE_SIZE]
+
     def address(self, tohex=False):
         if tohex:
             return to_hex(self._address)
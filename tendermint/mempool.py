@@ -0,0 +1,87 @@
+"""
+Bookkeeping for the txs check_tx has accepted into Tendermint's mempool.
+
+After every commit Tendermint runs check_tx again on every tx still waiting
+in the mempool. A tx's bytes don't change between the first check and a
+recheck, so neither does the decoded tx or the result of verifying its
+signature. The Mempool keeps both so a recheck only has to replay the
+nonce and balance checks against the new state.
+
+It also counts the txs waiting from each sender, for admission control.
+See admission.py
+"""
+from collections import Counter
+
+def _sender(tx):
+    return getattr(tx, 'sender', None)
+
+class Mempool(object):
+
+    def __init__(self):
+        # raw tx -> decoded Transaction accepted since the last commit
+        self._pending = {}
+        # raw tx -> decoded Transaction carried over from the last block and
+        # waiting to be rechecked
+        self._recheck = {}
+        # sender -> number of txs in either of the above
+        self._senders = Counter()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, rawtx):
+        return rawtx in self._pending
+
+    def _count(self, tx, n):
+        sender = _sender(tx)
+        self._senders[sender] += n
+        if self._senders[sender] <= 0:
+            del self._senders[sender]
+
+    def pending_from(self, sender):
+        """ Number of txs from 'sender' accepted and not yet in a block """
+        return self._senders.get(sender, 0)
+
+    def senders(self):
+        """ Senders with txs waiting """
+        return set(self._senders)
+
+    def is_recheck(self, rawtx):
+        """ True if rawtx was accepted before the last commit and this is
+        Tendermint checking it again
+        """
+        return rawtx in self._recheck
+
+    def recheck(self, rawtx):
+        """ Returns the decoded (and already verified) tx carried over for
+        rawtx, or None if this is the first time we've seen it
+        """
+        tx = self._recheck.pop(rawtx, None)
+        if tx is not None:
+            self._count(tx, -1)
+        return tx
+
+    def add(self, rawtx, tx):
+        """ Remember a tx that passed check_tx """
+        if rawtx not in self._pending:
+            self._count(tx, 1)
+        self._pending[rawtx] = tx
+
+    def take(self, rawtx):
+        """ Remove a tx that made it into a block. Returns the decoded tx if
+        we had it so deliver_tx doesn't have to decode it again
+        """
+        tx = self._pending.pop(rawtx, None)
+        if tx is not None:
+            self._count(tx, -1)
+        return tx
+
+    def commit(self):
+        """ Called on commit. Everything still pending will be rechecked by
+        Tendermint, anything left over from the last recheck was dropped
+        from the mempool
+        """
+        for tx in self._recheck.values():
+            self._count(tx, -1)
+        self._recheck = self._pending
+        self._pending = {}
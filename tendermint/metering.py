@@ -0,0 +1,192 @@
+"""
+Metering and budgets for on_transaction handlers, so one slow or runaway
+handler can't stall a block.
+
+    app.metering = Metering(tx_budget=Budget(reads=100, writes=20),
+                            block_budget=Budget(writes=5000, write_bytes=2**20))
+
+With metering on, deliver_tx hands each handler a MeteredCache over the
+block's cache. Every state read and write through it is counted, with
+its size in bytes (key + value for a write, the value for a read). The
+counts don't depend on caching or timing, so every node meters a tx the
+same way and agrees on whether it went over.
+
+A tx fails (BudgetExceeded) as soon as it goes over its own budget, or
+over what's left of the block's. Its writes are thrown away, even if the
+handler catches the exception: once over, the tx has failed. The work it
+did still counts against the block. How long each handler took is
+recorded too, but only for diagnostics: it never fails a tx.
+"""
+import time
+
+from .accounts import Account
+
+FIELDS = ('reads', 'writes', 'read_bytes', 'write_bytes')
+
+class BudgetExceeded(Exception):
+    pass
+
+class Budget(object):
+    """ Limits on the state reads and writes (and their bytes) for a tx or
+    a block. None for no limit
+    """
+
+    def __init__(self, reads=None, writes=None, read_bytes=None, write_bytes=None):
+        self.reads = reads
+        self.writes = writes
+        self.read_bytes = read_bytes
+        self.write_bytes = write_bytes
+
+class Meter(object):
+    """ Counts the work done by one tx. 'limits' is {field: (limit, scope)} """
+
+    def __init__(self, limits=None):
+        self.limits = limits or {}
+        self.used = dict.fromkeys(FIELDS, 0)
+        self.seconds = 0.0
+        # The BudgetExceeded, once over. Sticks, so a handler can't catch it
+        # and carry on
+        self.exceeded = None
+
+    def _add(self, field, n):
+        self.used[field] += n
+        if self.exceeded is not None:
+            raise self.exceeded
+        limit = self.limits.get(field)
+        if limit is not None and self.used[field] > limit[0]:
+            self.exceeded = BudgetExceeded("{} budget exceeded: {} > {} {}".format(
+                limit[1], self.used[field], limit[0], field))
+            raise self.exceeded
+
+    def read(self, size):
+        self._add('reads', 1)
+        self._add('read_bytes', size)
+
+    def write(self, size):
+        self._add('writes', 1)
+        self._add('write_bytes', size)
+
+def _copy(acct):
+    # Handlers change accounts in place, so they get their own copy
+    return Account(acct.nonce, acct.balance, acct.pubkey)
+
+class MeteredCache(object):
+    """ What a handler gets instead of the block's StateCache. Same methods,
+    but reads and writes are metered and writes are held here until
+    apply()
+    """
+
+    def __init__(self, cache, meter):
+        self.cache = cache
+        self.meter = meter
+        self.storage_cache = {}
+        self.account_cache = {}
+
+    @property
+    def backend(self):
+        return self.cache.backend
+
+    def put_data(self, key, value):
+        if not key:
+            raise TypeError("Key cannot be blank")
+        if not isinstance(value, bytes):
+            raise TypeError("Value must be a byte string.  Got: {0}".format(type(value)))
+        self.meter.write(len(key) + len(value))
+        self.storage_cache[key] = value
+
+    def get_data(self, key):
+        if key in self.storage_cache:
+            value = self.storage_cache[key]
+        else:
+            value = self.cache.get_data(key)
+        self.meter.read(len(value))
+        return value
+
+    def get_account(self, address):
+        if address in self.account_cache:
+            acct = self.account_cache[address]
+        else:
+            acct = self.cache.get_account(address)
+            if acct:
+                acct = self.account_cache[address] = _copy(acct)
+        self.meter.read(len(acct.encode()) if acct else 0)
+        return acct
+
+    def increment_nonce(self, address):
+        acct = self.get_account(address)
+        if acct:
+            acct.nonce += 1
+            self.update_account(acct)
+
+    def update_account(self, acct):
+        if acct and isinstance(acct, Account):
+            address = acct.address()
+            self.meter.write(len(address) + len(acct.encode()))
+            self.account_cache[address] = acct
+
+    def apply(self):
+        """ Write what the handler changed to the block's cache """
+        for key, value in self.storage_cache.items():
+            self.cache.put_data(key, value)
+        for acct in self.account_cache.values():
+            self.cache.update_account(acct)
+
+class Metering(object):
+    """ Budgets for each tx and each block, and what's been used """
+
+    def __init__(self, tx_budget=None, block_budget=None):
+        self.tx_budget = tx_budget or Budget()
+        self.block_budget = block_budget or Budget()
+        self.block_used = dict.fromkeys(FIELDS, 0)
+        # For diagnostics
+        self.txs = 0
+        self.exceeded = 0
+        self.seconds = 0.0
+        self.slowest = (0.0, None)
+
+    def new_block(self):
+        self.block_used = dict.fromkeys(FIELDS, 0)
+
+    def meter(self):
+        """ A Meter limited by the tx budget and what's left of the block's """
+        limits = {}
+        for field in FIELDS:
+            candidates = []
+            tx_limit = getattr(self.tx_budget, field)
+            if tx_limit is not None:
+                candidates.append((tx_limit, 'tx'))
+            block_limit = getattr(self.block_budget, field)
+            if block_limit is not None:
+                candidates.append((block_limit - self.block_used[field], 'block'))
+            if candidates:
+                limits[field] = min(candidates)
+        return Meter(limits)
+
+    def run(self, handler, tx, cache):
+        """ Run handler(tx, ...) metered over 'cache'. Returns what the
+        handler does. Raises BudgetExceeded, with nothing written, if it
+        goes over
+        """
+        metered = MeteredCache(cache, self.meter())
+        start = time.perf_counter()
+        try:
+            result = handler(tx, metered)
+            if metered.meter.exceeded is not None:
+                # The handler caught it
+                raise metered.meter.exceeded
+        except BudgetExceeded:
+            self.exceeded += 1
+            raise
+        finally:
+            self._record(tx, metered.meter, time.perf_counter() - start)
+        metered.apply()
+        return result
+
+    def _record(self, tx, meter, seconds):
+        meter.seconds = seconds
+        for field in FIELDS:
+            self.block_used[field] += meter.used[field]
+        self.txs += 1
+        self.seconds += seconds
+        if seconds > self.slowest[0]:
+            self.slowest = (seconds, tx.call)
@@ -0,0 +1,123 @@
+"""
+Offline conversion of a state db to other codecs (see encoding.py):
+
+    python -m tendermint.migrate old.vdb new.vdb --account fixed \\
+        --compress zstd:3 --train 16384
+
+Every value in the old state is decoded and stored again with the new
+StateCodecs, and the trie is built from scratch in the new db, in key
+order, each node written once (compressed, with '--compress'). The old db
+isn't changed. Chain id and height are carried over.
+
+Only use it offline, before genesis: to prepare the genesis state every
+node of a new chain starts from. Never on a live chain. The values in the
+trie are part of the app hash, so a different account layout gives a
+different app hash, and a node whose state was converted would no longer
+agree with the rest. (Compression alone is below the hash. To turn it on
+for a running node, set TendermintApp.state_compression instead: nodes
+written from then on are compressed.)
+
+The trie only has hashed keys, so accounts are told apart by their value
+(an account whose address hashes to the key). With 'train_size', a
+compression dictionary is trained from the old db's trie nodes.
+"""
+import os
+import json
+
+import click
+
+from .accounts import Account
+from .bloom import trie_items
+from .encoding import StateCodecs, Compression, train_dictionary
+from .genesis import TrieBuilder, _batched
+from .state import State
+from .utils import keccak
+
+# Trie nodes sampled to train a dictionary
+TRAINING_SAMPLES = 10000
+
+def _as_account(hashed, value):
+    """ The Account stored under trie key 'hashed', or None if it isn't one """
+    try:
+        acct = Account.decode(value)
+    except Exception:
+        return None
+    if len(acct.pubkey) != 32 or keccak(acct.address()) != hashed:
+        return None
+    return acct
+
+def _node_samples(db, limit=TRAINING_SAMPLES):
+    """ Up to 'limit' trie nodes from VanillaDB 'db', uncompressed """
+    rows = db.db.execute("SELECT k, v FROM blobkey WHERE length(k) = 32 LIMIT ?", (limit,))
+    for k, v in rows:
+        yield db.blobs.decode(bytes(k), v)
+
+def migrate(src, dst, codecs=None, compression=None, train_size=None, batch_size=10000):
+    """ Write the state in db file 'src' to a new db file 'dst', with values
+    stored with 'codecs' (a StateCodecs, or None for RLP accounts and values
+    as they are) and trie nodes compressed with 'compression'. Returns a
+    dict of figures
+    """
+    if not os.path.exists(src):
+        raise IOError("{} not found".format(src))
+    if os.path.exists(dst):
+        raise IOError("{} already exists".format(dst))
+    source, _ = State.load_state(src)
+    if compression is not None and train_size:
+        dictionary = train_dictionary(list(_node_samples(source.db)), train_size, compression.method)
+        compression = Compression(compression.method, compression.level, dictionary)
+
+    stats = {'values': 0, 'accounts': 0}
+    def converted():
+        for hashed, stored in trie_items(source.db, source.storage.root_hash):
+            value = source.decode_value(stored)
+            acct = _as_account(hashed, value)
+            if acct is not None:
+                stats['accounts'] += 1
+                encoded = codecs.encode_account(acct) if codecs is not None else acct.encode()
+            else:
+                encoded = codecs.encode(b'', value) if codecs is not None else value
+            stats['values'] += 1
+            yield hashed, encoded
+
+    target, _ = State.load_state(dst)
+    if codecs is not None:
+        target.use_codecs(codecs)
+    target.db.use_compression(compression)
+    with _batched(target.db, batch_size):
+        root = TrieBuilder(target.db).build(converted())
+    target.storage.trie.root_hash = root
+    target.chain_id = source.chain_id
+    target.last_block_height = source.last_block_height
+    target.save()
+
+    stats['apphash_before'] = source.storage.root_hash.hex()
+    stats['apphash_after'] = root.hex()
+    stats['file_before'] = os.path.getsize(src)
+    stats['file_after'] = os.path.getsize(dst)
+    source.close()
+    target.close()
+    return stats
+
+def parse_compression(spec):
+    """ 'METHOD[:LEVEL]' -> Compression """
+    method, _, level = spec.partition(':')
+    return Compression(method, int(level) if level else 6)
+
+@click.command()
+@click.argument('src')
+@click.argument('dst')
+@click.option('--account', type=click.Choice(['fixed', 'rlp']), default=None,
+              help='Account codec. Without it values are stored as they are')
+@click.option('--compress', default=None,
+              help="Compress trie nodes with METHOD[:LEVEL], e.g. 'zlib:9' or 'zstd'")
+@click.option('--train', type=int, default=None,
+              help='Train a compression dictionary of this many bytes')
+def main(src, dst, account, compress, train):
+    """ Convert the state db SRC into a new db DST, offline, before genesis """
+    codecs = StateCodecs(account) if account else None
+    compression = parse_compression(compress) if compress else None
+    click.echo(json.dumps(migrate(src, dst, codecs, compression, train), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+RpcClient over several Tendermint nodes.
+
+    rpc = MultiRpcClient(['10.0.0.1:46657', '10.0.0.2:46657', ('10.0.0.3', 46657)])
+    rpc.status()
+    rpc.send_tx_sync(raw)
+    print(rpc.metrics())
+
+Every endpoint is probed with status() in the background. Reads go to the
+fastest healthy node, and move on to the next one if it fails. Broadcasts
+are retried on the next node with exponential backoff between attempts.
+Tendermint drops a tx it has already seen, so resending one that may have
+got through is safe.
+
+Only failures to reach a node (IOError, or a response that isn't JSON,
+e.g. a proxy's error page) count against it. An error returned by the
+node (ValueError) is the answer, and is raised as usual.
+"""
+import json
+import time
+import threading
+
+from .client import RpcClient
+
+# Weight of the newest sample in an endpoint's average latency
+LATENCY_WEIGHT = 0.3
+
+class Endpoint(object):
+    """ One node, its client, and how it's been doing """
+
+    def __init__(self, host, port, timeout=3):
+        self.host = host
+        self.port = port
+        self.client = RpcClient(host, port, timeout=timeout)
+        self.healthy = True
+        self.latency = None
+        self.height = None
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return "{}:{}".format(self.host, self.port)
+
+    def succeeded(self, elapsed):
+        with self._lock:
+            self.requests += 1
+            self.failures = 0
+            self.healthy = True
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += LATENCY_WEIGHT * (elapsed - self.latency)
+
+    def failed(self, error):
+        with self._lock:
+            self.requests += 1
+            self.errors += 1
+            self.failures += 1
+            self.healthy = False
+            self.last_error = str(error)
+
+    def run(self, fn, *args):
+        """ Call fn(*args) against this node, keeping score """
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except (json.JSONDecodeError, UnicodeDecodeError) as err:
+            # Not JSON, e.g. an error page from a proxy in front of the node.
+            # The node didn't answer, so it's a failure
+            error = IOError("{} sent a response that isn't JSON: {}".format(self.name, err))
+            self.failed(error)
+            raise error
+        except ValueError:
+            # The node answered (a JSON-RPC error)
+            self.succeeded(time.perf_counter() - start)
+            raise
+        except IOError as err:
+            self.failed(err)
+            raise
+        self.succeeded(time.perf_counter() - start)
+        return result
+
+    def probe(self):
+        """ Check the node with status(). Returns True if it answered """
+        try:
+            status = self.run(self.client._call, 'status', [])
+        except (IOError, ValueError):
+            return False
+        self.height = status.get('latest_block_height', self.height)
+        return True
+
+    def metrics(self):
+        return {
+            'healthy': self.healthy,
+            'latency_ms': None if self.latency is None else round(self.latency * 1000, 3),
+            'height': self.height,
+            'requests': self.requests,
+            'errors': self.errors,
+            'failures': self.failures,
+            'last_error': self.last_error,
+        }
+
+def _endpoint(value, timeout):
+    if isinstance(value, str):
+        host, _, port = value.rpartition(':')
+        return Endpoint(host, int(port), timeout)
+    host, port = value
+    return Endpoint(host, port, timeout)
+
+class MultiRpcClient(RpcClient):
+    """ Same methods as RpcClient, over a list of endpoints ("host:port"
+    or (host, port)). 'probe_interval' is the seconds between background
+    health checks, None for none. Broadcasts make up to 'retries' attempts,
+    waiting 'backoff' seconds after the first failure, doubling each time
+    up to 'max_backoff'
+    """
+
+    def __init__(self, endpoints, probe_interval=5, retries=4, backoff=0.1,
+                 max_backoff=2, cache=None, timeout=3):
+        if not endpoints:
+            raise ValueError("Need at least one endpoint")
+        super().__init__(cache=cache, timeout=timeout)
+        self.endpoints = [_endpoint(value, timeout) for value in endpoints]
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._stopped = threading.Event()
+        self._prober = None
+        if probe_interval:
+            self._prober = threading.Thread(
+                target=self._probe_loop, args=(probe_interval,), daemon=True)
+            self._prober.start()
+
+    def _probe_loop(self, interval):
+        while not self._stopped.is_set():
+            self.probe()
+            self._stopped.wait(interval)
+
+    def probe(self):
+        """ Check every endpoint now """
+        for endpoint in self.endpoints:
+            endpoint.probe()
+
+    def close(self):
+        self._stopped.set()
+        if self._prober:
+            self._prober.join()
+            self._prober = None
+
+    def ranked(self):
+        """ Endpoints to try, best first: healthy ones by latency (not yet
+        measured counts as fastest), then the rest by fewest failures
+        """
+        healthy = [e for e in self.endpoints if e.healthy]
+        healthy.sort(key=lambda e: e.latency or 0)
+        unhealthy = [e for e in self.endpoints if not e.healthy]
+        unhealthy.sort(key=lambda e: e.failures)
+        return healthy + unhealthy
+
+    def metrics(self):
+        """ name -> dict of health, latency and counts for each endpoint """
+        return dict((e.name, e.metrics()) for e in self.endpoints)
+
+    def _read(self, name, *args):
+        error = None
+        for endpoint in self.ranked():
+            try:
+                return endpoint.run(getattr(endpoint.client, name), *args)
+            except IOError as err:
+                error = err
+        raise error
+
+    def _broadcast(self, method, params):
+        error = None
+        for attempt in range(self.retries):
+            if attempt:
+                time.sleep(min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+            endpoint = self.ranked()[0]
+            try:
+                return endpoint.run(endpoint.client._call, method, params)
+            except IOError as err:
+                error = err
+        raise error
+
+    def _call(self, method, params):
+        if method.startswith('broadcast_tx_'):
+            return self._broadcast(method, params)
+        return self._read('_call', method, params)
+
+    def _call_batch(self, calls):
+        return self._read('_call_batch', calls)
@@ -0,0 +1,111 @@
+"""
+Client side nonces, so a busy sender doesn't need a '/tx_nonce' query
+before every tx.
+
+    nonces = NonceManager(rpc)
+    result = nonces.send(tx, bob)
+
+The nonce for an account is fetched the first time it's needed, then
+handed out locally, one at a time, to any number of threads (or asyncio
+tasks). When a tx comes back from check_tx with "Bad nonce" the account is
+resynced from the node. send() does that and retries for you. If you send
+the txs yourself, call observe() with each result.
+
+check_tx wants each account's txs in nonce order, so txs from one account
+should be sent in the order their nonces were taken (e.g. from one thread).
+"""
+import base64
+import threading
+
+from .utils import big_endian_to_int
+
+BAD_NONCE = "Bad nonce"
+
+def is_bad_nonce(result):
+    """ True if a broadcast_tx_* result is check_tx rejecting the nonce """
+    if result and 'check_tx' in result:
+        result = result['check_tx']
+    return bool(result) and result.get('log') == BAD_NONCE
+
+def _parse_nonce(result):
+    response = result['response']
+    if response.get('code'):
+        raise ValueError("Nonce query failed: {}".format(response.get('log') or response))
+    value = response.get('value') or ''
+    return big_endian_to_int(base64.b64decode(value))
+
+class NonceManager(object):
+    """ Hands out nonces per account. 'rpc' is an RpcClient (or
+    MultiRpcClient) for next() and send(), or an AsyncRpcClient for
+    next_async()
+    """
+
+    def __init__(self, rpc, path='/tx_nonce'):
+        self.rpc = rpc
+        self.path = path
+        self.resyncs = 0
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def _take(self, address):
+        with self._lock:
+            nonce = self._next.get(address)
+            if nonce is not None:
+                self._next[address] = nonce + 1
+            return nonce
+
+    def _seed(self, address, nonce):
+        with self._lock:
+            # Someone else may have fetched it meanwhile. Theirs wins
+            if address not in self._next:
+                self._next[address] = nonce
+
+    def next(self, address):
+        """ The next nonce to use for 'address' """
+        nonce = self._take(address)
+        while nonce is None:
+            self._seed(address, _parse_nonce(self.rpc.query(self.path, address)))
+            nonce = self._take(address)
+        return nonce
+
+    async def next_async(self, address):
+        """ next() for an AsyncRpcClient """
+        nonce = self._take(address)
+        while nonce is None:
+            self._seed(address, _parse_nonce(await self.rpc.query(self.path, address)))
+            nonce = self._take(address)
+        return nonce
+
+    def set(self, address, nonce):
+        """ Start handing out nonces for 'address' from 'nonce' """
+        with self._lock:
+            self._next[address] = nonce
+
+    def resync(self, address):
+        """ Forget the local nonce. The next one is fetched from the node """
+        with self._lock:
+            self._next.pop(address, None)
+            self.resyncs += 1
+
+    def observe(self, address, result):
+        """ Check a broadcast_tx_* result for a tx from 'address'. Resyncs
+        and returns True if its nonce was wrong
+        """
+        if is_bad_nonce(result):
+            self.resync(address)
+            return True
+        return False
+
+    def send(self, tx, key, mode='sync', retries=1):
+        """ Give 'tx' the next nonce for 'key', sign it and send it with
+        send_tx_<mode>. If the nonce was wrong, resync and try again, up to
+        'retries' times. Returns the node's result
+        """
+        send = getattr(self.rpc, 'send_tx_' + mode)
+        address = key.address()
+        for attempt in range(retries + 1):
+            tx.nonce = self.next(address)
+            result = send(tx.sign(key).encode())
+            if not self.observe(address, result):
+                break
+        return result
@@ -0,0 +1,270 @@
+"""
+Speculative prefetch of the state pending txs will touch.
+
+When check_tx accepts a tx, the accounts of its sender and recipient, and
+any keys its handler declares, are queued for a background thread:
+
+    @app.on_transaction('transfer', keys=lambda tx: [b'balance-' + tx.to])
+    def transfer(tx, db):
+        ...
+
+The thread looks them up in the last committed state, many keys at a time:
+each level of the trie is read for all of them with one SQL query, through
+its own connection. Values are decoded (accounts into Account objects)
+there too. By the time the tx is delivered, State.get_storage() and
+get_account() find them in memory instead of walking the trie.
+
+Everything prefetched is for one state root. Once a block is committed
+it's dropped, and the txs still waiting are hinted again when Tendermint
+rechecks them. Trie nodes are kept across blocks (they're addressed by
+hash, so never go stale), which saves re-reading the top of the trie.
+Prefetching only ever saves work: a key it hasn't got (yet) is read from
+the trie as before.
+"""
+import queue
+import sqlite3
+import threading
+
+import rlp
+from trie.constants import BLANK_NODE
+from trie.utils.nibbles import bytes_to_nibbles
+from trie.utils.nodes import (
+    get_node_type,
+    extract_key,
+    key_starts_with,
+    NODE_TYPE_BLANK,
+    NODE_TYPE_LEAF,
+    NODE_TYPE_EXTENSION,
+    NODE_TYPE_BRANCH,
+)
+
+from .db import VanillaDB
+from .journal import JournaledDB
+from .accounts import Account
+from .encoding import BlobCodec
+from .utils import keccak
+
+# Most hashes in one SELECT ... IN (...)
+SQL_BATCH = 500
+
+def _step(node, nibbles):
+    """ Follow 'nibbles' one node down. Returns ('value', value) or
+    ('next', child reference, remaining nibbles)
+    """
+    kind = get_node_type(node)
+    if kind == NODE_TYPE_BLANK:
+        return ('value', BLANK_NODE)
+    if kind == NODE_TYPE_LEAF:
+        return ('value', node[1] if tuple(extract_key(node)) == nibbles else BLANK_NODE)
+    if kind == NODE_TYPE_EXTENSION:
+        prefix = tuple(extract_key(node))
+        if not key_starts_with(nibbles, prefix):
+            return ('value', BLANK_NODE)
+        return ('next', node[1], nibbles[len(prefix):])
+    if kind == NODE_TYPE_BRANCH:
+        if not nibbles:
+            return ('value', node[16])
+        return ('next', node[nibbles[0]], nibbles[1:])
+    raise Exception("Invariant: This shouldn't ever happen")
+
+class Prefetcher(object):
+    """ Background loading of state keys for 'state' (a State). Holds up to
+    'max_values' values and 'max_nodes' trie nodes
+    """
+
+    def __init__(self, state, max_values=100000, max_nodes=200000):
+        self.state = state
+        self.db = state.db
+        self.max_values = max_values
+        self.max_nodes = max_nodes
+        # (state root, {key: (value, decoded Account or None)}). Replaced
+        # as a whole, so a root is never paired with another root's values
+        self._loaded = (state.storage.root_hash, {})
+        # node hash -> encoded node
+        self._nodes = {}
+        self._queue = queue.Queue()
+        self._conn = None
+        # Decompresses the nodes read through _conn
+        self._blobs = BlobCodec(self._select_one)
+        self.hits = 0
+        self.prefetched = 0
+        self.errors = 0
+        self.last_error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def hint(self, keys, accounts=()):
+        """ Queue state keys and account addresses to load """
+        if keys or accounts:
+            self._queue.put((list(keys), list(accounts)))
+
+    def committed(self, root_hash):
+        """ State moved to 'root_hash'. What was loaded is out of date """
+        if root_hash != self._loaded[0]:
+            self._loaded = (root_hash, {})
+
+    def get(self, root_hash, key):
+        """ The value of 'key' in state 'root_hash', or None if it hasn't
+        been loaded
+        """
+        root, values = self._loaded
+        if root_hash != root:
+            return None
+        entry = values.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def get_account(self, root_hash, address):
+        """ A copy of the Account at 'address', b'' if there isn't one, or
+        None if it hasn't been loaded
+        """
+        root, values = self._loaded
+        if root_hash != root:
+            return None
+        entry = values.get(address)
+        if entry is None:
+            return None
+        self.hits += 1
+        value, acct = entry
+        if not value:
+            return b''
+        if acct is None:
+            # Hinted as a key rather than an account
+            acct = Account.decode(value)
+        return Account(acct.nonce, acct.balance, acct.pubkey)
+
+    def wait(self):
+        """ Block until everything hinted so far has been loaded """
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                hints = [self._queue.get()]
+                while not self._queue.empty():
+                    hints.append(self._queue.get())
+                try:
+                    work = [h for h in hints if h is not None]
+                    if work:
+                        self._load(work)
+                except Exception as err:
+                    # Nothing depends on it. Those keys come from the trie
+                    self.errors += 1
+                    self.last_error = err
+                finally:
+                    for _ in hints:
+                        self._queue.task_done()
+                if len(work) < len(hints):
+                    return
+        finally:
+            if self._conn:
+                self._conn.close()
+
+    def _load(self, hints):
+        # If a block is committed meanwhile, these go in a dict that's
+        # already been dropped
+        root, values = self._loaded
+        wanted = {}
+        for keys, accounts in hints:
+            for key in keys:
+                if key not in values:
+                    wanted[key] = False
+            for address in accounts:
+                if address not in values:
+                    wanted[address] = True
+        if not wanted or len(values) >= self.max_values:
+            return
+
+        found = self._lookup(root, [keccak(k) for k in wanted])
+        for (key, is_account), stored in zip(wanted.items(), found):
+            if stored is None:
+                # Part of the trie couldn't be read (yet). Left to the trie
+                continue
+            acct = None
+            if is_account and stored:
+                acct = self.state.decode_account(stored)
+            values[key] = (self.state.decode_value(stored), acct)
+            self.prefetched += 1
+
+    def _lookup(self, root, hashed_keys):
+        """ Values of 'hashed_keys' in the trie at 'root', b'' for missing
+        keys and None where a node couldn't be read. Walks every key down
+        together, reading the nodes for each level in one go
+        """
+        results = [None] * len(hashed_keys)
+        walks = [(i, root, tuple(bytes_to_nibbles(k))) for i, k in enumerate(hashed_keys)]
+        while walks:
+            needed = set(ref for _, ref, _ in walks if self._is_hash(ref))
+            self._fetch([h for h in needed if h not in self._nodes])
+
+            next_walks = []
+            for i, ref, nibbles in walks:
+                node = self._node(ref)
+                if node is None:
+                    continue
+                step = _step(node, nibbles)
+                if step[0] == 'value':
+                    results[i] = step[1]
+                else:
+                    next_walks.append((i, step[1], step[2]))
+            walks = next_walks
+        return results
+
+    @staticmethod
+    def _is_hash(ref):
+        return isinstance(ref, bytes) and len(ref) == 32
+
+    def _node(self, ref):
+        if ref == BLANK_NODE:
+            return BLANK_NODE
+        if isinstance(ref, list):
+            return ref
+        if not self._is_hash(ref):
+            return rlp.decode(ref)
+        encoded = self._nodes.get(ref)
+        return rlp.decode(encoded) if encoded is not None else None
+
+    def _select_one(self, key):
+        row = self._conn.execute("SELECT v FROM blobkey WHERE k=?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _fetch(self, hashes):
+        if not hashes:
+            return
+        if len(self._nodes) + len(hashes) > self.max_nodes:
+            self._nodes = {}
+        nodes = self._nodes
+        if isinstance(self.db, JournaledDB):
+            # Nodes from the last few blocks may not have reached SQLite yet
+            rest = []
+            for h in hashes:
+                entry = self.db._unflushed.get(h)
+                if entry is not None:
+                    nodes[h] = entry[1]
+                else:
+                    rest.append(h)
+            hashes = rest
+        if isinstance(self.db, VanillaDB):
+            # sqlite connections can't be shared between threads
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.db.dbfile)
+            for start in range(0, len(hashes), SQL_BATCH):
+                chunk = hashes[start:start + SQL_BATCH]
+                rows = self._conn.execute(
+                    "SELECT k, v FROM blobkey WHERE k IN ({})".format(','.join('?' * len(chunk))),
+                    chunk)
+                for k, v in rows:
+                    k = bytes(k)
+                    nodes[k] = self._blobs.decode(k, v)
+        else:
+            for h in hashes:
+                try:
+                    nodes[h] = self.db.get(h)
+                except KeyError:
+                    pass
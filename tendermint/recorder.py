@@ -0,0 +1,103 @@
+"""
+Record the ABCI requests an app receives and replay them later without
+Tendermint.
+
+A recording is a stream of frames. Each frame is a 1 byte tag followed by
+a protobuf message framed the same way as on the ABCI wire (varint length
+prefix). Requests are tagged REQUEST. After each commit the resulting app
+hash is written as a ResponseCommit tagged APPHASH, so a replay can check
+it ends up in exactly the same state.
+"""
+import time
+
+from abci.wire import write_message, read_message
+from abci.types_pb2 import Request, ResponseCommit
+
+REQUEST = b'Q'
+APPHASH = b'H'
+
+# Requests that change or read app state. Everything else (echo, flush,
+# info, ...) isn't needed to reproduce a run
+RECORDED = ('init_chain', 'begin_block', 'check_tx', 'deliver_tx', 'commit', 'query')
+
+class Recorder(object):
+    """ Appends ABCI requests to a recording file """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+
+    def record(self, req):
+        self.file.write(REQUEST)
+        self.file.write(write_message(req))
+
+    def record_apphash(self, apphash):
+        self.file.write(APPHASH)
+        self.file.write(write_message(ResponseCommit(data=apphash)))
+        # Once a block, so a crash loses at most the current block
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+def read_recording(path):
+    """ Yields (tag, message) for each frame in a recording """
+    with open(path, 'rb') as f:
+        while True:
+            tag = f.read(1)
+            if not tag:
+                return
+            if tag == REQUEST:
+                msg, status = read_message(f, Request)
+            elif tag == APPHASH:
+                msg, status = read_message(f, ResponseCommit)
+            else:
+                raise ValueError("Unknown frame tag {} in {}".format(tag, path))
+            if status != 1:
+                # Truncated last frame. The app was stopped mid write
+                return
+            yield tag, msg
+
+def replay(app, path, verify=True):
+    """ Feed a recording back into 'app' as fast as possible. The app needs
+    state to run against, e.g. call app.mock_run() first. If 'verify' is
+    True, raises ValueError as soon as an app hash doesn't match the one
+    recorded. Returns a dict of request counts and timing
+    """
+    counts = dict((name, 0) for name in RECORDED)
+    blocks = 0
+    last_hash = None
+    start = time.perf_counter()
+
+    for tag, msg in read_recording(path):
+        if tag == APPHASH:
+            blocks += 1
+            if verify and msg.data != last_hash:
+                raise ValueError(
+                    "App hash mismatch after block {}: recorded {} replayed {}".format(
+                        blocks, msg.data.hex(), (last_hash or b'').hex()))
+            continue
+
+        name = msg.WhichOneof("value")
+        if name not in counts:
+            continue
+        counts[name] += 1
+
+        if name == 'init_chain':
+            # Already have state, otherwise this would load it from the
+            # tendermint dir
+            if not app._storage:
+                app.init_chain(msg)
+        elif name == 'commit':
+            last_hash = app.commit(msg).data
+        else:
+            getattr(app, name)(msg)
+
+    return {
+        'requests': counts,
+        'blocks': blocks,
+        'last_app_hash': last_hash,
+        'elapsed_secs': time.perf_counter() - start
+    }
@@ -0,0 +1,6 @@
+"""
+Server side entry point. Importing this loads the ABCI server and
+everything the app needs to run
+"""
+from .app import TendermintApp, setup_app_state
+from .transactions import Transaction
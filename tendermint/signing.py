@@ -0,0 +1,83 @@
+"""
+Sign lots of txs at once, across a pool of processes.
+
+    nonces = {bob.address(): 12}
+    for raw in sign_batch(((tx, bob) for tx in payouts), nonces=nonces):
+        rpc.send_tx_async(raw)
+
+Each worker gets the tx's fields (params already encoded) and the signing
+key, and sends back the encoded, signed tx. Results come back in the
+order they went in, as they're ready.
+"""
+import multiprocessing
+from collections import deque
+
+from .keys import Key
+from .transactions import Transaction
+
+# Per worker process: secret key -> Key, so the address is only derived once
+_keys = {}
+
+def _worker_key(secret):
+    key = _keys.get(secret)
+    if key is None:
+        key = _keys[secret] = Key.fromPrivateKey(secret)
+    return key
+
+def _sign_one(job):
+    fields, secret = job
+    return Transaction(*fields).sign(_worker_key(secret)).encode()
+
+def _jobs(txs, nonces, issued):
+    # The pool reads jobs ahead of the results, so nonces handed out are
+    # tracked here and only recorded in 'nonces' as results are yielded
+    next_nonces = {}
+    for tx, key in txs:
+        if not isinstance(key, Key):
+            raise Exception("Can only sign with a Key object")
+        nonce = tx.nonce
+        if nonces is not None:
+            address = key.address()
+            if address not in next_nonces:
+                next_nonces[address] = nonces.get(address, 0)
+            nonce = next_nonces[address]
+            next_nonces[address] = nonce + 1
+            issued.append((address, nonce))
+
+        fields = (key.address(), tx.to, nonce, tx.value, tx.call, b'', tx.encoded_params)
+        yield fields, key.privatekey()
+
+def sign_batch(txs, nonces=None, processes=None, chunksize=64):
+    """ Sign an iterable of (Transaction, Key) pairs. Yields each tx signed
+    and encoded, in the same order. The Transactions passed in aren't
+    changed.
+
+    If 'nonces' is a dict of address -> next nonce, every tx gets its
+    sender's next nonce, in order. As each tx is yielded the dict is
+    updated to the sender's next unused nonce. Senders not in the dict
+    start at 0. Leave it as None to sign the txs with the nonces they have.
+
+    'processes' defaults to the number of CPUs. With 1, everything is
+    signed in this process
+    """
+    issued = deque()
+    jobs = _jobs(txs, nonces, issued)
+
+    def signed(raw):
+        if nonces is not None:
+            address, nonce = issued.popleft()
+            nonces[address] = nonce + 1
+        return raw
+
+    if processes == 1:
+        for job in jobs:
+            yield signed(_sign_one(job))
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for raw in pool.imap(_sign_one, jobs, chunksize):
+            yield signed(raw)
+    finally:
+        pool.terminate()
+        pool.join()
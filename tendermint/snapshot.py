@@ -0,0 +1,317 @@
+"""
+Read-only snapshot files of committed state, for serving queries.
+
+    python -m tendermint.snapshot state.vdb state.snap
+
+write_snapshot() walks the trie at the state's current root once, in key
+order, and writes every value into one immutable file:
+
+    header | chain id | values, back to back | index
+
+The index is the hashed keys in sorted order, each with the position and
+length of its value, packed into fixed size blocks of one page. When a
+Snapshot is opened the file is memory-mapped and only the first key of
+each block is read. A lookup bisects those to find the block, then binary
+searches the one page, and returns the value as a slice of the map: no
+trie walk, no SQLite, no copy.
+
+Values are stored as the app put them (accounts as RLP), whatever codecs
+the state uses, so a snapshot can be read without its state db, e.g. by a
+read-only replica.
+
+With TendermintApp.snapshot_dir set, the app writes a snapshot every
+'snapshot_interval' blocks, in a background thread, and answers on_query
+handlers from the newest one. Those answers can be up to that many blocks
+behind.
+"""
+import os
+import mmap
+import struct
+import bisect
+import tempfile
+import threading
+
+import click
+
+from .accounts import Account
+from .bloom import trie_items
+from .db import VanillaDB
+from .encoding import StateCodecs
+from .journal import JournaledDB
+from .state import State
+from .utils import keccak, str_to_bytes
+
+MAGIC = b'VSS1'
+# magic, height, number of keys, index offset, state root, chain id length
+HEADER = struct.Struct('>4sQQQ32sH')
+# hashed key, value offset, value length
+ENTRY = struct.Struct('>32sQI')
+# Index blocks are a page each: as many entries as fit, then padding
+BLOCK_SIZE = 4096
+BLOCK_ENTRIES = BLOCK_SIZE // ENTRY.size
+
+def _read_only(*args):
+    raise TypeError("Snapshots are read-only")
+
+def write_snapshot(state, path):
+    """ Write the state at its current root to a new file 'path'. Returns
+    the number of keys
+    """
+    return _write_file(path, state.db, state.codecs, state.storage.root_hash,
+                       state.last_block_height, state.chain_id)
+
+def _write_file(path, db, codecs, root, height, chain_id):
+    if isinstance(chain_id, str):
+        chain_id = chain_id.encode('utf-8')
+    tmp = path + '.tmp'
+    count = 0
+    with open(tmp, 'wb') as f, tempfile.TemporaryFile() as index:
+        f.write(b'\0' * HEADER.size + chain_id)
+        offset = HEADER.size + len(chain_id)
+        for hashed, stored in trie_items(db, root):
+            value = codecs.decode(stored) if codecs is not None else stored
+            f.write(value)
+            index.write(ENTRY.pack(hashed, offset, len(value)))
+            offset += len(value)
+            count += 1
+
+        # Index blocks start on a page
+        index_offset = -(-offset // BLOCK_SIZE) * BLOCK_SIZE
+        f.write(b'\0' * (index_offset - offset))
+        index.seek(0)
+        while True:
+            block = index.read(BLOCK_ENTRIES * ENTRY.size)
+            if not block:
+                break
+            f.write(block.ljust(BLOCK_SIZE, b'\0'))
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, height, count, index_offset,
+                            root.ljust(32, b'\0'), len(chain_id)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+class Snapshot(object):
+    """ A snapshot file, memory-mapped. Reads like a StateCache, so query
+    handlers can be given one
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            self._map.close()
+            raise IOError("{} is not a snapshot".format(path))
+        magic, height, count, index_offset, root, chain_len = HEADER.unpack_from(self._map)
+        blocks = -(-count // BLOCK_ENTRIES)
+        if magic != MAGIC or len(self._map) != index_offset + blocks * BLOCK_SIZE:
+            self._map.close()
+            raise IOError("{} is not a snapshot, or is incomplete".format(path))
+        self.height = height
+        self.count = count
+        self.root_hash = root
+        self.chain_id = self._map[HEADER.size:HEADER.size + chain_len]
+        self._index = index_offset
+        self._view = memoryview(self._map)
+        # First key of each block
+        self._fences = [self._map[index_offset + b * BLOCK_SIZE:index_offset + b * BLOCK_SIZE + 32]
+                        for b in range(blocks)]
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, hashed):
+        """ Position in the map of the entry for 'hashed', or None """
+        block = bisect.bisect_right(self._fences, hashed) - 1
+        if block < 0:
+            return None
+        start = self._index + block * BLOCK_SIZE
+        lo, hi = 0, min(BLOCK_ENTRIES, self.count - block * BLOCK_ENTRIES)
+        m = self._map
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = start + mid * ENTRY.size
+            key = m[pos:pos + 32]
+            if key < hashed:
+                lo = mid + 1
+            elif key > hashed:
+                hi = mid
+            else:
+                return pos
+        return None
+
+    def get(self, key):
+        """ The value of 'key' as a memoryview into the file, or None if it
+        isn't there
+        """
+        pos = self._find(keccak(key))
+        if pos is None:
+            return None
+        _, offset, length = ENTRY.unpack_from(self._map, pos)
+        return self._view[offset:offset + length]
+
+    def get_data(self, key):
+        value = self.get(key)
+        return bytes(value) if value is not None else b''
+
+    def get_account(self, address):
+        value = self.get(address)
+        if not value:
+            return b''
+        return Account.decode(bytes(value))
+
+    put_data = _read_only
+    update_account = _read_only
+    increment_nonce = _read_only
+
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # A caller still holds a value. The map goes when that does
+            pass
+
+class SnapshotStore(object):
+    """ Snapshots in 'directory', one file per height, keeping the newest
+    'keep'. Writes happen in a background thread
+    """
+
+    def __init__(self, directory, keep=2):
+        if keep < 1:
+            raise ValueError("keep must be at least 1")
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.keep = keep
+        self._latest = None
+        # Files already on disk are only looked through once
+        self._scanned = False
+        # Height of a snapshot written but not opened yet
+        self._ready = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.written = 0
+        self.errors = 0
+        self.last_error = None
+
+    def _path(self, height):
+        return os.path.join(self.directory, 'snapshot-{:012d}.snap'.format(height))
+
+    def heights(self):
+        """ Heights of the snapshots on disk, oldest first """
+        heights = []
+        for name in os.listdir(self.directory):
+            if name.startswith('snapshot-') and name.endswith('.snap'):
+                heights.append(int(name[len('snapshot-'):-len('.snap')]))
+        return sorted(heights)
+
+    def latest(self, state=None):
+        """ The newest Snapshot, or None if there isn't one yet. Snapshots
+        written in the background are opened (and the one before closed)
+        here, so by the thread that reads them. Given the current 'state',
+        only a snapshot of its chain, at or below its height, is returned
+        """
+        with self._lock:
+            ready, self._ready = self._ready, None
+        if ready is not None:
+            self._use(Snapshot(self._path(ready)))
+            # Above 'ready' is another history (e.g. the state was rolled
+            # back), so only older ones are kept
+            heights = [h for h in self.heights() if h <= ready]
+            for old in heights[:-self.keep] + [h for h in self.heights() if h > ready]:
+                os.remove(self._path(old))
+        if self._latest is not None and not self._matches(self._latest, state):
+            self._use(None)
+        if self._latest is None and not self._scanned:
+            self._scanned = True
+            self._use(self._newest_on_disk(state))
+        return self._latest
+
+    def _use(self, snapshot):
+        previous, self._latest = self._latest, snapshot
+        if previous is not None:
+            previous.close()
+
+    @staticmethod
+    def _matches(snapshot, state):
+        if state is None:
+            return True
+        return (snapshot.chain_id == str_to_bytes(state.chain_id) and
+                snapshot.height <= state.last_block_height)
+
+    def _newest_on_disk(self, state):
+        for height in reversed(self.heights()):
+            try:
+                snapshot = Snapshot(self._path(height))
+            except IOError:
+                continue
+            if self._matches(snapshot, state):
+                return snapshot
+            snapshot.close()
+        return None
+
+    def export(self, state):
+        """ Snapshot 'state' at its current root, in the background. Skipped
+        if the last one is still being written
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        # Taken now: state moves on while the file is written
+        args = (state, state.storage.root_hash, state.last_block_height, state.chain_id)
+        self._thread = threading.Thread(target=self._write, args=args, daemon=True)
+        self._thread.start()
+        return True
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def _write(self, state, root, height, chain_id):
+        db = state.db
+        codecs = state.codecs
+        try:
+            if isinstance(db, VanillaDB):
+                if isinstance(db, JournaledDB):
+                    # Everything saved so far into SQLite first
+                    db.wait()
+                # sqlite connections can't be shared between threads
+                db = VanillaDB(db.dbfile)
+                codecs = StateCodecs.load(db)
+            try:
+                _write_file(self._path(height), db, codecs, root, height, chain_id)
+            finally:
+                if db is not state.db:
+                    db.close()
+            with self._lock:
+                self._ready = height
+            self.written += 1
+        except Exception as err:
+            # Queries keep using the last snapshot
+            self.errors += 1
+            self.last_error = err
+
+    def close(self):
+        self.wait()
+        with self._lock:
+            if self._latest is not None:
+                self._latest.close()
+                self._latest = None
+
+@click.command()
+@click.argument('dbfile')
+@click.argument('path')
+def main(dbfile, path):
+    """ Write a snapshot of the state db DBFILE to PATH """
+    if not os.path.exists(dbfile):
+        raise click.ClickException("{} not found".format(dbfile))
+    state, _ = State.load_state(dbfile)
+    count = write_snapshot(state, path)
+    state.close()
+    click.echo("{} keys at height {} written to {}".format(count, state.last_block_height, path))
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,19 @@
 
+import sys
+from collections import OrderedDict
+
 import rlp
 from trie import Trie
 from trie.db.memory import MemoryDB
+from trie.constants import BLANK_NODE_HASH
 from rlp.sedes import big_endian_int, binary
 
 from .db import VanillaDB
+from .journal import JournaledDB
 from .accounts import Account
+from .changefeed import Change, DATA, ACCOUNT
+from .bloom import open_bloom
+from .encoding import StateCodecs
 from .utils import keccak,int_to_big_endian
 
 BLANK_ROOT_HASH = b''
@@ -65,6 +73,16 @@ class State(object):
         self.last_block_height = height
         self.last_block_hash = apphash
         self.storage = StateTrie(Trie(self.db, apphash))
+        # Optional ChangeFeed told about every commit. See changefeed.py
+        self.changefeed = None
+        # Optional Bloom filter of the (hashed) keys in state. See use_bloom()
+        self.bloom = None
+        self.bloom_path = None
+        # Optional Prefetcher loading keys ahead of time. See prefetch.py
+        self.prefetcher = None
+        # How values are stored. None for RLP accounts and values as they
+        # are. See use_codecs()
+        self.codecs = None
         """
         if dbfile:
             self.storage = StateTrie(Trie(VanillaDB(dbfile), root_hash))
@@ -74,29 +92,79 @@ class State(object):
         """
 
     @classmethod
-    def load_state(cls, dbfile=None):
+    def load_state(cls, dbfile=None, journal=False):
         """ Create or load State.
         returns: (State, is_new) where 'is_new' is T|F indicating whether
         this the first run.
+        With 'journal', saves are written to disk in the background. See
+        journal.py
         """
         if not dbfile:
             return (cls(MemoryDB(), b'testchain', 0, BLANK_ROOT_HASH), True)
 
         # ASSSUMES THE PATH TO THE FILE EXISTS - IF NEW
-        db = VanillaDB(dbfile)
+        db = JournaledDB(dbfile) if journal else VanillaDB(dbfile)
         serial = db.get(CHAIN_METADATA_KEY)
         if serial:
             meta = rlp.decode(serial,sedes=chainMetaData)
-            return (cls(db, meta.chainid, meta.height, meta.apphash), db.is_new)
+            state = cls(db, meta.chainid, meta.height, meta.apphash)
+        else:
+            state = cls(db, b'', 0, BLANK_ROOT_HASH)
+        state.codecs = StateCodecs.load(db)
+        return (state, db.is_new)
 
-        return (cls(db, b'', 0, BLANK_ROOT_HASH), db.is_new)
+    def use_codecs(self, codecs):
+        """ Store values with 'codecs', a StateCodecs. Only for new state:
+        existing state has to be converted with migrate.py. See encoding.py
+        """
+        if self.codecs is not None:
+            if self.codecs != codecs:
+                raise TypeError("State already uses other codecs. Convert it with migrate.py")
+            return
+        if self.storage.root_hash not in (BLANK_ROOT_HASH, BLANK_NODE_HASH):
+            raise TypeError("Codecs can only be set for new state. Convert it with migrate.py")
+        codecs.save(self.db)
+        self.codecs = codecs
+
+    def decode_value(self, stored):
+        """ A value as read from the trie back to what was put """
+        if self.codecs is not None:
+            return self.codecs.decode(stored)
+        return stored
+
+    def decode_account(self, stored):
+        if self.codecs is not None:
+            return self.codecs.decode_account(stored)
+        acct = Account.decode(stored)
+        acct.allow_changes()
+        return acct
+
+    def use_bloom(self, capacity=1000000, error_rate=0.001, num_bits=None):
+        """ Check a Bloom filter before looking up a key in the trie, so
+        missing keys are usually found missing without going to disk.
+        Sized for 'capacity' keys at 'error_rate' false positives, or to
+        'num_bits' of memory. Kept in dbfile + '.bloom'. See bloom.py
+        """
+        if isinstance(self.db, VanillaDB):
+            self.bloom_path = self.db.dbfile + '.bloom'
+        self.bloom = open_bloom(self.db, self.storage.root_hash, self.bloom_path,
+                                capacity, error_rate, num_bits)
+        return self.bloom
 
     def save(self):
         apphash = self.storage.root_hash
+        if self.prefetcher is not None:
+            self.prefetcher.committed(apphash)
+        if self.bloom is not None and self.bloom_path:
+            # Before the metadata: the filter may cover more keys than the
+            # state on disk, never fewer
+            self.bloom.save(self.bloom_path, apphash)
         # Save to storage
         meta = chainMetaData(self.chain_id, self.last_block_height, apphash)
         serial = rlp.encode(meta, sedes=chainMetaData)
         self.db.set(CHAIN_METADATA_KEY, serial)
+        if isinstance(self.db, JournaledDB):
+            self.db.commit_block(self.last_block_height)
         return apphash
 
     def close(self):
@@ -107,27 +175,51 @@ class State(object):
         if not key:
             raise TypeError("Key cannot be blank")
         validate_is_bytes(value)
-        self.storage[key] = value
+        if self.codecs is not None:
+            value = self.codecs.encode(key, value)
+        self._put(key, value)
+
+    def _put(self, key, value):
+        hashed = keccak(key)
+        self.storage.trie[hashed] = value
+        if self.bloom is not None:
+            self.bloom.add(hashed)
 
     def get_storage(self, key):
-        if key in self.storage:
-            return self.storage[key]
-        return b''
+        if self.prefetcher is not None:
+            value = self.prefetcher.get(self.storage.root_hash, key)
+            if value is not None:
+                return value
+        return self.decode_value(self._get(key))
+
+    def _get(self, key):
+        """ The stored form of 'key', b'' if it isn't there """
+        hashed = keccak(key)
+        if self.bloom is not None and hashed not in self.bloom:
+            return b''
+        return self.storage.trie[hashed]
 
     def get_account(self, address):
         validate_address(address)
-        acctbits = self.get_storage(address)
+        if self.prefetcher is not None:
+            acct = self.prefetcher.get_account(self.storage.root_hash, address)
+            if acct is not None:
+                return acct or None
+        acctbits = self._get(address)
         if acctbits:
-            acct = rlp.decode(acctbits, sedes=Account)
-            acct.allow_changes()
-            return acct
+            return self.decode_account(acctbits)
         return None
 
     def update_account(self, acct):
         if acct and isinstance(acct, Account):
-            self.storage[acct.address()] = rlp.encode(acct, sedes=Account)
+            if self.codecs is not None:
+                self._put(acct.address(), self.codecs.encode_account(acct))
+            else:
+                self._put(acct.address(), acct.encode())
 
 class cachedValue(object):
+    __slots__ = ('value', 'dirty')
+
     def __init__(self, value=b'', dirty=False):
         self.dirty = dirty
         self.value = value
@@ -135,17 +227,90 @@ class cachedValue(object):
     def is_dirty(self):
         return self.dirty
 
+# Rough bytes a cache entry takes on top of its key and value: the
+# cachedValue, the dict slot and the key and value objects' headers
+ENTRY_BYTES = sys.getsizeof(cachedValue()) + 2 * sys.getsizeof(b'') + 24
+# ... and an Account on top of its pubkey (the object, its fields and ints)
+ACCOUNT_BYTES = (sys.getsizeof(Account(0, 0, b'')) + sys.getsizeof({}) +
+                 2 * sys.getsizeof(0) + sys.getsizeof(b''))
+
+def _data_bytes(key, value):
+    return ENTRY_BYTES + len(key) + len(value)
+
+def _account_bytes(address, acct):
+    return ENTRY_BYTES + ACCOUNT_BYTES + len(address) + len(acct.pubkey)
+
 class StateCache(object):
-    def __init__(self, stateobj):
+    """ Reads and writes on top of State. With 'max_bytes', unchanged
+    entries are dropped, oldest first, to keep the cache's (approximate)
+    size under it. Changed ones stay until commit, so a block that writes
+    more than that can still go over
+    """
+
+    def __init__(self, stateobj, max_bytes=None):
         self.backend = stateobj
         self.storage_cache = {}
         self.account_cache = {}
+        # nonce of each account when it was loaded from state. Used to rebase
+        # the cache onto the next block
+        self.account_nonces = {}
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        # (is account, key) of the unchanged entries, oldest first. Only
+        # kept with max_bytes
+        self._clean = OrderedDict()
+        # What commit() changed, for the changefeed (None without one)
+        self.changes = None
+
+    def _store(self, cache, key, entry, size):
+        old = cache.get(key)
+        if old is not None:
+            self.bytes -= self._size(cache, key, old)
+        cache[key] = entry
+        self.bytes += size
+        if self.max_bytes is None:
+            return
+        tag = (cache is self.account_cache, key)
+        if entry.dirty:
+            self._clean.pop(tag, None)
+        else:
+            self._clean[tag] = None
+        self._evict()
+
+    def _size(self, cache, key, entry):
+        if cache is self.account_cache:
+            return _account_bytes(key, entry.value)
+        return _data_bytes(key, entry.value)
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._clean:
+            (is_account, key), _ = self._clean.popitem(last=False)
+            cache = self.account_cache if is_account else self.storage_cache
+            self.bytes -= self._size(cache, key, cache.pop(key))
+            if is_account:
+                self.account_nonces.pop(key, None)
+            self.evictions += 1
+
+    def memory(self):
+        """ Approximate memory use of the cache """
+        dirty = sum(1 for c in self.storage_cache.values() if c.dirty)
+        dirty += sum(1 for c in self.account_cache.values() if c.dirty)
+        return {
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'data_entries': len(self.storage_cache),
+            'account_entries': len(self.account_cache),
+            'dirty_entries': dirty,
+            'evictions': self.evictions,
+        }
 
     def put_data(self, key, value):
         if not key:
             raise TypeError("Key cannot be blank")
         validate_is_bytes(value)
-        self.storage_cache[key] = cachedValue(value=value, dirty=True)
+        self._store(self.storage_cache, key, cachedValue(value=value, dirty=True),
+                    _data_bytes(key, value))
 
     def get_data(self, key):
         if key in self.storage_cache:
@@ -154,7 +319,8 @@ class StateCache(object):
         value = self.backend.get_storage(key)
         if value:
             # put in the cache
-            self.storage_cache[key] = cachedValue(value=value)
+            self._store(self.storage_cache, key, cachedValue(value=value),
+                        _data_bytes(key, value))
             return value
         return b''
 
@@ -164,7 +330,9 @@ class StateCache(object):
         # not in cache go to account storage
         acct = self.backend.get_account(address)
         if acct:
-            self.account_cache[address] = cachedValue(value=acct)
+            self.account_nonces[address] = acct.nonce
+            self._store(self.account_cache, address, cachedValue(value=acct),
+                        _account_bytes(address, acct))
             return acct
         return b''
 
@@ -177,29 +345,67 @@ class StateCache(object):
 
     def update_account(self, acct):
         if acct and isinstance(acct, Account):
-            self.account_cache[acct.address()] = cachedValue(value=acct, dirty=True)
+            address = acct.address()
+            self._store(self.account_cache, address, cachedValue(value=acct, dirty=True),
+                        _account_bytes(address, acct))
 
     def commit(self):
+        feed = self.backend.changefeed
+        changes = []
+
         # update storage
         for k1, c1 in self.storage_cache.items():
             if c1.is_dirty():
+                if feed:
+                    changes.append(Change(DATA, k1, self.backend.get_storage(k1), c1.value))
                 self.backend.put_storage(k1, c1.value)
 
-        for _, c2 in self.account_cache.items():
+        for k2, c2 in self.account_cache.items():
             if c2.is_dirty():
+                if feed:
+                    changes.append(Change(
+                        ACCOUNT, k2, self.backend.get_storage(k2), c2.value.encode()))
                 self.backend.update_account(c2.value)
 
+        # Published by Storage.commit() once the state is saved, so the feed
+        # never has a block the state doesn't
+        self.changes = changes if feed else None
         return self.backend.storage.root_hash
 
+    def rebase(self, confirmed, keep=None):
+        """ Returns a new cache over the committed state that keeps the accounts
+        loaded in this one. Accounts in 'confirmed' (the cache the block was
+        delivered to) are taken from there. The rest weren't changed by the
+        block, so they're rolled back to the nonce they were loaded with.
+        Either way, replaying pending txs doesn't have to go to the trie.
+        If given, only the addresses in 'keep' are carried over
+        """
+        rebased = StateCache(self.backend, self.max_bytes)
+        for address, nonce in self.account_nonces.items():
+            if keep is not None and address not in keep:
+                continue
+            if address in confirmed.account_cache:
+                acct = confirmed.account_cache[address].value
+                nonce = acct.nonce
+            else:
+                acct = self.account_cache[address].value
+            rebased.account_nonces[address] = nonce
+            rebased._store(rebased.account_cache, address,
+                           cachedValue(value=Account(nonce, acct.balance, acct.pubkey)),
+                           _account_bytes(address, acct))
+        return rebased
+
 class Storage(object):
     """ Wrapper of state and cache(s) used in the app and passed to handlers.
     commit is called on abci.commit to persist to the apphash and other metadata
     while also resetting the unconfirmed cache
     """
-    def __init__(self, state):
+    def __init__(self, state, max_cache_bytes=None):
         self.state = state
-        self._confirmed = StateCache(state)
-        self._unconfirmed = StateCache(state)
+        # Memory ceiling for each cache. See StateCache
+        self.max_cache_bytes = max_cache_bytes
+        self._confirmed = StateCache(state, max_cache_bytes)
+        self._unconfirmed = StateCache(state, max_cache_bytes)
 
     @property
     def unconfirmed(self):
@@ -209,13 +415,26 @@ class Storage(object):
     def confirmed(self):
         return self._confirmed
 
-    def commit(self):
+    def commit(self, keep=None):
+        """ 'keep' limits the accounts carried over in the unconfirmed
+        cache. See StateCache.rebase()
+        """
         # commit to storage
         self._confirmed.commit()
         # save
         apphash = self.state.save()
-        # reset caches
-        self._unconfirmed = StateCache(self.state)
-        self._confirmed = StateCache(self.state)
+        if self._confirmed.changes is not None:
+            self.state.changefeed.publish(self.state.last_block_height, self._confirmed.changes)
+        # reset caches. Accounts the mempool already loaded are carried over
+        # so rechecks don't start from scratch
+        self._unconfirmed = self._unconfirmed.rebase(self._confirmed, keep)
+        self._confirmed = StateCache(self.state, self.max_cache_bytes)
 
         return apphash
+
+    def memory(self):
+        """ Approximate memory use of both caches. See StateCache.memory() """
+        return {
+            'confirmed': self._confirmed.memory(),
+            'unconfirmed': self._unconfirmed.memory(),
+        }
@@ -1,10 +1,25 @@
 import rlp
 from rlp.sedes import big_endian_int, binary
 
-from .keys import Key
-from .utils import keccak
+from .keys import Key, SIGNATURE_SIZE
+from .codec import Schema
+from .utils import keccak, is_bytes
 
 class Transaction(rlp.Serializable):
+    """ The canonical encoding, the tx hash and the signing hash are computed
+    once and remembered until one of the tx's fields is set again. A decoded
+    tx keeps the bytes it was decoded from.
+
+    'params' can be an rlp.Serializable, a list/tuple, or bytes. Bytes are
+    taken to be params that are already RLP encoded (as they are in a
+    decoded tx). Params are RLP encoded when they're set: changing the
+    object in place afterwards doesn't change the tx, set 'params' again
+
+    The signature comes in two versions, told apart by their length:
+    SIG_COMBINED (libsodium's signed message: signature + signing hash) and
+    the default SIG_DETACHED (just the 64 byte signature). verify() accepts
+    both
+    """
     fields = [
         ('sender', binary),
         ('to', binary),
@@ -25,48 +40,114 @@ class Transaction(rlp.Serializable):
         signature=b'',
         params=b''
     ):
+        self.__dict__['_memo'] = {}
         super().__init__(sender, to, nonce, value, call, signature, params)
 
-    def sign(self, key):
-        if not isinstance(key, Key):
-            raise Exception("Can only sign with a Key object")
+    def __setattr__(self, attr, value):
+        super().__setattr__(attr, value)
+        if attr == 'params':
+            if value and not is_bytes(value):
+                value = rlp.encode(value)
+            self.__dict__['_params_rlp'] = value
+        if attr == 'signature':
+            # The signing hash doesn't cover the signature
+            self._memo.pop('encoded', None)
+            self._memo.pop('hash', None)
+        elif attr in FIELD_NAMES:
+            self.__dict__['_memo'] = {}
 
-        # Local variable to hold params for the signing process
-        original_params = None
+    def _memoized(self, name, compute):
+        if name not in self._memo:
+            self._memo[name] = compute()
+        return self._memo[name]
 
-        # Set sender to signer... no tomfoolery allowed
-        self.sender = key.address()
+    @property
+    def encoded_params(self):
+        """ The params as they're encoded in the tx """
+        # A decoded tx is built without __setattr__. Its params are bytes
+        return self.__dict__.get('_params_rlp', self.params)
 
-        if self.params:
-            # make a copy to reset after signing
-            original_params = self.params
-            self.params = rlp.encode(self.params, sedes=self.params.__class__)
+    def _encode_as(self, schema):
+        values = []
+        for field in schema.names:
+            if field == 'params':
+                values.append(self.encoded_params)
+            else:
+                values.append(getattr(self, field))
+        return schema.encode(values)
+
+    @property
+    def signing_hash(self):
+        """ keccak of the tx without its signature. This is what's signed """
+        return self._memoized(
+            'signing_hash', lambda: keccak(self._encode_as(UNSIGNED_SCHEMA)))
+
+    @property
+    def hash(self):
+        """ keccak of the encoded tx """
+        return self._memoized('hash', lambda: keccak(self.encode()))
 
-        encoded = rlp.encode(self, sedes=UnsignedTransaction)
-        rawhash = keccak(encoded)
-        self.signature = key.sign(rawhash)
+    @property
+    def signature_version(self):
+        """ SIG_DETACHED, SIG_COMBINED, or None if it isn't signed """
+        return SIGNATURE_VERSIONS.get(len(self.signature))
 
-        if original_params:
-            self.params = original_params
+    def sign(self, key, detached=True):
+        if not isinstance(key, Key):
+            raise Exception("Can only sign with a Key object")
 
+        # Set sender to signer... no tomfoolery allowed
+        self.sender = key.address()
+        if detached:
+            self.signature = key.sign_detached(self.signing_hash)
+        else:
+            self.signature = key.sign(self.signing_hash)
         return self
 
+    def verify(self, pubkey):
+        """ True if the tx was signed by 'pubkey' """
+        version = self.signature_version
+        if version == SIG_DETACHED:
+            return Key.verify_detached(pubkey, self.signature, self.signing_hash)
+        if version == SIG_COMBINED:
+            return Key.verify(pubkey, self.signature) == self.signing_hash
+        return False
+
     def encode(self):
-        if self.params:
-            self.params = rlp.encode(self.params)
-        return rlp.encode(self, sedes=Transaction)
+        """ Returns the canonical encoding. Doesn't change the tx """
+        return self._memoized('encoded', lambda: self._encode_as(SCHEMA))
 
     @classmethod
     def decode(cls, bits):
-        return rlp.decode(bits, sedes=cls)
+        bits = bytes(bits)
+        tx = SCHEMA.instantiate(cls, SCHEMA.decode(bits))
+        tx.__dict__['_memo'] = {'encoded': bits}
+        tx.__dict__['_cached_rlp'] = bits
+        return tx
 
     def decode_params(self, dataclz=None):
         if self.params:
+            params = self.encoded_params
             try:
-                return rlp.decode(self.params, sedes=dataclz)
+                return rlp.decode(params, sedes=dataclz)
             except:
                 raise Exception("Can't deserialize params. Are you decoding with the right class")
         # Just being explicit
         return None
 
 UnsignedTransaction = Transaction.exclude(['signature'])
+
+# Signature versions, by length. A combined signature carries the 32 byte
+# signing hash after the signature
+SIG_COMBINED = 1
+SIG_DETACHED = 2
+SIGNATURE_VERSIONS = {
+    SIGNATURE_SIZE + 32: SIG_COMBINED,
+    SIGNATURE_SIZE: SIG_DETACHED,
+}
+
+# Fast codecs for the two encodings. See codec.py
+SCHEMA = Schema(Transaction.fields)
+UNSIGNED_SCHEMA = Schema(UnsignedTransaction.fields)
+
+FIELD_NAMES = frozenset(field for field, _ in Transaction.fields)
@@ -1,11 +1,11 @@
 import os
 import os.path
 from pathlib import Path
+import binascii
 import collections
 
 from math import ceil
 from sha3 import keccak_256
-from rlp.utils import decode_hex, encode_hex
 
 def home_dir(*paths):
     """
@@ -86,6 +86,21 @@ def bytes_to_str(value):
         return value
     return value.decode('utf-8')
 
+# Same as rlp.utils, here so client code doesn't have to import rlp
+def decode_hex(s):
+    if isinstance(s, str):
+        return bytes.fromhex(s)
+    if isinstance(s, bytes):
+        return binascii.unhexlify(s)
+    raise TypeError('Value must be an instance of str or bytes')
+
+def encode_hex(b):
+    if isinstance(b, str):
+        b = bytes(b, 'utf-8')
+    if isinstance(b, bytes):
+        return str(binascii.hexlify(b), 'utf-8')
+    raise TypeError('Value must be an instance of str or bytes')
+
 def remove_0x_head(s):
     return s[2:] if s[:2] in (b'0x', '0x') else s
 
@@ -0,0 +1,131 @@
+"""
+Just enough of the WebSocket protocol (RFC 6455) over asyncio streams to
+talk to Tendermint's /websocket endpoint: the opening handshake, text
+frames, fragmentation, ping/pong and close.
+"""
+import os
+import base64
+import struct
+import hashlib
+import asyncio
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+CONTINUATION = 0x0
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xa
+
+def accept_key(key):
+    """ The Sec-WebSocket-Accept answer to a Sec-WebSocket-Key """
+    digest = hashlib.sha1((key + GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+def encode_frame(opcode, payload, mask=True):
+    """ One final frame. Clients must mask what they send, servers don't """
+    header = bytearray([0x80 | opcode])
+    size = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if size < 126:
+        header.append(mask_bit | size)
+    elif size < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack('>H', size)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('>Q', size)
+    if not mask:
+        return bytes(header) + payload
+    key = os.urandom(4)
+    return bytes(header) + key + _mask(key, payload)
+
+def _mask(key, payload):
+    # XOR with the key repeated over the payload, as one big int
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    masked = int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')
+    return masked.to_bytes(len(payload), 'big')
+
+async def read_frame(reader):
+    """ Returns (final, opcode, payload) for the next frame """
+    b0, b1 = await reader.readexactly(2)
+    size = b1 & 0x7f
+    if size == 126:
+        size = struct.unpack('>H', await reader.readexactly(2))[0]
+    elif size == 127:
+        size = struct.unpack('>Q', await reader.readexactly(8))[0]
+    key = await reader.readexactly(4) if b1 & 0x80 else None
+    payload = await reader.readexactly(size)
+    if key:
+        payload = _mask(key, payload)
+    return bool(b0 & 0x80), b0 & 0x0f, payload
+
+class WebSocket(object):
+    """ A connected WebSocket. 'mask' is True on the client side """
+
+    def __init__(self, reader, writer, mask=True):
+        self.reader = reader
+        self.writer = writer
+        self.mask = mask
+
+    async def send(self, text, opcode=TEXT):
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        self.writer.write(encode_frame(opcode, text, self.mask))
+        await self.writer.drain()
+
+    async def recv(self):
+        """ The next whole text (or binary) message. Answers pings on the
+        way. Raises ConnectionError once the other side closes
+        """
+        parts = []
+        # A fragmented message's type is in its first frame only
+        kind = None
+        while True:
+            final, opcode, payload = await read_frame(self.reader)
+            if opcode == PING:
+                await self.send(payload, PONG)
+                continue
+            if opcode == PONG:
+                continue
+            if opcode == CLOSE:
+                self.close()
+                raise ConnectionResetError("WebSocket closed by peer")
+            if kind is None:
+                kind = opcode
+            parts.append(payload)
+            if final:
+                data = b''.join(parts)
+                return data.decode('utf-8') if kind == TEXT else data
+
+    def close(self):
+        self.writer.close()
+
+async def connect(host, port, path='/websocket', timeout=3):
+    """ Open a WebSocket to ws://host:port/path """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    writer.write((
+        "GET {} HTTP/1.1\r\n"
+        "Host: {}:{}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        "Sec-WebSocket-Key: {}\r\n"
+        "Sec-WebSocket-Version: 13\r\n"
+        "\r\n").format(path, host, port, key).encode('latin-1'))
+
+    status = await asyncio.wait_for(reader.readline(), timeout)
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if status.split()[1:2] != [b'101'] or headers.get('sec-websocket-accept') != accept_key(key):
+        writer.close()
+        raise ConnectionRefusedError("WebSocket handshake with {}:{} failed: {!r}".format(
+            host, port, status))
+    return WebSocket(reader, writer)
@@ -0,0 +1,136 @@
+import json
+import time
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from tendermint import websocket
+
+class StubRpcServer(socketserver.ThreadingMixIn, HTTPServer):
+    """ A local JSON-RPC server standing in for a Tendermint node. Add
+    handlers to 'methods' (name -> callable(*params) returning the result,
+    or raising to send an error). Keeps count of what it was sent
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.port = self.server_address[1]
+        self.methods = {'status': lambda: {'node_info': {'moniker': 'stub'}, 'latest_block_height': 1}}
+        self.calls = []
+        self.posts = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = 0
+        # When set, connections are dropped without an answer
+        self.down = False
+        # When set, sent back (as a 502) instead of a JSON-RPC response, like
+        # a proxy's error page
+        self.error_page = None
+        self.lock = threading.Lock()
+
+    def dispatch(self, request):
+        with self.lock:
+            self.calls.append(request['method'])
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            handler = self.methods.get(request['method'])
+            if handler is None:
+                return {'jsonrpc': '2.0', 'id': request['id'], 'result': None,
+                        'error': 'Method not found'}
+            try:
+                result = handler(*request['params'])
+            except Exception as err:
+                return {'jsonrpc': '2.0', 'id': request['id'], 'result': None, 'error': str(err)}
+            return {'jsonrpc': '2.0', 'id': request['id'], 'result': result, 'error': ''}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.server.down:
+            self.close_connection = True
+            return
+        if self.server.error_page is not None:
+            data = self.server.error_page
+            self.send_response(502)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        request = json.loads(body.decode('utf-8'))
+        with self.server.lock:
+            self.server.posts += 1
+        if isinstance(request, list):
+            # Batch. Answer in reverse to check the client matches on id
+            response = [self.server.dispatch(item) for item in reversed(request)]
+        else:
+            response = self.server.dispatch(request)
+        data = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def make_rpc_server():
+    """ Call to start another StubRpcServer """
+    servers = []
+    def start():
+        server = StubRpcServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def rpc_server(make_rpc_server):
+    return make_rpc_server()
+
+async def _accept_websocket(reader, writer):
+    headers = {}
+    await reader.readline()
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    writer.write((
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        "Sec-WebSocket-Accept: {}\r\n"
+        "\r\n").format(websocket.accept_key(headers['sec-websocket-key'])).encode('latin-1'))
+    await writer.drain()
+    return websocket.WebSocket(reader, writer, mask=False)
+
+@pytest.fixture
+def accept_websocket():
+    """ Server side of the WebSocket handshake: await
+    accept_websocket(reader, writer) for the WebSocket
+    """
+    return _accept_websocket
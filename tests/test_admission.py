@@ -0,0 +1,94 @@
+from abci.messages import to_request_check_tx, to_request_deliver_tx, to_request_commit
+
+from tendermint import TendermintApp, Transaction
+from tendermint.admission import (
+    AdmissionControl,
+    TOO_MANY_PENDING,
+    MEMPOOL_FULL,
+    RATE_LIMITED,
+)
+from tendermint.keys import Key
+from tendermint.accounts import Account
+from tendermint.state import State, StateCache
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def test_token_bucket():
+    clock = Clock()
+    limits = AdmissionControl(rate=2, burst=3, clock=clock)
+    cache = StateCache(State.load_state()[0])
+    assert([None, None, None, RATE_LIMITED] == [limits.check(b'a', 0, cache) for _ in range(4)])
+    # Each sender has its own bucket
+    assert(None == limits.check(b'b', 0, cache))
+
+    clock.now += 0.5
+    assert(None == limits.check(b'a', 0, cache))
+    assert(RATE_LIMITED == limits.check(b'a', 0, cache))
+    assert(2 == limits.rejected[RATE_LIMITED])
+
+    # Full buckets are forgotten
+    clock.now += 10
+    limits.prune()
+    assert({} == limits._buckets)
+
+def test_pending_and_cache_limits():
+    limits = AdmissionControl(max_pending=2, max_accounts=1)
+    cache = StateCache(State.load_state()[0])
+    assert(None == limits.check(b'a', 1, cache))
+    assert(TOO_MANY_PENDING == limits.check(b'a', 2, cache))
+
+    cache.account_cache[b'a'] = None
+    assert(None == limits.check(b'a', 0, cache))
+    assert(MEMPOOL_FULL == limits.check(b'b', 0, cache))
+
+def test_check_tx_limits():
+    keys = [Key.generate() for _ in range(3)]
+    app = TendermintApp("")
+    app.admission = AdmissionControl(max_pending=2, max_accounts=2)
+
+    @app.on_initialize()
+    def create_accts(db):
+        for key in keys:
+            db.update_account(Account.create_account(key.publickey()))
+
+    @app.on_transaction('counter')
+    def count(tx, db):
+        db.increment_nonce(tx.sender)
+        return True
+
+    app.mock_run()
+
+    def signed(key, nonce):
+        t = Transaction()
+        t.nonce = nonce
+        t.call = 'counter'
+        return t.sign(key).encode()
+
+    def check(raw):
+        return app.check_tx(to_request_check_tx(raw)).log
+
+    first = [signed(keys[0], n) for n in range(3)]
+    assert(['', '', TOO_MANY_PENDING] == [check(raw) for raw in first])
+
+    # Turned away before the signature is checked
+    valid = Transaction.decode(first[0])
+    forged = Transaction(sender=valid.sender, nonce=2, call=b'counter', signature=valid.signature)
+    assert(TOO_MANY_PENDING == check(forged.encode()))
+
+    # Room in the cache for one more sender
+    assert('' == check(signed(keys[1], 0)))
+    assert(MEMPOOL_FULL == check(signed(keys[2], 0)))
+
+    # Once the txs are in a block there's room again
+    app.deliver_tx(to_request_deliver_tx(first[0]))
+    app.deliver_tx(to_request_deliver_tx(first[1]))
+    app.commit(to_request_commit())
+    assert('' == check(signed(keys[1], 0)))
+    assert(set([keys[1].address()]) == set(app._storage.unconfirmed.account_cache))
+    assert('' == check(signed(keys[0], 2)))
+    assert(MEMPOOL_FULL == check(signed(keys[2], 0)))
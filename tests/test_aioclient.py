@@ -0,0 +1,102 @@
+import base64
+import asyncio
+import threading
+
+import pytest
+
+from tendermint.client import RpcClient
+from tendermint.aioclient import AsyncRpcClient, TxResult
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+def test_same_methods_as_rpcclient(rpc_server):
+    rpc_server.methods['block'] = lambda height: {'height': height}
+    rpc_server.methods['abci_query'] = lambda path, data, proof: {'path': path, 'data': data}
+
+    async def calls():
+        async with AsyncRpcClient(port=rpc_server.port) as rpc:
+            assert(await rpc.is_connected())
+            assert({'height': 1} == await rpc.get_block())
+            assert({'height': 5} == await rpc.get_block(5))
+            with pytest.raises(ValueError):
+                await rpc.get_block(-1)
+            return await rpc.query('/data', 'count')
+
+    result = run(calls())
+    assert(result == RpcClient(port=rpc_server.port).query('/data', 'count'))
+    assert({'path': '/data', 'data': '636f756e74'} == result)
+
+def test_errors(rpc_server):
+    async def calls():
+        async with AsyncRpcClient(port=rpc_server.port) as rpc:
+            with pytest.raises(ValueError):
+                await rpc.call('nope', [])
+
+        rpc_server.delay = 0.5
+        async with AsyncRpcClient(port=rpc_server.port, timeout=0.1) as rpc:
+            with pytest.raises(IOError):
+                await rpc.status()
+            assert(not await rpc.is_connected())
+
+    run(calls())
+
+def test_keep_alive(rpc_server):
+    async def calls():
+        async with AsyncRpcClient(port=rpc_server.port, pool_size=2) as rpc:
+            for _ in range(10):
+                await rpc.status()
+
+    run(calls())
+    assert(10 == len(rpc_server.calls))
+    assert(1 == rpc_server.connections)
+
+def test_broadcast_many(rpc_server):
+    # Only gets through if 8 requests are in flight at once
+    window_full = threading.Barrier(8, timeout=5)
+
+    def check(tx):
+        window_full.wait()
+        value = int(base64.b64decode(tx))
+        if value == 13:
+            raise Exception('unlucky')
+        return {'code': value % 2, 'data': '', 'log': '', 'hash': ''}
+    rpc_server.methods['broadcast_tx_sync'] = check
+
+    seen = []
+    async def send():
+        async with AsyncRpcClient(port=rpc_server.port, pool_size=8) as rpc:
+            txs = (str(i).encode('utf-8') for i in range(40))
+            return await rpc.broadcast_many(txs, window=8, on_result=seen.append)
+
+    results = run(send())
+    assert(40 == len(results) == len(seen))
+    assert(list(range(40)) == [r.index for r in results])
+    assert(b'3' == results[3].tx)
+    assert(results[2].ok)
+    assert(not results[3].ok and results[3].error is None)
+    assert(isinstance(results[13].error, ValueError))
+
+    assert(8 == rpc_server.max_in_flight)
+    assert(8 == rpc_server.connections)
+
+def test_broadcast_commit_result(rpc_server):
+    rpc_server.methods['broadcast_tx_commit'] = lambda tx: {
+        'check_tx': {}, 'deliver_tx': {'code': 1}, 'hash': '', 'height': 2}
+
+    async def send():
+        async with AsyncRpcClient(port=rpc_server.port) as rpc:
+            with pytest.raises(ValueError):
+                await rpc.broadcast_many([b'a'], mode='fast')
+            return await rpc.broadcast_many([b'a'], mode='commit')
+
+    assert(not run(send())[0].ok)
+
+def test_empty_result_is_not_ok():
+    assert(not TxResult(0, b'a').ok)
+    assert(not TxResult(0, b'a', result=None).ok)
+    assert(TxResult(0, b'a', result={'code': 0}).ok)
@@ -1,3 +1,5 @@
+import os
+
 import pytest
 
 import rlp
@@ -10,7 +12,8 @@ from tendermint import TendermintApp, Transaction
 
 from tendermint.keys import Key
 from tendermint.accounts import Account
-from tendermint.utils import big_endian_to_int, int_to_big_endian
+from tendermint.state import State
+from tendermint.utils import big_endian_to_int, int_to_big_endian, home_dir
 
 bob = Key.generate()
 alice = Key.generate()
@@ -97,3 +100,119 @@ def test_app_api():
 
 
     # Test deliver Tx
+
+def test_recheck_after_commit():
+    app = TendermintApp("")
+
+    @app.on_initialize()
+    def create_accts(db):
+        db.update_account(Account.create_account(bob.publickey()))
+
+    @app.on_transaction('counter')
+    def count(tx, db):
+        db.increment_nonce(tx.sender)
+        return True
+
+    app.mock_run()
+
+    def signed(nonce):
+        t = Transaction()
+        t.nonce = nonce
+        t.call = 'counter'
+        return t.sign(bob).encode()
+
+    raw0, raw1 = signed(0), signed(1)
+    assert(app.check_tx(to_request_check_tx(raw0)).code == 0)
+    assert(app.check_tx(to_request_check_tx(raw1)).code == 0)
+
+    # Only the first one makes it into the block
+    assert(app.deliver_tx(to_request_deliver_tx(raw0)).code == 0)
+    assert(app.commit(to_request_commit()).code == 0)
+
+    # Tendermint rechecks what's left in the mempool
+    assert(app._mempool.is_recheck(raw1))
+    assert(not app._mempool.is_recheck(raw0))
+    resp = app.check_tx(to_request_check_tx(raw1))
+    assert(resp.code == 0)
+    assert(not app._mempool.is_recheck(raw1))
+
+    # Still pending after an empty block
+    app.commit(to_request_commit())
+    resp = app.check_tx(to_request_check_tx(raw1))
+    assert(resp.code == 0)
+
+    # Once it's in a block, it's stale
+    assert(app.deliver_tx(to_request_deliver_tx(raw1)).code == 0)
+    app.commit(to_request_commit())
+    resp = app.check_tx(to_request_check_tx(raw1))
+    assert(resp.log == 'Bad nonce')
+
+    # New txs pick up from the rebased nonce
+    resp = app.check_tx(to_request_check_tx(signed(2)))
+    assert(resp.code == 0)
+
+def test_unconfirmed_cache_drains():
+    keys = [Key.generate() for _ in range(50)]
+    app = TendermintApp("")
+
+    @app.on_initialize()
+    def create_accts(db):
+        for key in keys:
+            db.update_account(Account.create_account(key.publickey()))
+
+    @app.on_transaction('counter')
+    def count(tx, db):
+        db.increment_nonce(tx.sender)
+        return True
+
+    app.mock_run()
+    for key in keys:
+        t = Transaction()
+        t.call = 'counter'
+        raw = t.sign(key).encode()
+        assert(app.check_tx(to_request_check_tx(raw)).code == 0)
+        assert(app.deliver_tx(to_request_deliver_tx(raw)).code == 0)
+    app.commit(to_request_commit())
+
+    # Nothing left to recheck, so no accounts are carried over
+    assert(0 == len(app._mempool.senders()))
+    assert(0 == len(app._storage.unconfirmed.account_cache))
+
+def test_async_commit():
+    def run(dbfile, async_commit):
+        for path in (dbfile, dbfile + '.blocks'):
+            if os.path.exists(path):
+                os.remove(path)
+        app = TendermintApp("")
+        app.async_commit = async_commit
+
+        @app.on_initialize()
+        def create_accts(db):
+            db.update_account(Account.create_account(bob.publickey(), balance=10))
+
+        @app.on_transaction('counter')
+        def count(tx, db):
+            db.put_data(b'count', int_to_big_endian(tx.nonce))
+            return True
+
+        app.mock_run(dbfile)
+        hashes = []
+        for nonce in range(3):
+            t = Transaction()
+            t.nonce = nonce
+            t.call = 'counter'
+            assert(app.deliver_tx(to_request_deliver_tx(t.sign(bob).encode())).code == 0)
+            hashes.append(app.commit(to_request_commit()).data)
+        app._storage.state.close()
+        return hashes
+
+    plain = home_dir('temp', 'app_plain.vdb')
+    journaled = home_dir('temp', 'app_journaled.vdb')
+    assert(run(plain, False) == run(journaled, True))
+
+    # Everything was written by the time it closed
+    state, _ = State.load_state(journaled)
+    assert(2 == big_endian_to_int(state.get_storage(b'count')))
+    state.close()
+    for path in (plain, journaled, journaled + '.blocks'):
+        os.remove(path)
@@ -0,0 +1,125 @@
+import os
+import json
+
+import pytest
+from tendermint import bloom
+from tendermint.bloom import BloomFilter, trie_keys, optimal_size, HEADER
+from tendermint.genesis import load_genesis
+from tendermint.state import State, Storage
+from tendermint.utils import keccak, home_dir
+
+def clean(dbfile):
+    for path in (dbfile, dbfile + '.bloom'):
+        if os.path.exists(path):
+            os.remove(path)
+
+def test_filter():
+    with pytest.raises(ValueError):
+        optimal_size(1000, 1.5)
+
+    f = BloomFilter.for_capacity(1000, 0.01)
+    keys = [keccak('key-{}'.format(i)) for i in range(1000)]
+    for key in keys:
+        f.add(key)
+    assert(all(key in f for key in keys))
+
+    false_positives = sum(1 for i in range(10000) if keccak('other-{}'.format(i)) in f)
+    assert(false_positives < 300)
+    assert(0.005 < f.error_rate < 0.02)
+
+def test_trie_keys():
+    state, _ = State.load_state()
+    keys = ['key-{}'.format(i).encode() for i in range(300)]
+    for key in keys:
+        state.put_storage(key, b'value')
+    assert(set(keccak(k) for k in keys) == set(trie_keys(state.db, state.storage.root_hash)))
+
+    empty, _ = State.load_state()
+    assert([] == list(trie_keys(empty.db, empty.storage.root_hash)))
+
+def test_missing_keys_skip_the_trie():
+    state, _ = State.load_state()
+    for i in range(100):
+        state.put_storage('key-{}'.format(i), b'value')
+    state.use_bloom(capacity=1000, error_rate=0.001)
+
+    reads = []
+    get = state.db.get
+    def counting(key):
+        reads.append(key)
+        return get(key)
+    state.db.get = counting
+
+    for i in range(1000):
+        assert(b'' == state.get_storage('missing-{}'.format(i)))
+    assert(len(reads) < 50)
+
+    # Still finds what's there, including keys added after
+    assert(b'value' == state.get_storage('key-7'))
+    state.put_storage('new', b'x')
+    assert(b'x' == state.get_storage('new'))
+
+def test_saved_with_state(monkeypatch):
+    dbfile = home_dir('temp', 'bloom.vdb')
+    clean(dbfile)
+
+    state, _ = State.load_state(dbfile)
+    state.use_bloom(capacity=1000)
+    storage = Storage(state)
+    for height in range(1, 4):
+        for i in range(50):
+            storage.confirmed.put_data('key-{}-{}'.format(height, i).encode(), b'v')
+        state.last_block_height = height
+        storage.commit()
+    state.close()
+
+    # Loaded from the file, not rebuilt
+    def no_walk(db, root_hash):
+        raise AssertionError("rebuilt")
+    with monkeypatch.context() as m:
+        m.setattr(bloom, 'trie_keys', no_walk)
+        state, _ = State.load_state(dbfile)
+        f = state.use_bloom(capacity=1000)
+    assert(150 == f.count)
+    assert(b'v' == state.get_storage(b'key-2-10'))
+    assert(b'' == state.get_storage(b'key-9-10'))
+
+    # State saved without the filter: it's out of date and is rebuilt
+    state.put_storage(b'added', b'v')
+    state.bloom = None
+    state.save()
+    state.close()
+    state, _ = State.load_state(dbfile)
+    state.use_bloom(capacity=1000)
+    assert(b'v' == state.get_storage(b'added'))
+    state.close()
+
+    # So is a damaged one
+    with open(dbfile + '.bloom', 'r+b') as f:
+        f.seek(100)
+        f.write(b'\xff' * 8)
+    state, _ = State.load_state(dbfile)
+    f = state.use_bloom(capacity=1000)
+    assert(b'\xff' * 8 != bytes(f.bits[100 - HEADER.size:108 - HEADER.size]))
+    assert(b'v' == state.get_storage(b'added'))
+    state.close()
+
+    # And one sized differently
+    state, _ = State.load_state(dbfile)
+    f = state.use_bloom(num_bits=8192, capacity=1000)
+    assert(8192 == f.num_bits and 151 == f.count)
+    state.close()
+    clean(dbfile)
+
+def test_genesis_keys_added():
+    path = home_dir('temp', 'bloom-genesis.jsonl')
+    with open(path, 'w') as f:
+        for i in range(200):
+            f.write(json.dumps({'key': 'key-{}'.format(i), 'value': 'value'}) + '\n')
+
+    state, _ = State.load_state()
+    state.use_bloom(capacity=1000)
+    load_genesis(state, path)
+    assert(200 == state.bloom.count)
+    assert(b'value' == state.get_storage(b'key-150'))
+    os.remove(path)
@@ -0,0 +1,166 @@
+import os
+import time
+import shutil
+import socket
+import threading
+
+from abci.messages import to_request_deliver_tx, to_request_commit
+
+from tendermint import TendermintApp, Transaction
+from tendermint.keys import Key
+from tendermint.accounts import Account
+from tendermint.changefeed import (
+    ChangeFeed, FeedServer, Change, DATA, ACCOUNT, START, read_changes, segments, subscribe)
+from tendermint.state import State, Storage
+from tendermint.utils import home_dir, int_to_big_endian
+
+bob = Key.generate()
+
+def fresh(name):
+    path = home_dir('temp', name)
+    shutil.rmtree(path, ignore_errors=True)
+    return path
+
+def counter_app(feed):
+    app = TendermintApp("")
+
+    @app.on_initialize()
+    def create_accts(db):
+        db.update_account(Account.create_account(bob.publickey()))
+
+    @app.on_transaction('counter')
+    def count(tx, db):
+        db.increment_nonce(tx.sender)
+        db.put_data(b'count', int_to_big_endian(tx.value))
+        return True
+
+    app.changefeed(feed)
+    app.mock_run()
+
+    def block(height, value):
+        app._storage.state.last_block_height = height
+        t = Transaction()
+        t.nonce = height - 1
+        t.value = value
+        t.call = 'counter'
+        assert(app.deliver_tx(to_request_deliver_tx(t.sign(bob).encode())).code == 0)
+        app.commit(to_request_commit())
+    return block
+
+def test_changes_per_block():
+    directory = fresh('feed')
+    feed = ChangeFeed(directory)
+    block = counter_app(feed)
+    block(1, 10)
+    block(2, 20)
+
+    records = list(read_changes(directory))
+    assert([0, 1, 2] == [h for h, _ in records])
+
+    # Genesis created bob
+    (genesis,) = records[0][1]
+    assert(ACCOUNT == genesis.kind and b'' == genesis.old)
+    assert(0 == Account.decode(genesis.new).nonce)
+
+    changes = dict(((c.kind, c.key), c) for c in records[2][1])
+    count = changes[(DATA, b'count')]
+    assert((int_to_big_endian(10), int_to_big_endian(20)) == (count.old, count.new))
+    acct = changes[(ACCOUNT, bob.address())]
+    assert((1, 2) == (Account.decode(acct.old).nonce, Account.decode(acct.new).nonce))
+
+    # Resume part way
+    assert([2] == [h for h, _ in read_changes(directory, start_height=2)])
+    feed.close()
+    shutil.rmtree(directory)
+
+def test_published_after_save():
+    directory = fresh('feed-after-save')
+    feed = ChangeFeed(directory)
+    state, _ = State.load_state()
+    state.changefeed = feed
+    storage = Storage(state)
+    calls = []
+    save = state.save
+    state.save = lambda: calls.append('save') or save()
+    with feed.lock:
+        feed.listen(lambda height, frame: calls.append('publish'))
+
+    storage.confirmed.put_data(b'key', b'value')
+    storage.commit()
+    assert(['save', 'publish'] == calls)
+    assert([[Change(DATA, b'key', b'', b'value')]] == [c for _, c in read_changes(directory)])
+    feed.close()
+    shutil.rmtree(directory)
+
+def test_segments_rotate():
+    directory = fresh('feed-segments')
+    feed = ChangeFeed(directory, segment_bytes=100, keep_segments=3)
+    for height in range(1, 11):
+        feed.publish(height, [Change(DATA, b'key', b'x' * 40, b'y' * 40)])
+    assert([8, 9, 10] == [h for h, _ in segments(directory)])
+    assert([9, 10] == [h for h, _ in read_changes(directory, 9)])
+    feed.close()
+    shutil.rmtree(directory)
+
+def test_feed_server():
+    directory = fresh('feed-server')
+    sock = home_dir('temp', 'feed.sock')
+    feed = ChangeFeed(directory)
+    feed.publish(1, [Change(DATA, b'a', b'', b'1')])
+    server = FeedServer(feed, sock, queue_size=2, block=True, block_timeout=5)
+
+    received = []
+    def follow(start, count):
+        for record in subscribe(sock, start):
+            received.append(record)
+            if len(received) == count:
+                return
+
+    # One from disk, then three live. With a queue of 2 the third publish
+    # waits (a while) for the subscriber
+    follower = threading.Thread(target=follow, args=(0, 4))
+    follower.start()
+    for height in (2, 3, 4):
+        feed.publish(height, [Change(DATA, b'a', str(height - 1).encode(), str(height).encode())])
+    follower.join(5)
+    assert([1, 2, 3, 4] == [h for h, _ in received])
+    assert(Change(DATA, b'a', b'3', b'4') == received[-1][1][0])
+
+    # Resume from a height
+    del received[:]
+    follow(3, 2)
+    assert([3, 4] == [h for h, _ in received])
+
+    server.close()
+    feed.close()
+    shutil.rmtree(directory)
+
+def test_stalled_subscriber_is_dropped():
+    def stall(block):
+        directory = fresh('feed-stalled')
+        sock = home_dir('temp', 'feed-stalled.sock')
+        feed = ChangeFeed(directory)
+        server = FeedServer(feed, sock, queue_size=2, block=block, block_timeout=0.1)
+
+        # Connects, asks for everything, never reads
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(sock)
+        conn.sendall(START.pack(0))
+        while not server._subscribers:
+            time.sleep(0.01)
+
+        started = time.time()
+        for height in range(1, 101):
+            feed.publish(height, [Change(DATA, b'a', b'', b'x' * 65536)])
+        # Commits weren't held up waiting on it
+        assert(time.time() - started < 5)
+        assert(1 == server.dropped)
+        assert([] == server._subscribers)
+
+        conn.close()
+        server.close()
+        feed.close()
+        shutil.rmtree(directory)
+
+    stall(block=False)
+    stall(block=True)
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from tendermint.client import RpcClient, ResultCache
+from tendermint.utils import home_dir
+
+def test_call_batch(rpc_server):
+    rpc_server.methods['block'] = lambda height: {'height': height}
+    rpc = RpcClient(port=rpc_server.port)
+
+    assert([] == rpc.call_batch([]))
+    results = rpc.call_batch([('block', [3]), ('status', []), ('block', [1])])
+    assert({'height': 3} == results[0])
+    assert('stub' == results[1]['node_info']['moniker'])
+    assert({'height': 1} == results[2])
+    assert(1 == rpc_server.posts)
+
+    with pytest.raises(ValueError):
+        rpc.call_batch([('block', [3]), ('nope', [])])
+
+def test_iter_blocks(rpc_server):
+    rpc_server.methods['block'] = lambda height: {'height': height}
+    rpc_server.methods['status'] = lambda: {'node_info': {}, 'latest_block_height': 95}
+    rpc = RpcClient(port=rpc_server.port)
+
+    heights = [b['height'] for b in rpc.iter_blocks(batch_size=20)]
+    assert(list(range(1, 96)) == heights)
+    # status, then 5 batches
+    assert(6 == rpc_server.posts)
+
+    heights = [b['height'] for b in rpc.iter_blocks(10, 12, batch_size=2, prefetch=0)]
+    assert([10, 11, 12] == heights)
+
+    blocks = rpc.iter_blocks(1, 1000, batch_size=10)
+    assert(1 == next(blocks)['height'])
+    blocks.close()
+
+    with pytest.raises(ValueError):
+        next(rpc.iter_blocks(0))
+
+def test_result_cache(rpc_server):
+    rpc_server.methods['block'] = lambda height: {'height': height}
+    rpc_server.methods['commit'] = lambda height: {'height': height, 'canonical': height < 5}
+    rpc_server.methods['genesis'] = lambda: {'chain_id': 'test'}
+    rpc = RpcClient(port=rpc_server.port, cache=ResultCache(max_entries=2))
+
+    assert({'height': 2} == rpc.get_block(2))
+    # A copy each time, safe to change
+    rpc.get_block(2)['height'] = 100
+    assert({'height': 2} == rpc.get_block(2))
+    assert(['block'] == rpc_server.calls)
+
+    # 'latest' always asks for the height
+    rpc.get_block()
+    rpc.get_block()
+    assert(['block', 'status', 'block', 'status'] == rpc_server.calls)
+
+    # Not final yet
+    rpc.get_commit(5)
+    rpc.get_commit(5)
+    assert(2 == rpc_server.calls.count('commit'))
+
+    # Least recently used goes first. Block 2 was pushed out
+    rpc.genesis()
+    rpc.get_block(3)
+    rpc.get_block(2)
+    assert(2 == len(rpc.cache))
+    assert(4 == rpc_server.calls.count('block'))
+
+    # Only the missing ones are sent
+    del rpc_server.calls[:]
+    results = rpc.call_batch([('block', [3]), ('block', [4]), ('block', [2])])
+    assert([3, 4, 2] == [b['height'] for b in results])
+    assert(['block'] == rpc_server.calls)
+
+def test_result_cache_on_disk(rpc_server):
+    rpc_server.methods['block'] = lambda height: {'height': height}
+    path = home_dir('temp', 'rpccache.db')
+    if os.path.exists(path):
+        os.remove(path)
+
+    cache = ResultCache(max_entries=1, path=path)
+    rpc = RpcClient(port=rpc_server.port, cache=cache)
+    for h in range(1, 4):
+        rpc.get_block(h)
+    cache.close()
+
+    cache = ResultCache(path=path)
+    rpc = RpcClient(port=rpc_server.port, cache=cache)
+    assert([1, 2, 3] == [rpc.get_block(h)['height'] for h in range(1, 4)])
+    assert(3 == len(rpc_server.calls))
+    assert(3 == cache.hits)
+    cache.close()
+    os.remove(path)
+
+def test_get_tx(rpc_server):
+    rpc_server.methods['tx'] = lambda txhash, prove: {'hash': txhash, 'proof': prove}
+    rpc = RpcClient(port=rpc_server.port)
+    assert({'hash': 'AQI=', 'proof': False} == rpc.get_tx(b'\x01\x02'))
+    assert({'hash': 'AQI=', 'proof': True} == rpc.get_tx('0x0102', proof=True))
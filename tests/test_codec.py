@@ -0,0 +1,146 @@
+import os
+import random
+
+import pytest
+import rlp
+
+from tendermint.codec import Schema
+from tendermint.accounts import Account
+from tendermint.transactions import Transaction, UnsignedTransaction
+from tendermint.keys import Key
+
+# Differential fuzzing against pyrlp: same bytes out of encode, and decode
+# accepts exactly what rlp.decode accepts, with the same values
+
+SEEDS = range(5)
+ROUNDS = 300
+
+def random_bytes(rng):
+    size = rng.choice([0, 1, 1, 2, 20, 55, 56, 57, 200, 1100])
+    value = bytes(rng.getrandbits(8) for _ in range(size))
+    if size == 1 and rng.random() < 0.5:
+        # single bytes below 0x80 are encoded as themselves
+        value = bytes([rng.getrandbits(7)])
+    return value
+
+def random_int(rng):
+    return rng.choice([0, 1, 127, 128, 255, 256, 2**64, rng.getrandbits(rng.choice([8, 70, 300]))])
+
+def random_tx(rng):
+    return Transaction(
+        random_bytes(rng), random_bytes(rng), random_int(rng), random_int(rng),
+        random_bytes(rng), random_bytes(rng), random_bytes(rng))
+
+def random_account(rng):
+    return Account(random_int(rng), random_int(rng), random_bytes(rng))
+
+def mutate(rng, bits):
+    bits = bytearray(bits)
+    op = rng.choice(['flip', 'insert', 'delete', 'truncate', 'append', 'prefix'])
+    if op == 'flip' and bits:
+        bits[rng.randrange(len(bits))] = rng.getrandbits(8)
+    elif op == 'insert':
+        bits.insert(rng.randrange(len(bits) + 1), rng.getrandbits(8))
+    elif op == 'delete' and bits:
+        del bits[rng.randrange(len(bits))]
+    elif op == 'truncate':
+        bits = bits[:rng.randrange(len(bits) + 1)]
+    elif op == 'append':
+        bits += bytes([rng.getrandbits(8)])
+    elif op == 'prefix' and bits:
+        # mess with the list header, where the interesting checks are
+        bits[0] = rng.choice([0x80, 0xb7, 0xb8, 0xbf, 0xc0, 0xf7, 0xf8, 0xf9, 0xff])
+    return bytes(bits)
+
+def pyrlp_decode(bits, sedes):
+    try:
+        obj = rlp.decode(bits, sedes=sedes)
+    except (rlp.RLPException, TypeError):
+        # big_endian_int raises TypeError for a non-empty list
+        return None
+    return [getattr(obj, name) for name, _ in sedes.fields]
+
+def fast_decode(bits, schema):
+    try:
+        return schema.decode(bits)
+    except rlp.RLPException:
+        return None
+
+def check_decode(bits, sedes, schema):
+    expected = pyrlp_decode(bits, sedes)
+    assert(expected == fast_decode(bits, schema))
+    assert(expected == fast_decode(memoryview(bits), schema))
+    return expected is not None
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_transaction_codec_matches_pyrlp(seed):
+    rng = random.Random(seed)
+    schema = Schema(Transaction.fields)
+    unsigned = Schema(UnsignedTransaction.fields)
+    accepted = rejected = 0
+    for _ in range(ROUNDS):
+        tx = random_tx(rng)
+        values = [getattr(tx, name) for name in schema.names]
+        encoded = rlp.encode(tx, sedes=Transaction)
+        assert(encoded == schema.encode(values))
+        assert(rlp.encode(tx, sedes=UnsignedTransaction) ==
+               unsigned.encode([getattr(tx, name) for name in unsigned.names]))
+
+        assert(check_decode(encoded, Transaction, schema))
+        for _ in range(5):
+            if check_decode(mutate(rng, encoded), Transaction, schema):
+                accepted += 1
+            else:
+                rejected += 1
+    # make sure the mutations exercise both sides
+    assert(accepted and rejected)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_account_codec_matches_pyrlp(seed):
+    rng = random.Random(seed)
+    for _ in range(ROUNDS):
+        acct = random_account(rng)
+        encoded = rlp.encode(acct, sedes=Account)
+        assert(encoded == acct.encode())
+        back = Account.decode(encoded)
+        assert((acct.nonce, acct.balance, acct.pubkey) == (back.nonce, back.balance, back.pubkey))
+        for _ in range(5):
+            check_decode(mutate(rng, encoded), Account, Schema(Account.fields))
+
+def test_random_bytes():
+    rng = random.Random(42)
+    schema = Schema(Account.fields)
+    for _ in range(2000):
+        bits = bytes(rng.getrandbits(8) for _ in range(rng.randrange(12)))
+        check_decode(bits, Account, schema)
+
+def test_encode_errors():
+    schema = Schema(Account.fields)
+    with pytest.raises(rlp.SerializationError):
+        schema.encode((-1, 0, b''))
+    with pytest.raises(rlp.SerializationError):
+        schema.encode(('1', 0, b''))
+    with pytest.raises(rlp.SerializationError):
+        schema.encode((1, 0, 12))
+    # str is utf-8 encoded, as with binary
+    assert(rlp.encode([1, 0, 'dave']) == schema.encode((1, 0, 'dave')))
+
+    with pytest.raises(TypeError):
+        Schema([('x', rlp.sedes.raw)])
+
+def test_decoded_objects_behave_like_pyrlp():
+    bob = Key.generate()
+    t = Transaction(to=b'a' * 20, nonce=5, call=b'call')
+    raw = t.sign(bob).encode()
+
+    tx = Transaction.decode(raw)
+    assert(not tx.is_mutable())
+    with pytest.raises(ValueError):
+        tx.nonce = 1
+    assert(tx == rlp.decode(raw, sedes=Transaction))
+
+    acct = Account.decode(Account.create_account(bob.publickey(), 1, 2).encode())
+    assert(not acct.is_mutable())
+    acct.allow_changes()
+    acct.nonce = 3
+    assert(acct.encode() == rlp.encode(acct, sedes=Account))
@@ -0,0 +1,241 @@
+import os
+import json
+
+import pytest
+from tendermint.encoding import (StateCodecs, Compression, BlobCodec, DICTIONARY_KEY,
+                                 dictionary_id, train_dictionary, encode_account, decode_account)
+from tendermint.migrate import migrate, parse_compression
+from tendermint.genesis import load_genesis
+from tendermint.accounts import Account
+from tendermint.keys import Key
+from tendermint.state import State, Storage
+from tendermint.utils import home_dir
+
+def clean(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def test_account_codec():
+    acct = Account.create_account(Key.generate().publickey(), nonce=7, balance=10 ** 20)
+    packed = encode_account(acct)
+    assert(len(packed) <= len(acct.encode()))
+    back = decode_account(packed)
+    assert((7, 10 ** 20, acct.pubkey) == (back.nonce, back.balance, back.pubkey))
+
+    codecs = StateCodecs('fixed')
+    assert(acct.encode() == codecs.decode(codecs.encode_account(acct)))
+    assert(10 ** 20 == codecs.decode_account(codecs.encode_account(acct)).balance)
+    rlp_codecs = StateCodecs('rlp')
+    assert(7 == rlp_codecs.decode_account(rlp_codecs.encode_account(acct)).nonce)
+
+    with pytest.raises(ValueError):
+        StateCodecs('json')
+
+def test_blob_codec():
+    stored = {}
+    blobs = BlobCodec(stored.get, Compression('zlib', 9))
+    node = b'\xf8' + json.dumps({'name': 'x' * 50, 'tags': ['a'] * 20}).encode()
+    node_key = b'n' * 32
+    packed = blobs.encode(node_key, node)
+    assert(len(packed) < len(node))
+    assert(node == blobs.decode(node_key, packed))
+    # Only trie nodes, and only if that's smaller
+    assert(node == blobs.encode(b'other', node))
+    assert(b'\xc2ab' == blobs.encode(node_key, b'\xc2ab'))
+    assert(b'' == blobs.encode(node_key, b''))
+    # Nodes stored as they are read back as they are
+    assert(node == blobs.decode(node_key, node))
+    # Written with one setting, read with another
+    assert(node == BlobCodec(stored.get).decode(node_key, packed))
+
+def test_dictionary():
+    samples = [json.dumps({'id': i, 'kind': 'order', 'status': 'open'}).encode() for i in range(100)]
+    dictionary = train_dictionary(samples, 1024)
+    assert(0 < len(dictionary) <= 1024)
+    stored = {DICTIONARY_KEY + dictionary_id(dictionary): dictionary}
+    plain = BlobCodec(stored.get, Compression('zlib'))
+    trained = BlobCodec(stored.get, Compression('zlib', dictionary=dictionary))
+    key = b'k' * 32
+    value = b'\xf8' + json.dumps({'id': 5000, 'kind': 'order', 'status': 'open'}).encode()
+    assert(value == trained.decode(key, trained.encode(key, value)))
+    assert(len(trained.encode(key, value)) < len(plain.encode(key, value)))
+    # The dictionary has to be there to read
+    with pytest.raises(IOError):
+        BlobCodec({}.get).decode(key, trained.encode(key, value))
+
+def test_zstd():
+    pytest.importorskip('zstandard')
+    blobs = BlobCodec({}.get, Compression('zstd', 3))
+    key = b'k' * 32
+    value = b'\xf8' + b'abc' * 100
+    stored = blobs.encode(key, value)
+    assert(len(stored) < len(value))
+    assert(value == blobs.decode(key, stored))
+
+def fill(state, bob):
+    storage = Storage(state)
+    for i in range(50):
+        storage.confirmed.put_data('doc:{}'.format(i).encode(), json.dumps({'id': i, 'body': 'text ' * 20}).encode())
+    storage.confirmed.update_account(Account.create_account(bob.publickey(), balance=50))
+    storage.commit()
+    return state.storage.root_hash
+
+def test_compression_is_below_the_hash():
+    plain_file = home_dir('temp', 'blobs_plain.vdb')
+    dbfile = home_dir('temp', 'blobs.vdb')
+    clean(plain_file, dbfile)
+    bob = Key.generate()
+    dictionary = train_dictionary([b'{"id": 1, "body": "text text text"}'] * 10)
+
+    plain, _ = State.load_state(plain_file)
+    expected = fill(plain, bob)
+    plain_size = sum(len(v) for _, v in plain.db.db.execute("SELECT k, v FROM blobkey"))
+    plain.close()
+
+    state, _ = State.load_state(dbfile)
+    state.db.use_compression(Compression('zlib', 9, dictionary))
+    assert(expected == fill(state, bob))
+    size = sum(len(v) for _, v in state.db.db.execute("SELECT k, v FROM blobkey"))
+    assert(size < plain_size)
+    state.close()
+
+    # Dictionaries come back from the db, and compression can change
+    state, _ = State.load_state(dbfile)
+    assert(b'{"id": 3, "body": "' + b'text ' * 20 + b'"}' == state.get_storage(b'doc:3'))
+    assert(50 == state.get_account(bob.address()).balance)
+    state.db.use_compression(None)
+    storage = Storage(state)
+    storage.confirmed.put_data(b'doc:3', b'changed')
+    storage.commit()
+    assert(b'changed' == state.get_storage(b'doc:3'))
+    state.close()
+    clean(plain_file, dbfile)
+
+def test_journaled_compression():
+    dbfile = home_dir('temp', 'blobs_journaled.vdb')
+    clean(dbfile, dbfile + '.blocks')
+    bob = Key.generate()
+    expected = fill(State.load_state()[0], bob)
+
+    state, _ = State.load_state(dbfile, journal=True)
+    state.db.use_compression(Compression('zlib'))
+    assert(expected == fill(state, bob))
+    state.save()
+    state.close()
+
+    state, _ = State.load_state(dbfile)
+    assert(50 == state.get_account(bob.address()).balance)
+    state.close()
+    clean(dbfile, dbfile + '.blocks')
+
+def test_state_with_codecs():
+    dbfile = home_dir('temp', 'codecs.vdb')
+    clean(dbfile)
+    bob = Key.generate()
+    codecs = StateCodecs('fixed')
+
+    state, _ = State.load_state(dbfile)
+    state.use_codecs(codecs)
+    storage = Storage(state)
+    storage.confirmed.put_data(b'doc:1', b'doc-' + b'y' * 40)
+    storage.confirmed.put_data(b'plain', b'value')
+    storage.confirmed.update_account(Account.create_account(bob.publickey(), balance=50))
+    storage.commit()
+    state.close()
+
+    # Settings and dictionaries come back from the db
+    state, _ = State.load_state(dbfile)
+    assert(codecs == state.codecs)
+    assert(b'doc-' + b'y' * 40 == state.get_storage(b'doc:1'))
+    assert(b'value' == state.get_storage(b'plain'))
+    assert(b'' == state.get_storage(b'missing'))
+    assert(50 == state.get_account(bob.address()).balance)
+
+    # Fixed for the life of the state
+    state.use_codecs(codecs)
+    with pytest.raises(TypeError):
+        state.use_codecs(StateCodecs('rlp'))
+    state.close()
+
+    legacy, _ = State.load_state()
+    legacy.put_storage(b'a', b'b')
+    with pytest.raises(TypeError):
+        legacy.use_codecs(StateCodecs())
+    clean(dbfile)
+
+def test_genesis_with_codecs():
+    dbfile = home_dir('temp', 'codecs_genesis.vdb')
+    path = home_dir('temp', 'codecs_genesis.jsonl')
+    clean(dbfile, path)
+    bob = Key.generate()
+    with open(path, 'w') as f:
+        f.write(json.dumps({'pubkey': bob.publickey(tohex=True), 'balance': 9}) + '\n')
+        f.write(json.dumps({'key': 'doc:1', 'value': 'z' * 100}) + '\n')
+
+    state, _ = State.load_state(dbfile)
+    state.use_codecs(StateCodecs())
+    state.db.use_compression(Compression('zlib'))
+    load_genesis(state, path)
+    assert(9 == state.get_account(bob.address()).balance)
+    assert(b'z' * 100 == state.get_storage(b'doc:1'))
+    state.close()
+    clean(dbfile, path)
+
+def test_migrate():
+    src = home_dir('temp', 'migrate_src.vdb')
+    dst = home_dir('temp', 'migrate_dst.vdb')
+    clean(src, dst)
+    keys = [Key.generate() for _ in range(20)]
+    docs = {'doc:{}'.format(i).encode(): json.dumps({'id': i, 'body': 'text ' * 20}).encode()
+            for i in range(200)}
+
+    state, _ = State.load_state(src)
+    storage = Storage(state)
+    for key in keys:
+        storage.confirmed.update_account(Account.create_account(key.publickey(), nonce=1, balance=1000))
+    for k, v in docs.items():
+        storage.confirmed.put_data(k, v)
+    storage.confirmed.put_data(b'other', b'x')
+    state.chain_id = b'test-chain'
+    state.last_block_height = 2
+    storage.commit()
+    before = state.storage.root_hash
+    state.close()
+
+    # Compression alone keeps the app hash
+    stats = migrate(src, dst, compression=Compression('zlib'), train_size=2048)
+    assert(221 == stats['values'])
+    assert(20 == stats['accounts'])
+    assert(stats['file_after'] < stats['file_before'])
+    assert(before.hex() == stats['apphash_before'] == stats['apphash_after'])
+    clean(dst)
+
+    # A new account layout gives a new one
+    codecs = StateCodecs('fixed')
+    stats = migrate(src, dst, codecs, Compression('zlib'))
+    assert(stats['apphash_before'] != stats['apphash_after'])
+
+    migrated, _ = State.load_state(dst)
+    assert(codecs == migrated.codecs)
+    assert(b'test-chain' == migrated.chain_id)
+    assert(2 == migrated.last_block_height)
+    for k, v in docs.items():
+        assert(v == migrated.get_storage(k))
+    assert(b'x' == migrated.get_storage(b'other'))
+    for key in keys:
+        acct = migrated.get_account(key.address())
+        assert((1, 1000) == (acct.nonce, acct.balance))
+    migrated.close()
+
+    # The source is left alone, and the target must be new
+    with pytest.raises(IOError):
+        migrate(src, dst, StateCodecs())
+    clean(src, dst)
+
+def test_parse_compression():
+    zlib9 = parse_compression('zlib:9')
+    assert(('zlib', 9) == (zlib9.method, zlib9.level))
+    assert(6 == parse_compression('zlib').level)
+    with pytest.raises(ValueError):
+        parse_compression('lz4')
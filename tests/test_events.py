@@ -0,0 +1,218 @@
+import re
+import json
+import asyncio
+
+from tendermint.events import EventClient
+
+class StubNode(object):
+    """ Just enough of Tendermint's /websocket to test against """
+
+    def __init__(self, accept):
+        self.accept = accept
+        self.height = 0
+        self.txs = []
+        self.sockets = {}
+        self.server = None
+        # Methods that answer with an error, e.g. pruned blocks
+        self.failing = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    def block(self, height):
+        return {'block': {'header': {'height': str(height)}}}
+
+    async def handle(self, reader, writer):
+        ws = await self.accept(reader, writer)
+        self.sockets[ws] = []
+        try:
+            while True:
+                msg = json.loads(await ws.recv())
+                method, params = msg['method'], msg['params']
+                if method == 'subscribe':
+                    self.sockets[ws].append(params[0])
+                    result = {}
+                elif method == 'status':
+                    result = {'sync_info': {'latest_block_height': str(self.height)}}
+                elif method == 'block':
+                    result = self.block(params[0])
+                elif method == 'tx_search':
+                    low = int(re.search(r'tx.height>=(\d+)', params[0]).group(1))
+                    high = int(re.search(r'tx.height<=(\d+)', params[0]).group(1))
+                    txs = [t for t in self.txs if low <= t['height'] <= high]
+                    result = {'txs': [dict(t, height=str(t['height'])) for t in txs],
+                              'total_count': str(len(txs))}
+                if method in self.failing:
+                    await ws.send(json.dumps({'jsonrpc': '2.0', 'id': msg['id'],
+                                              'error': {'code': -32603, 'message': 'unavailable'}}))
+                    continue
+                await ws.send(json.dumps({'jsonrpc': '2.0', 'id': msg['id'], 'result': result}))
+        except (IOError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.sockets.pop(ws, None)
+
+    async def publish(self, kind, value):
+        for ws, queries in list(self.sockets.items()):
+            for query in queries:
+                if "'{}'".format(kind) in query:
+                    await ws.send(json.dumps({'jsonrpc': '2.0', 'id': '0#event', 'result': {
+                        'query': query,
+                        'data': {'type': 'tendermint/event/' + kind, 'value': value}}}))
+
+    async def new_block(self, txs=0):
+        self.height += 1
+        for index in range(txs):
+            tx = {'height': self.height, 'index': index, 'tx': 'dHg=', 'tx_result': {}}
+            self.txs.append(tx)
+            await self.publish('Tx', {'TxResult': {
+                'height': str(self.height), 'index': index, 'tx': 'dHg=', 'result': {}}})
+        await self.publish('NewBlock', self.block(self.height))
+
+    def drop(self):
+        for ws in list(self.sockets):
+            ws.close()
+
+async def until(condition, timeout=3):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Timed out")
+
+def test_subscribe_reconnect_and_backfill(accept_websocket):
+    node = StubNode(accept_websocket)
+    seen = []
+
+    async def scenario():
+        port = await node.start()
+        events = EventClient(port=port, reconnect_delay=0.1)
+        await events.subscribe("tm.event='NewBlock'")
+        await events.subscribe("tm.event='Tx'")
+        follower = asyncio.ensure_future(events.run(seen.append))
+
+        await until(lambda: sum(len(q) for q in node.sockets.values()) == 2)
+        await node.new_block()
+        await node.new_block(txs=2)
+        await until(lambda: len(seen) == 4)
+
+        # Goes away for a few blocks
+        node.drop()
+        node.height += 3
+        node.txs.append({'height': 4, 'index': 0, 'tx': 'dHg=', 'tx_result': {}})
+        await until(lambda: len(seen) == 8)
+
+        await node.new_block(txs=1)
+        await until(lambda: len(seen) == 10)
+        events.close()
+        await follower
+        node.server.close()
+        return events
+
+    loop = asyncio.new_event_loop()
+    try:
+        events = loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+
+    blocks = [e.height for e in seen if e.type == 'NewBlock']
+    txs = [e.position for e in seen if e.type == 'Tx']
+    assert([1, 2, 3, 4, 5, 6] == blocks)
+    assert([(2, 0), (2, 1), (4, 0), (6, 0)] == txs)
+    assert(1 == events.reconnects)
+    assert({'header': {'height': '4'}} == [e for e in seen if e.height == 4 and e.type == 'NewBlock'][0].data['block'])
+
+def run_scenario(scenario):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+
+def test_long_backfill_in_batches(accept_websocket):
+    node = StubNode(accept_websocket)
+    seen = []
+
+    async def scenario():
+        port = await node.start()
+        events = EventClient(port=port, reconnect_delay=0.1)
+        await events.subscribe("tm.event='NewBlock'")
+        follower = asyncio.ensure_future(events.run(seen.append))
+        await until(lambda: sum(len(q) for q in node.sockets.values()) == 1)
+        await node.new_block()
+        await until(lambda: len(seen) == 1)
+
+        node.drop()
+        node.height += 45
+        await until(lambda: len(seen) == 46)
+        events.close()
+        await follower
+        node.server.close()
+
+    run_scenario(scenario)
+    assert(list(range(1, 47)) == [e.height for e in seen])
+
+def test_backfill_errors_are_skipped(accept_websocket):
+    node = StubNode(accept_websocket)
+    seen = []
+
+    async def scenario():
+        port = await node.start()
+        events = EventClient(port=port, reconnect_delay=0.1)
+        await events.subscribe("tm.event='NewBlock'")
+        await events.subscribe("tm.event='Tx'")
+        follower = asyncio.ensure_future(events.run(seen.append))
+        await until(lambda: sum(len(q) for q in node.sockets.values()) == 2)
+        await node.new_block(txs=1)
+        await until(lambda: len(seen) == 2)
+
+        # Missed blocks are pruned and the tx index is off
+        node.failing = {'block', 'tx_search'}
+        node.drop()
+        node.height += 3
+        await until(lambda: events.reconnects == 1 and
+                    sum(len(q) for q in node.sockets.values()) == 2)
+
+        # Live events still come through
+        await node.new_block(txs=1)
+        await until(lambda: len(seen) == 4)
+        events.close()
+        await follower
+        node.server.close()
+        return events
+
+    events = run_scenario(scenario)
+    assert([(1, 'Tx'), (1, 'NewBlock'), (5, 'Tx'), (5, 'NewBlock')] == [(e.height, e.type) for e in seen])
+    assert(1 == events.reconnects)
+
+def test_backfill_error_skips_one_query(accept_websocket):
+    node = StubNode(accept_websocket)
+    seen = []
+
+    async def scenario():
+        port = await node.start()
+        events = EventClient(port=port, reconnect_delay=0.1)
+        await events.subscribe("tm.event='NewBlock'")
+        await events.subscribe("tm.event='Tx'")
+        follower = asyncio.ensure_future(events.run(seen.append))
+        await until(lambda: sum(len(q) for q in node.sockets.values()) == 2)
+        await node.new_block(txs=1)
+        await until(lambda: len(seen) == 2)
+
+        # Missed blocks are pruned, but the tx index still has their txs
+        node.failing = {'block'}
+        node.drop()
+        node.height += 3
+        node.txs.append({'height': 3, 'index': 0, 'tx': 'dHg=', 'tx_result': {}})
+        await until(lambda: len(seen) == 3)
+
+        await node.new_block(txs=1)
+        await until(lambda: len(seen) == 5)
+        events.close()
+        await follower
+        node.server.close()
+
+    run_scenario(scenario)
+    assert([(1, 'Tx'), (1, 'NewBlock'), (3, 'Tx'), (5, 'Tx'), (5, 'NewBlock')] ==
+           [(e.height, e.type) for e in seen])
@@ -0,0 +1,102 @@
+import os
+import json
+import random
+
+import pytest
+import rlp
+
+from tendermint.keys import Key
+from tendermint.accounts import Account
+from tendermint.state import State
+from tendermint.genesis import load_genesis, sorted_by_trie_key, TrieBuilder
+from tendermint.utils import home_dir, keccak
+
+def write_jsonl(path, records):
+    with open(path, 'w') as f:
+        for r in records:
+            f.write(json.dumps(r) + '\n')
+
+def test_builder_matches_trie():
+    rng = random.Random(7)
+    for size in [1, 2, 3, 17, 300, 2000]:
+        items = {}
+        for i in range(size):
+            items[keccak(str(rng.random()))] = os.urandom(rng.choice([1, 5, 40]))
+
+        st,_ = State.load_state('')
+        for k, v in items.items():
+            st.storage.trie[k] = v
+
+        st2,_ = State.load_state('')
+        root = TrieBuilder(st2.db).build(sorted(items.items()))
+        assert(st.storage.root_hash == root)
+
+        # Every node the trie needs is in the db
+        st2.storage.trie.root_hash = root
+        for k, v in items.items():
+            assert(v == st2.storage.trie[k])
+
+def test_sort_last_value_wins():
+    records = [(b'a', b'1'), (b'b', b'2'), (b'a', b'3'), (b'c', b'4')]
+    ordered = list(sorted_by_trie_key(iter(records), chunk_size=2))
+    assert(3 == len(ordered))
+    assert([k for k, _ in ordered] == sorted(keccak(k) for k in [b'a', b'b', b'c']))
+    assert(b'3' == dict(ordered)[keccak(b'a')])
+
+def test_load_genesis():
+    keys = [Key.generate() for _ in range(50)]
+    records = [{'pubkey': k.publickey(tohex=True), 'balance': i} for i, k in enumerate(keys)]
+    records.append({'key': 'name', 'value': 'dave'})
+    records.append({'key': 'count', 'value': '0x0a'})
+
+    src = home_dir('temp', 'genesis.jsonl')
+    write_jsonl(src, records)
+
+    # Same state as adding them one at a time
+    expected,_ = State.load_state('')
+    for i, k in enumerate(keys):
+        expected.update_account(Account.create_account(k.publickey(), balance=i))
+    expected.put_storage(b'name', b'dave')
+    expected.put_storage(b'count', b'\x0a')
+
+    dbfile = home_dir('temp', 'genesis.db')
+    if os.path.exists(dbfile):
+        os.remove(dbfile)
+    state,_ = State.load_state(dbfile)
+    seen = []
+    root = load_genesis(state, src, chunk_size=16, batch_size=10,
+                        progress=lambda stage, n: seen.append((stage, n)))
+    assert(expected.storage.root_hash == root)
+    assert(('sorted', 52) in seen)
+    assert(('loaded', 52) == seen[-1])
+    state.save()
+    state.close()
+
+    # Survives a reload
+    state2,_ = State.load_state(dbfile)
+    assert(root == state2.storage.root_hash)
+    assert(7 == state2.get_account(keys[7].address()).balance)
+    assert(b'dave' == state2.get_storage(b'name'))
+
+    # Only into empty state
+    with pytest.raises(TypeError):
+        load_genesis(state2, src)
+    state2.close()
+
+    os.remove(dbfile)
+    os.remove(src)
+
+def test_load_genesis_csv():
+    bob = Key.generate()
+    src = home_dir('temp', 'genesis.csv')
+    with open(src, 'w') as f:
+        f.write('pubkey,balance,nonce,key,value\n')
+        f.write('{},100,2,,\n'.format(bob.publickey(tohex=True)))
+        f.write(',,,name,dave\n')
+
+    state,_ = State.load_state('')
+    load_genesis(state, src)
+    assert(100 == state.get_account(bob.address()).balance)
+    assert(2 == state.get_account(bob.address()).nonce)
+    assert(b'dave' == state.get_storage(b'name'))
+    os.remove(src)
@@ -0,0 +1,26 @@
+import sys
+import json
+import subprocess
+
+SERVER_DEPS = ['abci', 'google.protobuf', 'gevent', 'colorlog', 'trie']
+
+def loaded_after(code):
+    probe = code + "\nimport sys, json\nprint(json.dumps(sorted(sys.modules)))"
+    out = subprocess.check_output([sys.executable, '-c', probe])
+    return set(json.loads(out.decode('utf-8')))
+
+def test_client_imports_are_light():
+    loaded = loaded_after(
+        "import tendermint\n"
+        "from tendermint.client import RpcClient\n"
+        "from tendermint import Transaction")
+    for dep in SERVER_DEPS:
+        assert(dep not in loaded)
+
+def test_server_loads_on_demand():
+    loaded = loaded_after("import tendermint\ntendermint.TendermintApp")
+    assert('abci' in loaded)
+
+    from tendermint.server import TendermintApp
+    import tendermint
+    assert(tendermint.TendermintApp is TendermintApp)
@@ -0,0 +1,76 @@
+import os
+import base64
+
+from tendermint.keys import Key
+from tendermint.client import RpcClient
+from tendermint.indexer import TxIndex, Indexer, tendermint_hash, go_wire_bytes
+from tendermint.transactions import Transaction
+from tendermint.utils import home_dir
+
+bob = Key.generate()
+alice = Key.generate()
+
+def chain(rpc_server, blocks):
+    """ Serve 'blocks' (lists of raw txs, from height 1) from the stub """
+    def block(height):
+        txs = [base64.b64encode(raw).decode('utf-8') for raw in blocks[height - 1]]
+        return {'block': {'header': {'height': height}, 'data': {'txs': txs or None}}}
+    rpc_server.methods['block'] = block
+    rpc_server.methods['status'] = lambda: {'node_info': {}, 'latest_block_height': len(blocks)}
+
+def send(key, to, nonce, call='transfer', value=1):
+    t = Transaction()
+    t.to = to.address()
+    t.nonce = nonce
+    t.call = call
+    t.value = value
+    return t.sign(key).encode()
+
+def test_index_and_lookup(rpc_server):
+    path = home_dir('temp', 'txindex.db')
+    if os.path.exists(path):
+        os.remove(path)
+
+    blocks = [[send(bob, alice, n) for n in range(3)], [], [b'not a tx', send(alice, bob, 0, 'mint')]]
+    chain(rpc_server, blocks)
+    index = TxIndex(path)
+    indexer = Indexer(RpcClient(port=rpc_server.port), index, batch_blocks=2)
+
+    heights = []
+    assert(4 == indexer.sync(progress=lambda h, n: heights.append(h)))
+    assert([2, 3] == heights)
+    assert(3 == index.last_height)
+
+    raw = blocks[0][1]
+    tx = Transaction.decode(raw)
+    found = index.get(tx.hash)
+    assert((1, 1) == found.position)
+    assert(bob.address() == found.sender)
+    assert(found.tx.verify(bob.publickey()))
+    assert((1, 1) == index.get(tendermint_hash(raw)).position)
+    assert(index.get(b'nope') is None)
+
+    # Newest first, in pages
+    page = index.history(bob.address(), limit=2)
+    assert([(3, 1), (1, 2)] == [t.position for t in page])
+    page = index.history(bob.address(), limit=2, before=page[-1].position)
+    assert([(1, 1), (1, 0)] == [t.position for t in page])
+    assert(['mint'] == [t.call for t in index.by_call('mint')])
+
+    # Picks up where it left off
+    blocks.append([send(bob, alice, 3)])
+    del rpc_server.calls[:]
+    assert(1 == indexer.sync())
+    assert(['status', 'block'] == rpc_server.calls)
+    assert(0 == indexer.sync())
+
+    index.close()
+    assert(4 == TxIndex(path).last_height)
+    os.remove(path)
+
+def test_tendermint_hash():
+    assert(b'\x00' == go_wire_bytes(b''))
+    assert(b'\x01\x03abc' == go_wire_bytes(b'abc'))
+    assert(b'\x02\x01\x2c' == go_wire_bytes(b'x' * 300)[:3])
+    # RIPEMD160 of 0x0103616263
+    assert('da44ac54026d23b3706243882f4ddf7dec725c4f' == tendermint_hash(b'abc').hex())
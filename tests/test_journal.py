@@ -0,0 +1,125 @@
+import os
+
+from tendermint.db import VanillaDB
+from tendermint.journal import JournaledDB, BlockJournal, encode_record
+from tendermint.state import State, Storage
+from tendermint.utils import home_dir
+
+def clean(dbfile):
+    for path in (dbfile, dbfile + '.blocks'):
+        if os.path.exists(path):
+            os.remove(path)
+
+def run_blocks(dbfile, journal, blocks=5):
+    state, _ = State.load_state(dbfile, journal=journal)
+    storage = Storage(state)
+    hashes = []
+    for height in range(1, blocks + 1):
+        for i in range(20):
+            storage.confirmed.put_data('key-{}-{}'.format(height, i).encode(), b'value' * height)
+        state.last_block_height = height
+        hashes.append(storage.commit())
+    # Reads see writes that may not be flushed yet
+    assert(b'value' * blocks == storage.confirmed.get_data('key-{}-0'.format(blocks).encode()))
+    return state, hashes
+
+def test_same_state_as_writing_directly():
+    plain = home_dir('temp', 'plain.vdb')
+    journaled = home_dir('temp', 'journaled.vdb')
+    clean(plain)
+    clean(journaled)
+
+    state, expected = run_blocks(plain, journal=False)
+    state.close()
+    state, hashes = run_blocks(journaled, journal=True)
+    assert(expected == hashes)
+    state.db.wait()
+    assert(5 == state.db.flushed_height)
+    assert(0 == os.path.getsize(journaled + '.blocks'))
+    state.close()
+
+    # Everything made it to SQLite
+    state, is_new = State.load_state(journaled)
+    assert(not is_new)
+    assert(5 == state.last_block_height)
+    assert(expected[-1] == state.last_block_hash)
+    assert(b'value' * 3 == state.get_storage(b'key-3-7'))
+    state.close()
+
+    clean(plain)
+    clean(journaled)
+
+def test_recovery_replays_whole_blocks():
+    dbfile = home_dir('temp', 'recover.vdb')
+    clean(dbfile)
+    VanillaDB(dbfile).close()
+
+    # As left by a crash: two whole blocks and half of a third
+    journal = BlockJournal(dbfile + '.blocks')
+    journal.append(1, [(b'a', b'1'), (b'b', b'1')])
+    journal.append(2, [(b'a', b'2'), (b'b', None)])
+    journal.file.write(encode_record(3, [(b'a', b'3')])[:-1])
+    journal.close()
+
+    records, valid = BlockJournal.read(dbfile + '.blocks')
+    assert([1, 2] == [h for h, _ in records])
+
+    db = JournaledDB(dbfile)
+    assert(2 == db.replayed)
+    assert(b'2' == db.get(b'a'))
+    assert(db.get(b'b') is None)
+    assert(0 == os.path.getsize(dbfile + '.blocks'))
+
+    # Later writes are journaled, then flushed
+    db.set(b'c', b'3')
+    assert(b'3' == db.get(b'c'))
+    db.commit_block(3)
+    db.delete(b'c')
+    db.commit_block(4)
+    db.wait()
+    assert(2 == db.flushed)
+    db.close()
+
+    db = VanillaDB(dbfile)
+    assert(b'2' == db.get(b'a'))
+    assert(db.get(b'c') is None)
+    db.close()
+    clean(dbfile)
+
+def test_flushed_records_are_cut_off():
+    dbfile = home_dir('temp', 'journal_behind.vdb')
+    clean(dbfile)
+    db = JournaledDB(dbfile)
+    # Stop the flusher, so blocks are flushed here, a few at a time
+    db._queue.put(None)
+    db._flusher.join()
+    for height in range(1, 6):
+        db.set('key-{}'.format(height).encode(), b'value' * 10)
+        db.commit_block(height)
+    blocks = [db._queue.get() for _ in range(5)]
+
+    flusher = VanillaDB(dbfile)
+    db._flush(flusher, blocks[:1])
+    # Less flushed than left: the journal stays as it is
+    assert([1, 2, 3, 4, 5] == [h for h, _ in BlockJournal.read(db.journal_path)[0]])
+    db._flush(flusher, blocks[1:3])
+    assert([4, 5] == [h for h, _ in BlockJournal.read(db.journal_path)[0]])
+
+    # Appends carry on after the cut
+    db.set(b'key-6', b'value')
+    db.commit_block(6)
+    blocks.append(db._queue.get())
+    db.journal.file.flush()
+    assert([4, 5, 6] == [h for h, _ in BlockJournal.read(db.journal_path)[0]])
+    db._flush(flusher, blocks[3:5])
+    assert([6] == [h for h, _ in BlockJournal.read(db.journal_path)[0]])
+    flusher.close()
+    db.journal.close()
+    db.db.close()
+
+    # What wasn't flushed is replayed
+    db = JournaledDB(dbfile)
+    assert(1 == db.replayed)
+    assert(b'value' == db.get(b'key-6'))
+    db.close()
+    clean(dbfile)
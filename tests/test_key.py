@@ -52,3 +52,35 @@ def test_signing():
     # Test create_address
     addy2 = create_address(bob.publickey(tohex=True))
     assert(addy2 == bob.address())
+
+def test_detached_signing():
+    bob = Key.generate()
+    alice = Key.generate()
+    msg = keccak(b'hello')
+
+    sig = bob.sign_detached(msg)
+    assert(nacl.bindings.crypto_sign_BYTES == len(sig))
+    assert(bob.sign(msg)[:64] == sig)
+
+    assert(Key.verify_detached(bob.publickey(), sig, msg))
+    assert(Key.verify_detached(bob.publickey(tohex=True), sig, msg))
+    assert(not Key.verify_detached(alice.publickey(), sig, msg))
+    assert(not Key.verify_detached(bob.publickey(), sig, keccak(b'bye')))
+    assert(not Key.verify_detached(bob.publickey(), sig[:-1], msg))
+    assert(not Key.verify_detached(bob.publickey()[:-1], sig, msg))
+
+def test_detached_fallback(monkeypatch):
+    import tendermint.keys
+    bob = Key.generate()
+    msg = keccak(b'hello')
+    # libsodium's crypto_sign_detached, called directly
+    assert(tendermint.keys._sign_detached is not None)
+    direct = bob.sign_detached(msg)
+
+    monkeypatch.setattr(tendermint.keys, '_verify_detached', None)
+    monkeypatch.setattr(tendermint.keys, '_sign_detached', None)
+    sig = bob.sign_detached(msg)
+    # Ed25519 signatures are deterministic
+    assert(direct == sig)
+    assert(Key.verify_detached(bob.publickey(), sig, msg))
+    assert(not Key.verify_detached(bob.publickey(), sig, keccak(b'bye')))
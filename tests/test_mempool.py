@@ -0,0 +1,53 @@
+from tendermint.mempool import Mempool
+
+def test_mempool():
+    pool = Mempool()
+    pool.add(b'one', 'tx1')
+    pool.add(b'two', 'tx2')
+    assert(2 == len(pool))
+    assert(b'one' in pool)
+    assert(not pool.is_recheck(b'one'))
+    assert(None == pool.recheck(b'one'))
+
+    # 'one' made it into the block
+    assert('tx1' == pool.take(b'one'))
+    assert(None == pool.take(b'one'))
+
+    pool.commit()
+    assert(0 == len(pool))
+    assert(not pool.is_recheck(b'one'))
+    assert(pool.is_recheck(b'two'))
+    assert('tx2' == pool.recheck(b'two'))
+    assert(not pool.is_recheck(b'two'))
+
+    # Not accepted again, so dropped on the next commit
+    pool.add(b'three', 'tx3')
+    pool.commit()
+    assert(pool.is_recheck(b'three'))
+    assert(not pool.is_recheck(b'two'))
+
+def test_pending_per_sender():
+    class Tx(object):
+        def __init__(self, sender):
+            self.sender = sender
+
+    pool = Mempool()
+    pool.add(b'a1', Tx(b'a'))
+    pool.add(b'a2', Tx(b'a'))
+    pool.add(b'a2', Tx(b'a'))
+    pool.add(b'b1', Tx(b'b'))
+    assert(2 == pool.pending_from(b'a'))
+    assert(set([b'a', b'b']) == pool.senders())
+
+    pool.take(b'b1')
+    assert(0 == pool.pending_from(b'b'))
+    assert(set([b'a']) == pool.senders())
+
+    # Still counted while waiting to be rechecked
+    pool.commit()
+    assert(2 == pool.pending_from(b'a'))
+    pool.add(b'a1', pool.recheck(b'a1'))
+    assert(2 == pool.pending_from(b'a'))
+    # a2 wasn't rechecked, so it's gone
+    pool.commit()
+    assert(1 == pool.pending_from(b'a'))
@@ -0,0 +1,128 @@
+import pytest
+from abci.messages import to_request_deliver_tx, to_request_commit
+
+from tendermint import TendermintApp, Transaction
+from tendermint.metering import Metering, Meter, MeteredCache, Budget, BudgetExceeded
+from tendermint.keys import Key
+from tendermint.accounts import Account
+from tendermint.state import State, StateCache
+
+bob = Key.generate()
+
+def cache_with_bob():
+    cache = StateCache(State.load_state()[0])
+    cache.update_account(Account.create_account(bob.publickey(), balance=100))
+    cache.put_data(b'name', b'bob')
+    return cache
+
+def test_metered_cache():
+    cache = cache_with_bob()
+    metered = MeteredCache(cache, Meter())
+    assert(b'bob' == metered.get_data(b'name'))
+    assert(b'' == metered.get_data(b'missing'))
+    metered.put_data(b'name', b'robert')
+    assert(b'robert' == metered.get_data(b'name'))
+
+    acct = metered.get_account(bob.address())
+    acct.balance -= 10
+    metered.update_account(acct)
+    metered.increment_nonce(bob.address())
+
+    used = metered.meter.used
+    assert(5 == used['reads'] and 3 == used['writes'])
+    assert(len(b'bob') + len(b'robert') + 2 * len(acct.encode()) == used['read_bytes'])
+
+    # Nothing changes underneath until it's applied
+    assert(b'bob' == cache.get_data(b'name'))
+    assert(100 == cache.get_account(bob.address()).balance)
+    metered.apply()
+    assert(b'robert' == cache.get_data(b'name'))
+    assert((1, 90) == (cache.get_account(bob.address()).nonce, cache.get_account(bob.address()).balance))
+
+def test_budgets():
+    def writer(count):
+        def handler(tx, db):
+            for i in range(count):
+                db.put_data('key-{}'.format(i).encode(), b'x')
+            return True
+        return handler
+
+    metering = Metering(tx_budget=Budget(writes=5), block_budget=Budget(writes=8))
+    cache = cache_with_bob()
+    tx = Transaction(call=b'write')
+
+    with pytest.raises(BudgetExceeded) as err:
+        metering.run(writer(6), tx, cache)
+    assert('tx budget' in str(err.value))
+    assert(b'' == cache.get_data(b'key-0'))
+
+    # The failed tx's work still counts against the block
+    assert(6 == metering.block_used['writes'])
+    with pytest.raises(BudgetExceeded) as err:
+        metering.run(writer(3), tx, cache)
+    assert('block budget' in str(err.value))
+    assert(2 == metering.exceeded and 2 == metering.txs)
+
+    metering.new_block()
+    assert(metering.run(writer(5), tx, cache))
+    assert(b'x' == cache.get_data(b'key-4'))
+    assert('write' == metering.slowest[1].decode())
+
+def test_caught_budget_still_fails():
+    def swallow(tx, db):
+        db.put_data(b'first', b'x')
+        try:
+            db.put_data(b'second', b'x')
+        except BudgetExceeded:
+            pass
+        return True
+
+    metering = Metering(tx_budget=Budget(writes=1))
+    cache = cache_with_bob()
+    with pytest.raises(BudgetExceeded):
+        metering.run(swallow, Transaction(call=b'swallow'), cache)
+    assert(b'' == cache.get_data(b'first'))
+    assert(1 == metering.exceeded)
+
+    # Once over, every read or write fails too
+    meter = Meter({'writes': (0, 'tx')})
+    with pytest.raises(BudgetExceeded):
+        meter.write(1)
+    with pytest.raises(BudgetExceeded):
+        meter.read(1)
+
+def test_deliver_tx_budget():
+    app = TendermintApp("")
+    app.metering = Metering(tx_budget=Budget(writes=2))
+
+    @app.on_initialize()
+    def create_accts(db):
+        db.update_account(Account.create_account(bob.publickey(), balance=100))
+
+    @app.on_transaction('spend')
+    def spend(tx, db):
+        acct = db.get_account(tx.sender)
+        acct.balance -= 10
+        db.update_account(acct)
+        for i in range(tx.value):
+            db.put_data('key-{}'.format(i).encode(), b'x')
+        return True
+
+    app.mock_run()
+
+    def signed(nonce, writes):
+        t = Transaction()
+        t.nonce = nonce
+        t.value = writes
+        t.call = 'spend'
+        return t.sign(bob).encode()
+
+    assert(0 == app.deliver_tx(to_request_deliver_tx(signed(0, 1))).code)
+    resp = app.deliver_tx(to_request_deliver_tx(signed(1, 2)))
+    assert(resp.code != 0 and 'budget exceeded' in resp.log)
+    app.commit(to_request_commit())
+
+    state = app._storage.state
+    assert(90 == state.get_account(bob.address()).balance)
+    assert(b'x' == state.get_storage(b'key-0'))
+    assert(b'' == state.get_storage(b'key-1'))
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from tendermint.multiclient import MultiRpcClient
+
+def test_reads_go_to_the_fastest(make_rpc_server):
+    slow = make_rpc_server()
+    fast = make_rpc_server()
+    slow.delay = 0.05
+
+    rpc = MultiRpcClient(
+        ['127.0.0.1:{}'.format(slow.port), ('127.0.0.1', fast.port)], probe_interval=None)
+    rpc.probe()
+    del slow.calls[:]
+    del fast.calls[:]
+
+    for _ in range(5):
+        rpc.status()
+    assert(5 == len(fast.calls))
+    assert(0 == len(slow.calls))
+
+    metrics = rpc.metrics()['127.0.0.1:{}'.format(slow.port)]
+    assert(metrics['healthy'])
+    assert(metrics['latency_ms'] >= 50)
+    assert(1 == metrics['requests'])
+
+    # An error from the node is an answer, not a reason to fail over
+    with pytest.raises(ValueError):
+        rpc.call('nope', [])
+    assert(0 == len(slow.calls))
+
+def test_failover(make_rpc_server):
+    first = make_rpc_server()
+    second = make_rpc_server()
+    second.delay = 0.02
+    rpc = MultiRpcClient(['127.0.0.1:{}'.format(s.port) for s in (first, second)],
+                         probe_interval=None)
+    rpc.probe()
+
+    first.down = True
+    assert('stub' == rpc.status()['node_info']['moniker'])
+    name = '127.0.0.1:{}'.format(first.port)
+    assert(not rpc.metrics()[name]['healthy'])
+    assert(1 == rpc.metrics()[name]['errors'])
+
+    # Comes back once a probe gets through
+    first.down = False
+    rpc.probe()
+    assert(rpc.metrics()[name]['healthy'])
+
+def test_error_page_fails_over(make_rpc_server):
+    first = make_rpc_server()
+    second = make_rpc_server()
+    second.delay = 0.02
+    rpc = MultiRpcClient(['127.0.0.1:{}'.format(s.port) for s in (first, second)],
+                         probe_interval=None)
+    rpc.probe()
+
+    first.error_page = b'<html><body>502 Bad Gateway</body></html>'
+    assert('stub' == rpc.status()['node_info']['moniker'])
+    name = '127.0.0.1:{}'.format(first.port)
+    assert(not rpc.metrics()[name]['healthy'])
+    assert('JSON' in rpc.metrics()[name]['last_error'])
+
+    # An error from the node itself is still its answer
+    first.error_page = None
+    rpc.probe()
+    with pytest.raises(ValueError):
+        rpc.call('nope', [])
+    assert(rpc.metrics()[name]['healthy'])
+
+def test_broadcast_backoff(make_rpc_server):
+    node = make_rpc_server()
+    node.methods['broadcast_tx_sync'] = lambda tx: {'code': 0}
+    node.down = True
+    rpc = MultiRpcClient(['127.0.0.1:{}'.format(node.port)], probe_interval=None,
+                         retries=3, backoff=0.05)
+
+    start = time.perf_counter()
+    with pytest.raises(IOError):
+        rpc.send_tx_sync(b'tx')
+    # Waited 0.05 then 0.1
+    assert(time.perf_counter() - start >= 0.15)
+    assert(3 == rpc.metrics()['127.0.0.1:{}'.format(node.port)]['failures'])
+
+    node.down = False
+    assert({'code': 0} == rpc.send_tx_sync(b'tx'))
+
+def test_background_probes(make_rpc_server):
+    nodes = [make_rpc_server(), make_rpc_server()]
+    rpc = MultiRpcClient(['127.0.0.1:{}'.format(n.port) for n in nodes], probe_interval=0.01)
+    time.sleep(0.2)
+    rpc.close()
+    for metrics in rpc.metrics().values():
+        assert(metrics['requests'] > 1)
+        assert(1 == metrics['height'])
@@ -0,0 +1,105 @@
+import base64
+import asyncio
+import threading
+
+from tendermint.keys import Key
+from tendermint.client import RpcClient
+from tendermint.aioclient import AsyncRpcClient
+from tendermint.nonces import NonceManager, is_bad_nonce
+from tendermint.transactions import Transaction
+from tendermint.utils import from_hex, int_to_big_endian
+
+bob = Key.generate()
+
+def node(rpc_server, nonces):
+    """ Play the app's nonce check on the stub server """
+    def query(path, data, proof):
+        nonce = int_to_big_endian(nonces.get(from_hex('0x' + data), 0))
+        return {'response': {'code': 0, 'value': base64.b64encode(nonce).decode('utf-8')}}
+
+    lock = threading.Lock()
+    def check(raw):
+        tx = Transaction.decode(base64.b64decode(raw))
+        with lock:
+            if tx.nonce != nonces.get(tx.sender, 0):
+                return {'code': 1, 'log': 'Bad nonce'}
+            nonces[tx.sender] = tx.nonce + 1
+        return {'code': 0, 'log': ''}
+
+    rpc_server.methods['abci_query'] = query
+    rpc_server.methods['broadcast_tx_sync'] = check
+
+def payout():
+    t = Transaction()
+    t.to = bob.address()
+    t.call = 'payout'
+    return t
+
+def test_one_query_per_account(rpc_server):
+    senders = [Key.generate() for _ in range(4)]
+    node(rpc_server, {senders[0].address(): 7})
+    nonces = NonceManager(RpcClient(port=rpc_server.port))
+
+    results = []
+    def send_from(key):
+        for _ in range(25):
+            results.append(nonces.send(payout(), key))
+    threads = [threading.Thread(target=send_from, args=(key,)) for key in senders]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert(100 == len(results))
+    assert(all(0 == r['code'] for r in results))
+    assert(4 == rpc_server.calls.count('abci_query'))
+    assert(32 == nonces.next(senders[0].address()))
+    assert(25 == nonces.next(senders[1].address()))
+
+def test_nonces_are_handed_out_once(rpc_server):
+    node(rpc_server, {})
+    nonces = NonceManager(RpcClient(port=rpc_server.port))
+
+    taken = []
+    def take():
+        for _ in range(250):
+            taken.append(nonces.next(bob.address()))
+    threads = [threading.Thread(target=take) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert(list(range(1000)) == sorted(taken))
+
+def test_resync_on_bad_nonce(rpc_server):
+    remote = {}
+    node(rpc_server, remote)
+    nonces = NonceManager(RpcClient(port=rpc_server.port))
+    assert(0 == nonces.send(payout(), bob)['code'])
+
+    # Someone else sent from the same account
+    remote[bob.address()] = 5
+    assert(0 == nonces.send(payout(), bob)['code'])
+    assert(1 == nonces.resyncs)
+    assert(2 == rpc_server.calls.count('abci_query'))
+    assert(6 == remote[bob.address()])
+
+    nonces.set(bob.address(), 100)
+    result = nonces.send(payout(), bob, retries=0)
+    assert(is_bad_nonce(result))
+    assert(not is_bad_nonce({'check_tx': {'code': 0}, 'deliver_tx': {}}))
+
+def test_async(rpc_server):
+    node(rpc_server, {bob.address(): 3})
+
+    async def take():
+        async with AsyncRpcClient(port=rpc_server.port) as rpc:
+            nonces = NonceManager(rpc)
+            return await asyncio.gather(*[nonces.next_async(bob.address()) for _ in range(10)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert(list(range(3, 13)) == sorted(loop.run_until_complete(take())))
+    finally:
+        loop.close()
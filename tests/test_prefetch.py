@@ -0,0 +1,140 @@
+import os
+import sqlite3
+
+from abci.messages import to_request_check_tx, to_request_deliver_tx, to_request_commit
+
+from tendermint import TendermintApp, Transaction
+from tendermint.prefetch import Prefetcher
+from tendermint.keys import Key
+from tendermint.accounts import Account
+from tendermint.state import State, Storage
+from tendermint.utils import home_dir, int_to_big_endian, big_endian_to_int
+
+def clean(dbfile):
+    for path in (dbfile, dbfile + '.blocks'):
+        if os.path.exists(path):
+            os.remove(path)
+
+class CountingConnection(object):
+    def __init__(self, conn):
+        self.conn = conn
+        self.queries = 0
+
+    def execute(self, sql, args):
+        self.queries += 1
+        return self.conn.execute(sql, args)
+
+    def close(self):
+        self.conn.close()
+
+def filled_state(dbfile, journal=False):
+    clean(dbfile)
+    state, _ = State.load_state(dbfile, journal=journal)
+    storage = Storage(state)
+    for i in range(1000):
+        storage.confirmed.put_data('key-{}'.format(i).encode(), 'value-{}'.format(i).encode())
+    storage.commit()
+    return state
+
+def test_batched_lookup():
+    dbfile = home_dir('temp', 'prefetch.vdb')
+    state = filled_state(dbfile)
+    prefetcher = Prefetcher(state)
+    prefetcher._conn = CountingConnection(sqlite3.connect(dbfile, check_same_thread=False))
+
+    keys = ['key-{}'.format(i).encode() for i in range(0, 1000, 5)] + [b'missing']
+    prefetcher.hint(keys)
+    prefetcher.wait()
+    # One query per level of the trie, not per key
+    assert(prefetcher._conn.queries <= 6)
+    assert(len(keys) == prefetcher.prefetched)
+
+    root = state.storage.root_hash
+    assert(b'value-15' == prefetcher.get(root, b'key-15'))
+    assert(b'' == prefetcher.get(root, b'missing'))
+    assert(None == prefetcher.get(root, b'key-16'))
+    assert(None == prefetcher.get(b'\x01' * 32, b'key-15'))
+
+    # State reads use it
+    state.prefetcher = prefetcher
+    hits = prefetcher.hits
+    assert(b'value-15' == state.get_storage(b'key-15'))
+    assert(b'value-16' == state.get_storage(b'key-16'))
+    assert(hits + 1 == prefetcher.hits)
+
+    # Dropped once state moves on
+    state.put_storage(b'key-15', b'new')
+    assert(b'new' == state.get_storage(b'key-15'))
+    state.save()
+    assert(None == prefetcher.get(state.storage.root_hash, b'key-20'))
+    prefetcher.close()
+    state.close()
+    clean(dbfile)
+
+def test_unflushed_journal():
+    dbfile = home_dir('temp', 'prefetch_journal.vdb')
+    state = filled_state(dbfile, journal=True)
+    prefetcher = Prefetcher(state)
+    prefetcher.hint([b'key-1', b'key-999'])
+    prefetcher.wait()
+    assert(b'value-999' == prefetcher.get(state.storage.root_hash, b'key-999'))
+    prefetcher.close()
+    state.close()
+    clean(dbfile)
+
+def test_app_prefetch():
+    bob = Key.generate()
+    alice = Key.generate()
+    app = TendermintApp("")
+    app.prefetch = True
+
+    @app.on_initialize()
+    def create_accts(db):
+        db.update_account(Account.create_account(bob.publickey(), balance=100))
+        db.update_account(Account.create_account(alice.publickey()))
+        db.put_data(b'fee', int_to_big_endian(1))
+
+    def broken(tx):
+        raise ValueError("bad hint")
+
+    @app.on_transaction('transfer', keys=lambda tx: [b'fee'])
+    def transfer(tx, db):
+        fee = big_endian_to_int(db.get_data(b'fee'))
+        sender = db.get_account(tx.sender)
+        recipient = db.get_account(tx.to)
+        sender.balance -= tx.value + fee
+        recipient.balance += tx.value
+        db.update_account(sender)
+        db.update_account(recipient)
+        db.increment_nonce(tx.sender)
+        return True
+
+    @app.on_transaction('other', keys=broken)
+    def other(tx, db):
+        return True
+
+    app.mock_run()
+    prefetcher = app._storage.state.prefetcher
+
+    t = Transaction()
+    t.to = alice.address()
+    t.value = 10
+    t.call = 'transfer'
+    raw = t.sign(bob).encode()
+    assert(0 == app.check_tx(to_request_check_tx(raw)).code)
+    prefetcher.wait()
+    assert(3 == prefetcher.prefetched)
+
+    assert(0 == app.deliver_tx(to_request_deliver_tx(raw)).code)
+    assert(3 == prefetcher.hits)
+    app.commit(to_request_commit())
+    state = app._storage.state
+    assert(89 == state.get_account(bob.address()).balance)
+    assert(10 == state.get_account(alice.address()).balance)
+
+    # A failing hint doesn't fail the tx
+    t = Transaction()
+    t.nonce = 1
+    t.call = 'other'
+    assert(0 == app.check_tx(to_request_check_tx(t.sign(bob).encode())).code)
+    prefetcher.close()
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+from abci.messages import *
+
+from tendermint import TendermintApp, Transaction
+from tendermint.keys import Key
+from tendermint.accounts import Account
+from tendermint.recorder import read_recording, REQUEST, APPHASH
+from tendermint.utils import home_dir, int_to_big_endian
+
+bob = Key.generate()
+
+def create_app(step=1):
+    app = TendermintApp("")
+
+    @app.on_initialize()
+    def create_accts(db):
+        db.update_account(Account.create_account(bob.publickey()))
+
+    @app.on_transaction('counter')
+    def count(tx, db):
+        db.increment_nonce(tx.sender)
+        db.put_data(b'count', int_to_big_endian(tx.nonce + step))
+        return True
+
+    return app
+
+def test_record_and_replay():
+    recfile = home_dir('temp', 'test.rec')
+    if os.path.exists(recfile):
+        os.remove(recfile)
+
+    app = create_app()
+    app.mock_run()
+    app.record(recfile)
+
+    hashes = []
+    for nonce in range(3):
+        t = Transaction()
+        t.nonce = nonce
+        t.call = 'counter'
+        raw = t.sign(bob).encode()
+        bb = Request()
+        bb.begin_block.header.height = nonce + 1
+        app.begin_block(bb)
+        app.check_tx(to_request_check_tx(raw))
+        app.deliver_tx(to_request_deliver_tx(raw))
+        hashes.append(app.commit(to_request_commit()).data)
+        app.query(to_request_query(path='/tx_nonce', data=bob.address()))
+    app._recorder.close()
+
+    frames = list(read_recording(recfile))
+    assert(3 == len([m for tag, m in frames if tag == APPHASH]))
+    assert(hashes == [m.data for tag, m in frames if tag == APPHASH])
+    assert('check_tx' == frames[1][1].WhichOneof("value"))
+
+    stats = create_app().replay(recfile)
+    assert(3 == stats['blocks'])
+    assert(3 == stats['requests']['deliver_tx'])
+    assert(3 == stats['requests']['query'])
+    assert(hashes[-1] == stats['last_app_hash'])
+
+    # A change in the app's logic shows up as a different app hash
+    with pytest.raises(ValueError):
+        create_app(step=2).replay(recfile)
+
+    os.remove(recfile)
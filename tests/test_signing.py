@@ -0,0 +1,52 @@
+import pytest
+
+from tendermint.keys import Key
+from tendermint.signing import sign_batch
+from tendermint.transactions import Transaction
+
+bob = Key.generate()
+alice = Key.generate()
+
+def payouts(count):
+    for i in range(count):
+        t = Transaction()
+        t.to = alice.address()
+        t.value = i
+        t.call = 'payout'
+        t.params = (i,)
+        yield t, (bob if i % 3 else alice)
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_sign_batch(processes):
+    nonces = {bob.address(): 10}
+    signed = list(sign_batch(payouts(40), nonces=nonces, processes=processes, chunksize=4))
+    assert(40 == len(signed))
+
+    expected = {bob.address(): 10, alice.address(): 0}
+    for i, raw in enumerate(signed):
+        tx = Transaction.decode(raw)
+        key = bob if i % 3 else alice
+        assert(i == tx.value)
+        assert(key.address() == tx.sender)
+        assert(expected[tx.sender] == tx.nonce)
+        assert(tx.verify(key.publickey()))
+        expected[tx.sender] += 1
+
+    assert(expected == nonces)
+
+    # Same bytes as signing them one at a time
+    t, key = next(payouts(1))
+    t.nonce = 7
+    assert([t.sign(key).encode()] == list(sign_batch([(t, key)], processes=processes)))
+
+def test_nonces_follow_what_was_yielded():
+    nonces = {}
+    batch = sign_batch(payouts(100), nonces=nonces, processes=2, chunksize=8)
+    for _ in range(5):
+        next(batch)
+    batch.close()
+    assert({alice.address(): 2, bob.address(): 3} == nonces)
+
+def test_needs_a_key():
+    with pytest.raises(Exception):
+        list(sign_batch([(Transaction(), 'notakey')], processes=1))
@@ -0,0 +1,166 @@
+import os
+import shutil
+
+import pytest
+from abci.messages import *
+
+from tendermint import TendermintApp, Transaction
+from tendermint.snapshot import Snapshot, SnapshotStore, write_snapshot, BLOCK_ENTRIES
+from tendermint.encoding import StateCodecs, Compression
+from tendermint.accounts import Account
+from tendermint.keys import Key
+from tendermint.state import State, Storage
+from tendermint.utils import home_dir, int_to_big_endian, big_endian_to_int
+
+def clean(*paths):
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+def test_write_and_read():
+    dbfile = home_dir('temp', 'snapshot.vdb')
+    path = home_dir('temp', 'snapshot.snap')
+    clean(dbfile, path)
+    bob = Key.generate()
+
+    state, _ = State.load_state(dbfile)
+    state.use_codecs(StateCodecs())
+    state.db.use_compression(Compression('zlib'))
+    storage = Storage(state)
+    # Enough keys for several index blocks
+    count = BLOCK_ENTRIES * 3 + 7
+    for i in range(count - 1):
+        storage.confirmed.put_data('doc:{}'.format(i).encode(), 'value-{}'.format(i).encode() * 5)
+    storage.confirmed.update_account(Account.create_account(bob.publickey(), balance=42))
+    state.chain_id = b'snap-chain'
+    state.last_block_height = 9
+    storage.commit()
+
+    assert(count == write_snapshot(state, path))
+    snap = Snapshot(path)
+    assert(count == len(snap))
+    assert((9, b'snap-chain') == (snap.height, snap.chain_id))
+    assert(state.storage.root_hash == snap.root_hash)
+    for i in range(count - 1):
+        assert('value-{}'.format(i).encode() * 5 == snap.get_data('doc:{}'.format(i).encode()))
+    assert(b'' == snap.get_data(b'missing'))
+    assert(None == snap.get(b'missing'))
+    assert(isinstance(snap.get(b'doc:1'), memoryview))
+    assert(42 == snap.get_account(bob.address()).balance)
+    assert(b'' == snap.get_account(Key.generate().address()))
+
+    with pytest.raises(TypeError):
+        snap.put_data(b'doc:1', b'x')
+    snap.close()
+    state.close()
+
+    # A partly written file isn't opened
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 100)
+    with pytest.raises(IOError):
+        Snapshot(path)
+    clean(dbfile, path)
+
+def test_empty_state():
+    path = home_dir('temp', 'snapshot_empty.snap')
+    state, _ = State.load_state()
+    assert(0 == write_snapshot(state, path))
+    snap = Snapshot(path)
+    assert(b'' == snap.get_data(b'anything'))
+    snap.close()
+    clean(path)
+
+def test_store():
+    directory = home_dir('temp', 'snapshots')
+    clean(directory)
+    store = SnapshotStore(directory, keep=2)
+    assert(None == store.latest())
+
+    state, _ = State.load_state()
+    for height in range(1, 5):
+        state.put_storage(b'height', int_to_big_endian(height))
+        state.last_block_height = height
+        assert(store.export(state))
+        store.wait()
+        assert(height == store.latest().height)
+        assert(height == big_endian_to_int(store.latest().get_data(b'height')))
+    assert([3, 4] == store.heights())
+    assert(4 == store.written)
+    store.close()
+
+    # Picks up the newest file on disk
+    store = SnapshotStore(directory)
+    assert(4 == store.latest().height)
+    store.close()
+
+    # Only of the state's chain, and not ahead of it
+    other, _ = State.load_state()
+    other.chain_id = b'other-chain'
+    other.last_block_height = 10
+    store = SnapshotStore(directory)
+    assert(None == store.latest(other))
+    store.close()
+    state.last_block_height = 3
+    store = SnapshotStore(directory)
+    assert(3 == store.latest(state).height)
+    assert(None == store.latest(other))
+
+    # Written after a rollback: what's above it goes
+    store.export(state)
+    store.wait()
+    assert(3 == store.latest(state).height)
+    assert([3] == store.heights())
+    store.close()
+    clean(directory)
+
+    with pytest.raises(ValueError):
+        SnapshotStore(directory, keep=0)
+
+def test_app_queries_from_snapshots():
+    directory = home_dir('temp', 'app_snapshots')
+    dbfile = home_dir('temp', 'app_snapshots.vdb')
+    clean(directory, dbfile)
+    bob = Key.generate()
+    app = TendermintApp("")
+    app.snapshot_dir = directory
+    app.snapshot_interval = 2
+
+    @app.on_initialize()
+    def create_accts(db):
+        db.update_account(Account.create_account(bob.publickey()))
+        db.put_data(b'count', int_to_big_endian(0))
+
+    @app.on_transaction('counter')
+    def counter(tx, db):
+        count = big_endian_to_int(db.get_data(b'count'))
+        db.put_data(b'count', int_to_big_endian(count + 1))
+        return True
+
+    @app.on_query('/count')
+    def get_count(key, db):
+        return db.get_data(key)
+
+    app.mock_run(dbfile)
+    query = to_request_query(path='/count', data=b'count')
+    for nonce in range(3):
+        t = Transaction()
+        t.nonce = nonce
+        t.call = 'counter'
+        raw = t.sign(bob).encode()
+        bb = Request()
+        bb.begin_block.header.height = nonce + 1
+        app.begin_block(bb)
+        app.check_tx(to_request_check_tx(raw))
+        app.deliver_tx(to_request_deliver_tx(raw))
+        app.commit(to_request_commit())
+        app._snapshots.wait()
+
+    # Written at height 2, so a block behind
+    assert(1 == app._snapshots.written)
+    assert(2 == big_endian_to_int(app.query(query).value))
+    assert(3 == big_endian_to_int(app._storage.confirmed.get_data(b'count')))
+    app._snapshots.close()
+    app._storage.state.close()
+    clean(directory, dbfile)
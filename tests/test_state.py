@@ -151,3 +151,48 @@ def test_storage():
 
     if os.path.exists(dbfile):
         os.remove(dbfile)
+
+def test_cache_memory_ceiling():
+    from tendermint.state import cachedValue, ENTRY_BYTES
+
+    # Compact entries
+    assert(not hasattr(cachedValue(), '__dict__'))
+
+    st,_ = State.load_state('')
+    for i in range(100):
+        st.put_storage('key-{}'.format(i).encode(), b'v' * 100)
+    bob = Key.generate()
+    st.update_account(Account.create_account(bob.publickey()))
+
+    entry = ENTRY_BYTES + len(b'key-10') + 100
+    cache = StateCache(st, max_bytes=10 * entry)
+    cache.get_account(bob.address())
+    for i in range(10, 30):
+        assert(b'v' * 100 == cache.get_data('key-{}'.format(i).encode()))
+    usage = cache.memory()
+    assert(usage['bytes'] <= 10 * entry)
+    assert(usage['evictions'] > 10)
+    # Oldest first, the account went too
+    assert(bob.address() not in cache.account_cache)
+    assert(bob.address() not in cache.account_nonces)
+    assert(b'key-29' in cache.storage_cache)
+
+    # Changed entries stay until commit, even over the limit
+    for i in range(30, 50):
+        cache.put_data('key-{}'.format(i).encode(), b'new' * 40)
+    usage = cache.memory()
+    assert(usage['bytes'] > 10 * entry)
+    assert(20 == usage['dirty_entries'] == usage['data_entries'])
+    cache.commit()
+    assert(b'new' * 40 == st.get_storage(b'key-45'))
+
+    # Replacing an entry doesn't count it twice
+    plain = StateCache(st)
+    plain.put_data(b'key-1', b'a')
+    plain.put_data(b'key-1', b'b')
+    assert(ENTRY_BYTES + len(b'key-1') + 1 == plain.memory()['bytes'])
+
+    storage = Storage(st, max_cache_bytes=1000)
+    assert(1000 == storage.memory()['unconfirmed']['max_bytes'])
+    storage.commit()
+    assert(1000 == storage.confirmed.max_bytes == storage.unconfirmed.max_bytes)
@@ -2,9 +2,9 @@ import pytest
 import rlp
 from rlp.sedes import big_endian_int, binary
 
-from tendermint.transactions import Transaction
+from tendermint.transactions import Transaction, SIG_COMBINED, SIG_DETACHED
 from tendermint.keys import Key
-from tendermint.utils import to_hex, from_hex, is_hex
+from tendermint.utils import to_hex, from_hex, is_hex, keccak
 
 class ExObj(rlp.Serializable):
     fields = [
@@ -39,7 +39,7 @@ def test_transactions():
     assert(b'CREATE' == tback.call)
     assert(bob.address() == tback.sender)
     assert(alice.address() == tback.to)
-    assert(Key.verify(bob.publickey(), tback.signature))
+    assert(tback.verify(bob.publickey()))
 
     # decode params and check
     pback = tback.decode_params(ExObj)
@@ -68,9 +68,9 @@ def test_ok_with_no_params():
     assert(bob.address() == tback.sender)
     assert(alice.address() == tback.to)
 
-    assert(Key.verify(bob.publickey(), tback.signature))
+    assert(tback.verify(bob.publickey()))
     # Just for the heck of it...
-    assert(Key.verify(alice.publickey(), tback.signature) == False)
+    assert(tback.verify(alice.publickey()) == False)
 
     # Try to decode_params even through there's none
     pback = tback.decode_params(ExObj)
@@ -117,3 +117,104 @@ def test_tx():
     t2back = Transaction.decode(raw2)
     p = t2back.decode_params()
     assert(p == [b'hello',b'\x01'])
+
+def test_encoding_is_memoized():
+    bob = Key.generate()
+    t = Transaction()
+    t.nonce = 3
+    t.call = 'CREATE'
+    t.params = ExObj(1, 2, 'dave')
+    raw = t.sign(bob).encode()
+
+    # No side effects, encoding twice gives the same bytes
+    assert(isinstance(t.params, ExObj))
+    assert(raw == t.encode())
+    assert(t.encode() is t.encode())
+
+    # Matches the generic rlp encoding
+    expected = Transaction(t.sender, t.to, 3, 0, b'CREATE', t.signature,
+                           rlp.encode(t.params))
+    assert(raw == rlp.encode(expected, sedes=Transaction))
+
+    assert(keccak(raw) == t.hash)
+    assert(t.hash is t.hash)
+
+    # The signature is over the signing hash
+    assert(Key.verify_detached(bob.publickey(), t.signature, t.signing_hash))
+
+    # Decoding keeps the wire bytes, hashes match the original
+    tback = Transaction.decode(raw)
+    assert(tback.encode() is tback.encode())
+    assert(raw == tback.encode())
+    assert(t.hash == tback.hash)
+    assert(t.signing_hash == tback.signing_hash)
+    assert(b'dave' == tback.decode_params(ExObj).title)
+
+    # Changing a field invalidates
+    h, sh = t.hash, t.signing_hash
+    t.signature = b''
+    assert(h != t.hash)
+    assert(sh == t.signing_hash)
+    t.nonce = 4
+    assert(sh != t.signing_hash)
+    assert(raw != t.encode())
+
+def test_signature_versions():
+    bob = Key.generate()
+    alice = Key.generate()
+
+    t = Transaction()
+    t.to = alice.address()
+    t.nonce = 1
+    assert(None == t.signature_version)
+    assert(not t.verify(bob.publickey()))
+
+    # Detached is the default
+    raw = t.sign(bob).encode()
+    tback = Transaction.decode(raw)
+    assert(64 == len(tback.signature))
+    assert(SIG_DETACHED == tback.signature_version)
+    assert(tback.verify(bob.publickey()))
+    assert(tback.verify(bob.publickey(tohex=True)))
+    assert(not tback.verify(alice.publickey()))
+
+    # Still verifies the older combined format
+    legacy = Transaction.decode(Transaction(to=alice.address(), nonce=1).sign(bob, detached=False).encode())
+    assert(96 == len(legacy.signature))
+    assert(SIG_COMBINED == legacy.signature_version)
+    assert(legacy.verify(bob.publickey()))
+    assert(len(raw) == len(legacy.encode()) - 32)
+
+    # Signature has to be over this tx
+    other = Transaction(t.sender, t.to, 2, 0, b'', tback.signature, b'')
+    assert(not other.verify(bob.publickey()))
+    other = Transaction(t.sender, t.to, 2, 0, b'', legacy.signature, b'')
+    assert(not other.verify(bob.publickey()))
+
+    # Garbage
+    other = Transaction(t.sender, t.to, 1, 0, b'', b'\x00' * 64, b'')
+    assert(not other.verify(bob.publickey()))
+    other = Transaction(t.sender, t.to, 1, 0, b'', tback.signature[:-1], b'')
+    assert(None == other.signature_version)
+    assert(not other.verify(bob.publickey()))
+
+def test_params_are_frozen_when_set():
+    bob = Key.generate()
+    params = [b'a', b'b']
+    t = Transaction()
+    t.call = 'CREATE'
+    t.params = params
+    # Changed in place, before and after the tx is encoded
+    params.append(b'c')
+    raw = t.sign(bob).encode()
+    params.append(b'd')
+    assert(raw == t.encode())
+    assert([b'a', b'b'] == t.decode_params())
+    assert(t.verify(bob.publickey()))
+    assert([b'a', b'b'] == Transaction.decode(raw).decode_params())
+
+    # Setting it again is what changes the tx
+    t.params = params
+    assert(raw != t.encode())
+    assert([b'a', b'b', b'c', b'd'] == t.decode_params())
+    assert(not t.verify(bob.publickey()))
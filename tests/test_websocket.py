@@ -0,0 +1,51 @@
+import asyncio
+
+from tendermint import websocket
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+def test_frames():
+    async def roundtrip(payload, mask):
+        reader = asyncio.StreamReader()
+        reader.feed_data(websocket.encode_frame(websocket.TEXT, payload, mask))
+        return await websocket.read_frame(reader)
+
+    for size in (0, 1, 125, 126, 65535, 65536, 70000):
+        payload = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+        for mask in (True, False):
+            assert((True, websocket.TEXT, payload) == run(roundtrip(payload, mask)))
+
+    assert('s3pPLMBiTxaQ9kYGzzhZRbK+xOo=' == websocket.accept_key('dGhlIHNhbXBsZSBub25jZQ=='))
+
+def test_connect_ping_and_fragments(accept_websocket):
+    async def serve(reader, writer):
+        ws = await accept_websocket(reader, writer)
+        writer.write(websocket.encode_frame(websocket.PING, b'hi', mask=False))
+        # 'hello' in two frames
+        writer.write(bytes([websocket.TEXT, 3]) + b'hel')
+        writer.write(bytes([0x80 | websocket.CONTINUATION, 2]) + b'lo')
+        # A binary message in two frames stays bytes
+        writer.write(bytes([websocket.BINARY, 2]) + b'\xff\xfe')
+        writer.write(bytes([0x80 | websocket.CONTINUATION, 1]) + b'\x00')
+        echo = await ws.recv()
+        await ws.send(echo.upper())
+        ws.close()
+
+    async def client():
+        server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        ws = await websocket.connect('127.0.0.1', port, '/websocket')
+        first = await ws.recv()
+        binary = await ws.recv()
+        await ws.send('echo')
+        second = await ws.recv()
+        ws.close()
+        server.close()
+        return first, binary, second
+
+    assert(('hello', b'\xff\xfe\x00', 'ECHO') == run(client()))